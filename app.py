@@ -1,12 +1,42 @@
 from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Response, abort, jsonify, stream_template, stream_with_context
+from flask import g, has_request_context, before_render_template, template_rendered
 from sqlalchemy import text 
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, time, timedelta
+import click
 from sqlalchemy import or_
 from sqlalchemy import func
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import bindparam
+from sqlalchemy import case
+from sqlalchemy import literal_column
+from sqlalchemy import type_coerce
+from sqlalchemy.exc import OperationalError
 import sys
 import os
 import re
+import csv
+import io
+import json
+import threading
+from collections import namedtuple
+from time import perf_counter
+import cProfile
+
+import migrations
+from migrations import SEARCH_INDEX_DDL, SEARCH_INDEX_REBUILD
+import fields
+from page_cache import PageCache
+from metrics import COUNT_BUCKETS, Metrics
+from typeahead import PrefixIndex
+import backup
+import assets
+import sync
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key_123'
@@ -18,128 +48,1273 @@ if getattr(sys, 'frozen', False):
 else:
     application_path = os.path.dirname(os.path.abspath(__file__))
 
-db_path = os.path.join(application_path, 'tailor.db')
+# TAILOR_DB_PATH lets tests and tools point the app at another database file
+db_path = os.environ.get('TAILOR_DB_PATH') or os.path.join(application_path, 'tailor.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 
+# Rows per page on the customer list, ledger and customer statements
+app.config['CUSTOMERS_PER_PAGE'] = 50
+app.config['STATEMENT_PER_PAGE'] = 50
+# Most matches returned by a customer search
+app.config['SEARCH_RESULTS_LIMIT'] = 25
+# Rows per fetch/insert batch for bulk export and import
+app.config['TRANSFER_BATCH_SIZE'] = 1000
+# Customers fetched per query when batch printing
+app.config['PRINT_CHUNK_SIZE'] = 100
+# Customers moved per transaction when archiving
+app.config['ARCHIVE_BATCH_SIZE'] = 500
+# Rendered view/print pages kept in memory (least recently used are dropped)
+app.config['PAGE_CACHE_SIZE'] = 256
+# SQL statements slower than this many milliseconds are logged and listed on /stats/requests
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('TAILOR_SLOW_QUERY_MS', 100))
+# When set, a cProfile dump of every request is written to this directory
+app.config['PROFILE_DIR'] = os.environ.get('TAILOR_PROFILE_DIR')
+# Online snapshots: where they go, hours between them (0 = no scheduler) and how many / how old to keep
+app.config['BACKUP_DIR'] = os.environ.get('TAILOR_BACKUP_DIR') or os.path.join(application_path, 'backups')
+app.config['BACKUP_INTERVAL_HOURS'] = float(os.environ.get('TAILOR_BACKUP_INTERVAL_HOURS', 6))
+app.config['BACKUP_KEEP'] = 14
+app.config['BACKUP_MAX_AGE_DAYS'] = 30
+# Prefix of new customer IDs; shops that sync with each other need one each (AS, BS, ...)
+app.config['CUSTOMER_ID_PREFIX'] = os.environ.get('TAILOR_ID_PREFIX', 'AS')
+
+# --- CONCURRENCY PROFILE ---
+# PRAGMAs applied to every pooled connection. "concurrent" (the default) lets
+# the front counter and back office share tailor.db: WAL means readers never
+# wait for a writer, and busy_timeout makes a second writer wait its turn
+# instead of failing with "database is locked". Use "single" when tailor.db
+# sits on a network share, where WAL does not work.
+SQLITE_PROFILES = {
+    'concurrent': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 15000,     # ms
+        'synchronous': 'NORMAL',   # safe with WAL, far fewer fsyncs than FULL
+        'cache_size': -16000,      # negative = KiB, so 16 MB per connection
+        'mmap_size': 64 * 1024 * 1024,
+    },
+    'single': {
+        'journal_mode': 'DELETE',
+        'busy_timeout': 15000,
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 0,
+    },
+}
+app.config['SQLITE_PROFILE'] = os.environ.get('TAILOR_DB_PROFILE', 'concurrent')
+app.config['SQLITE_PRAGMAS'] = dict(SQLITE_PROFILES[app.config['SQLITE_PROFILE']])
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 8,
+    'max_overflow': 8,
+    'pool_timeout': 30,
+    'connect_args': {
+        'timeout': app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000,
+        # Pooled connections move between request threads
+        'check_same_thread': False,
+    },
+}
+
 db = SQLAlchemy(app)
+page_cache = PageCache(app.config['PAGE_CACHE_SIZE'])
+# Part of every ETag, so pages cached by the browser before a restart (and
+# possibly an upgrade) are fetched again
+BOOT_ID = format(int(datetime.now().timestamp()), 'x')
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+with app.app_context():
+    event.listen(db.engine, 'connect', apply_sqlite_pragmas)
+
+def describe_database_settings():
+    """ The settings actually in effect, read back from a pooled connection. """
+    with app.app_context():
+        with db.engine.connect() as conn:
+            settings = {name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                        for name in app.config['SQLITE_PRAGMAS']}
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        settings.update(profile=app.config['SQLITE_PROFILE'], pool=type(db.engine.pool).__name__,
+                        pool_size=options['pool_size'], max_overflow=options['max_overflow'])
+    return settings
+
+def print_database_settings():
+    settings = describe_database_settings()
+    print(f"🗄️  Database: {db_path}")
+    print("    " + ", ".join(f"{name}={value}" for name, value in settings.items()))
+    if app.config['SQLITE_PROFILE'] == 'concurrent' and str(settings['journal_mode']).lower() != 'wal':
+        print("⚠️  WAL could not be enabled (network drive?); set TAILOR_DB_PROFILE=single.")
+
+# --- STATIC ASSETS ---
+# Once `flask build-assets` has run, url_for('static', ...) in templates
+# points at the fingerprinted copy in static/dist (or an inlined data: URI),
+# and those copies are served with a one-year immutable Cache-Control.
+ASSET_MANIFEST_PATH = os.path.join(app.static_folder, assets.DIST_DIR, assets.MANIFEST_NAME)
+asset_manifest = assets.AssetManifest()
+asset_manifest.load(ASSET_MANIFEST_PATH)
+
+def asset_url_for(endpoint, **values):
+    if endpoint == 'static' and 'filename' in values:
+        target = asset_manifest.lookup(values['filename'])
+        if target and target.startswith('data:'):
+            return target
+        if target:
+            values['filename'] = target
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals['url_for'] = asset_url_for
+# Form fields and their labels, for the templates' field loops
+app.jinja_env.globals['fields'] = fields
+
+@app.after_request
+def cache_fingerprinted_assets(response):
+    if request.endpoint == 'static' and request.view_args.get('filename', '').startswith(f'{assets.DIST_DIR}/'):
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+# --- INSTRUMENTATION ---
+# Per-request wall time, SQL statement count/time and template render time,
+# served on /metrics (Prometheus text format) and /stats/requests (rolling
+# p50/p95 over the last requests plus the slow-query log). Time spent in
+# streamed responses (batch print, export) after the first byte is not counted.
+request_metrics = Metrics()
+request_metrics.histogram('tailor_request_seconds', 'Wall time per request, by endpoint.')
+request_metrics.counter('tailor_requests_total', 'Requests served, by endpoint and status.')
+request_metrics.histogram('tailor_request_sql_statements', 'SQL statements per request, by endpoint.',
+                          buckets=COUNT_BUCKETS)
+request_metrics.histogram('tailor_request_sql_seconds', 'Time in SQL per request, by endpoint.')
+request_metrics.histogram('tailor_template_render_seconds', 'Template render time, by template.')
+request_metrics.counter('tailor_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.')
+
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = perf_counter()
+
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - context._query_start
+    endpoint = None
+    if has_request_context() and 'request_stats' in g:
+        g.request_stats['sql_statements'] += 1
+        g.request_stats['sql_seconds'] += elapsed
+        endpoint = request.endpoint
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        request_metrics.inc('tailor_slow_queries_total')
+        request_metrics.record_slow_query(ms=round(elapsed * 1000, 1), endpoint=endpoint,
+                                          statement=' '.join(statement.split())[:500],
+                                          at=datetime.now().isoformat(timespec='seconds'))
+        app.logger.warning("Slow query (%.0f ms) in %s: %s", elapsed * 1000, endpoint, statement)
+
+with app.app_context():
+    event.listen(db.engine, 'before_cursor_execute', _before_sql)
+    event.listen(db.engine, 'after_cursor_execute', _after_sql)
+
+@before_render_template.connect_via(app)
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('template_starts', []).append(perf_counter())
+
+@template_rendered.connect_via(app)
+def _after_render(sender, template, context, **extra):
+    if has_request_context() and g.get('template_starts'):
+        request_metrics.observe('tailor_template_render_seconds', perf_counter() - g.template_starts.pop(),
+                                template=template.name)
+
+@app.before_request
+def start_request_timer():
+    g.request_stats = {'start': perf_counter(), 'sql_statements': 0, 'sql_seconds': 0.0}
+    if app.config['PROFILE_DIR'] and request.endpoint != 'static':
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # Another request thread is already being profiled
+            g.profiler = None
+
+@app.after_request
+def record_request_metrics(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    elapsed = perf_counter() - stats['start']
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.observe('tailor_request_seconds', elapsed, endpoint=endpoint)
+    request_metrics.inc('tailor_requests_total', endpoint=endpoint, status=response.status_code)
+    request_metrics.observe('tailor_request_sql_statements', stats['sql_statements'], endpoint=endpoint)
+    request_metrics.observe('tailor_request_sql_seconds', stats['sql_seconds'], endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def stop_profiler(exc):
+    # Teardown runs even when the view raised, so the thread is never left profiled
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    elapsed = perf_counter() - g.request_stats['start']
+    os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint or 'unmatched'}-{elapsed * 1000:.0f}ms.prof"
+    profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], name))
+
+def start_backup_scheduler():
+    """ Start periodic snapshots in the background (None when BACKUP_INTERVAL_HOURS is 0). """
+    hours = app.config['BACKUP_INTERVAL_HOURS']
+    if hours <= 0:
+        return None
+    print(f"💾 Backups every {hours:g}h to {app.config['BACKUP_DIR']}")
+    return backup.BackupScheduler(db_path, app.config['BACKUP_DIR'], hours * 3600,
+                                  keep=app.config['BACKUP_KEEP'],
+                                  max_age_days=app.config['BACKUP_MAX_AGE_DAYS']).start()
 
 # --- HELPER FUNCTIONS ---
-def generate_unique_id(prefix, model, column):
-    last_user = model.query.order_by(column.desc()).first()
-    if last_user:
-        last_id = getattr(last_user, column.name)
+def reserve_customer_ids(count=1, prefix=None):
+    """ Take `count` consecutive customer IDs (AS001, AS002, ...) from the id_sequence table.
+
+    The counter is bumped with one UPDATE inside the caller's transaction, which
+    holds SQLite's write lock until commit, so concurrent add_user posts (threads
+    or processes) can never receive the same ID. A rolled-back insert releases
+    its number again.
+    """
+    prefix = prefix or app.config['CUSTOMER_ID_PREFIX']
+    params = {'prefix': prefix, 'count': count, 'pattern': f"{prefix}[0-9]*"}
+    result = db.session.execute(
+        text('UPDATE id_sequence SET last_value = last_value + :count WHERE prefix = :prefix'), params)
+    if result.rowcount == 0:
+        # First ID for this prefix: continue after the highest numeric ID in use
+        db.session.execute(text(
+            'INSERT INTO id_sequence (prefix, last_value) '
+            'SELECT :prefix, coalesce(max(CAST(substr("userId", length(:prefix) + 1) AS INTEGER)), 0) + :count '
+            'FROM user WHERE "userId" GLOB :pattern'), params)
+    last_value = db.session.execute(
+        text('SELECT last_value FROM id_sequence WHERE prefix = :prefix'), params).scalar()
+    return [f"{prefix}{number:03d}" for number in range(last_value - count + 1, last_value + 1)]
+
+def next_customer_id(prefix=None):
+    return reserve_customer_ids(1, prefix)[0]
+
+def encode_cursor(row):
+    """ Cursor for keyset paging: the (date, id) of the last row on a page. """
+    return f"{row.date.isoformat()}_{row.id}"
+
+def decode_cursor(cursor):
+    try:
+        date_part, id_part = cursor.split('_')
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+def fetch_customer_page(columns, cursor=None):
+    """ Newest-first page of customers, loading only the given columns.
+
+    Pages follow the (date, id) index instead of using OFFSET, so every page
+    costs the same no matter how deep the list is scrolled.
+    Returns (rows, next_cursor).
+    """
+    per_page = app.config['CUSTOMERS_PER_PAGE']
+    query = User.query.with_entities(User.id, User.date, *columns)
+
+    position = decode_cursor(cursor)
+    if position:
+        query = query.filter(tuple_(User.date, User.id) < position)
+
+    # One extra row tells us whether there is a next page
+    rows = query.order_by(User.date.desc(), User.id.desc()).limit(per_page + 1).all()
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+def compute_ledger_totals():
+    """ Full-table sums, used to seed and verify the running totals. Archived customers still count. """
+    receivable, received, pending = db.session.execute(text(
+        'SELECT coalesce(sum(total_amount), 0), coalesce(sum(advance_payment), 0), coalesce(sum(price), 0) '
+        'FROM (SELECT total_amount, advance_payment, price FROM user '
+        'UNION ALL SELECT total_amount, advance_payment, price FROM user_archive)')).one()
+    return {'total_receivable': receivable, 'total_received': received, 'total_pending': pending}
+
+def adjust_ledger_totals(receivable=0, received=0, pending=0):
+    """ Apply a money change to the running totals inside the caller's transaction.
+
+    Call it after the customer change is staged; the caller commits both together.
+    """
+    result = db.session.execute(text(migrations.LEDGER_TOTALS_ADJUST),
+                                {'receivable': receivable, 'received': received, 'pending': pending})
+    if result.rowcount == 0:
+        # No totals row yet: seed it from the table, which already holds this change
+        db.session.flush()
+        db.session.add(LedgerTotals(id=1, **compute_ledger_totals()))
+
+def adjust_daily_rollup(day, suits=0, billed=0, received=0, pending=0):
+    """ Add a change to one day's rollup row inside the caller's transaction.
+
+    Journal entries count on the day they are posted and the rest of a customer
+    on their booking day (see booking_share). Summed over all days the rollup
+    matches the ledger totals.
+    """
+    db.session.execute(text(migrations.DAILY_ROLLUP_ADJUST),
+                       {'day': day.isoformat(), 'suits': suits, 'billed': billed, 'received': received,
+                        'pending': pending})
+
+def rollup_report(date_from, date_to, period='month'):
+    """ Rows of (period, suits, billed, received, pending change, pending balance) from the rollup. """
+    label = func.strftime('%Y-%m', DailyRollup.day) if period == 'month' else DailyRollup.day
+    rows = db.session.query(label.label('period'),
+                            func.sum(DailyRollup.suits_booked), func.sum(DailyRollup.billed),
+                            func.sum(DailyRollup.received), func.sum(DailyRollup.pending)) \
+        .filter(DailyRollup.day.between(date_from, date_to)) \
+        .group_by('period').order_by('period').all()
+    # Pending carried in from before the range, so each row can show the running balance
+    balance = db.session.query(func.coalesce(func.sum(DailyRollup.pending), 0)) \
+        .filter(DailyRollup.day < date_from).scalar()
+    report = []
+    for period_label, suits, billed, received, pending in rows:
+        balance += pending
+        report.append((period_label, suits, billed, received, pending, balance))
+    return report
+
+# --- RECEIVABLES AGING ---
+# `price` is what a customer still owes. Debtors are bucketed by how long
+# since their account last moved (user.last_activity: the latest booking,
+# debt or payment - edits do not count); every query here filters on the
+# literal `price > 0` so SQLite reads them from the partial ix_user_debtors
+# index instead of scanning all customers.
+
+# (label, oldest activity in days) - the last bucket takes everything older
+AGING_BUCKETS = [('0-30', 30), ('31-90', 90), ('90+', None)]
+
+def _owes():
+    return User.price > literal_column('0')
+
+def _last_activity():
+    return type_coerce(func.coalesce(User.last_activity, User.date), db.Date)
+
+def _aging_bucket(today):
+    """ SQL CASE giving each debtor's index in AGING_BUCKETS. """
+    return case(*[(_last_activity() >= today - timedelta(days=days), index)
+                  for index, (_, days) in enumerate(AGING_BUCKETS) if days is not None],
+                else_=len(AGING_BUCKETS) - 1)
+
+def aging_report(today, top=10):
+    """ ([(bucket, customers, amount) for each bucket], top debtors by amount). """
+    bucket = _aging_bucket(today).label('bucket')
+    counts = {index: (customers, amount) for index, customers, amount in db.session.query(
+        bucket, func.count(), func.sum(User.price)).filter(_owes()).group_by(bucket)}
+    buckets = [(label, *counts.get(index, (0, 0))) for index, (label, _) in enumerate(AGING_BUCKETS)]
+    return buckets, list(iter_debtors(today, limit=top))
+
+Debtor = namedtuple('Debtor', 'userId userName phone price last_activity days')
+
+def iter_debtors(today, bucket=None, limit=None):
+    """ Debtors, largest balance first, optionally from one AGING_BUCKETS label only.
+
+    With a limit this is a single top-N query; otherwise the list is walked
+    PRINT_CHUNK_SIZE at a time along the partial index.
+    """
+    query = db.session.query(User.userId, User.userName, User.phone, User.price,
+                             _last_activity().label('last_activity'), User.id).filter(_owes())
+    if bucket is not None:
+        query = query.filter(_aging_bucket(today) == [label for label, _ in AGING_BUCKETS].index(bucket))
+    largest_first = (User.price.desc(), User.id.desc())
+    position = None
+    while True:
+        page = query
+        if position:
+            page = page.filter(tuple_(User.price, User.id) < position)
+        rows = page.order_by(*largest_first).limit(limit or app.config['PRINT_CHUNK_SIZE']).all()
+        for row in rows:
+            yield Debtor(row.userId, row.userName, row.phone, row.price, row.last_activity,
+                         (today - row.last_activity).days)
+        if limit or len(rows) < app.config['PRINT_CHUNK_SIZE']:
+            return
+        position = (rows[-1].price, rows[-1].id)
+
+def journal_posting(entry_type, amount):
+    """ What one journal entry adds to its day's rollup row. """
+    if entry_type == 'add_debt':
+        return {'billed': amount, 'pending': amount}
+    return {'received': amount, 'pending': -amount}
+
+def journal_sums(customer_id):
+    """ (amount added as remaining, amount paid) over a customer's journal. """
+    return db.session.query(
+        func.coalesce(func.sum(case((LedgerEntry.entry_type == 'add_debt', LedgerEntry.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((LedgerEntry.entry_type == 'payment', LedgerEntry.amount), else_=0)), 0)) \
+        .filter(LedgerEntry.customer_id == customer_id).one()
+
+def booking_share(customer, journal):
+    """ The part of a customer's rollup that sits on their booking day: the
+    suits, and the amounts that did not come from a journal entry. """
+    debts, payments = journal
+    return {'suits': customer.numberOfSuit or 0,
+            'billed': (customer.total_amount or 0) - debts,
+            'received': (customer.advance_payment or 0) - payments,
+            'pending': (customer.price or 0) - debts + payments}
+
+def _reversed(share):
+    return {name: -value for name, value in share.items()}
+
+def apply_transaction(customer, transaction_type, amount):
+    """ Stage one add_debt/payment: a journal row plus an atomic balance update.
+
+    Balances change with a single UPDATE ... SET price = price + ? so two
+    counters posting at once cannot overwrite each other. The caller commits.
+    """
+    if transaction_type == 'add_debt':
+        changes = {'price': func.coalesce(User.price, 0) + amount,
+                   'total_amount': func.coalesce(User.total_amount, 0) + amount,
+                   # Adding remaining moves the customer's date to today
+                   'date': datetime.now().date()}
+        adjust_ledger_totals(receivable=amount, pending=amount)
+    else:
+        changes = {'price': func.coalesce(User.price, 0) - amount,
+                   'advance_payment': func.coalesce(User.advance_payment, 0) + amount}
+        adjust_ledger_totals(received=amount, pending=-amount)
+    # The booking stays on its order date; the transaction counts today
+    adjust_daily_rollup(datetime.now().date(), **journal_posting(transaction_type, amount))
+
+    changes.update(row_version=User.row_version + 1, updated_at=datetime.now(),
+                   last_activity=func.max(func.coalesce(User.last_activity, User.date), datetime.now().date()))
+    db.session.execute(update(User).where(User.id == customer.id).values(**changes),
+                       execution_options={'synchronize_session': False})
+    db.session.add(LedgerEntry(customer_id=customer.id, entry_type=transaction_type, amount=amount))
+    # Reload the new balances on next access
+    db.session.expire(customer)
+
+def get_ledger_totals():
+    totals = db.session.get(LedgerTotals, 1)
+    if totals is None:
+        totals = LedgerTotals(id=1, **compute_ledger_totals())
+        db.session.add(totals)
+        db.session.commit()
+    return totals
+
+def refresh_last_activity(customer_id):
+    """ Recompute a customer's last_activity after their booking date changed. """
+    db.session.execute(text(migrations.LAST_ACTIVITY_REFRESH + ' WHERE id = :id'), {'id': customer_id})
+
+def touch_customer(customer):
+    """ Mark a customer row as changed so cached view/print pages are re-rendered. """
+    customer.row_version = (customer.row_version or 0) + 1
+    customer.updated_at = datetime.now()
+
+def cached_customer_page(page, user_id, render):
+    """ Serve a customer page from page_cache, answering 304 when the browser is current.
+
+    `render(customer)` builds the HTML on a miss. Only the row's version is
+    read on a hit, so neither the customer nor their measurements are loaded for it.
+    """
+    lookup = User.query.with_entities(User.row_version, User.updated_at, User.date).filter_by(userId=user_id)
+    row = lookup.first()
+    if row is None:
+        find_customer_or_404(user_id)
+        row = lookup.one()
+    etag = f"{user_id}-{row.row_version}-{BOOT_ID}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = page_cache.get((page, user_id), row.row_version)
+        if body is None:
+            customer = User.query.filter_by(userId=user_id).one()
+            body = render(customer)
+            page_cache.put((page, user_id), customer.row_version, body)
+        response = Response(body, mimetype='text/html')
+
+    response.set_etag(etag)
+    response.last_modified = row.updated_at or datetime.combine(row.date, time())
+    # Browser may keep the page but must check with us before reusing it
+    response.cache_control.no_cache = True
+    return response
+
+def delete_customer_record(customer):
+    """ Stage a customer delete along with its journal and its share of the running totals. """
+    # Take each part back off the day it was counted on
+    booked_on = current_order(customer.id).order_date or customer.date
+    adjust_daily_rollup(booked_on, **_reversed(booking_share(customer, journal_sums(customer.id))))
+    posted_on = func.date(LedgerEntry.created_at)
+    for day, entry_type, amount in db.session.query(posted_on, LedgerEntry.entry_type, func.sum(LedgerEntry.amount)) \
+            .filter(LedgerEntry.customer_id == customer.id).group_by(posted_on, LedgerEntry.entry_type):
+        adjust_daily_rollup(datetime.strptime(day, '%Y-%m-%d').date(),
+                            **journal_posting(entry_type, -amount))
+    LedgerEntry.query.filter_by(customer_id=customer.id).delete()
+    CustomerOrder.query.filter_by(customer_id=customer.id).delete()
+    MeasurementSet.query.filter_by(customer_id=customer.id).delete()
+    page_cache.invalidate(customer.userId)
+    db.session.delete(customer)
+    adjust_ledger_totals(receivable=-(customer.total_amount or 0),
+                         received=-(customer.advance_payment or 0),
+                         pending=-(customer.price or 0))
+
+# --- ORDERS AND MEASUREMENTS ---
+# Bookings live in customer_order and measurements in measurement_set; the
+# form fields that fill them are declared in fields.py.
+
+MEASUREMENT_FIELDS = fields.names(fields.MEASUREMENTS)
+MEASUREMENT_NUMBERS = fields.names(fields.MEASUREMENTS, types=('measurement', 'count'))
+STYLE_FIELDS = fields.names(fields.MEASUREMENTS, types=('text', 'choices'))
+
+def measurement_card(current, values, unparsed):
+    """ MeasurementSet column values: `current` overlaid with parsed form values.
+
+    Fields not in `values` keep their current value, and a field given again
+    drops whatever unparsed text it had before.
+    """
+    card = {name: values.get(name, getattr(current, name)) for name in MEASUREMENT_FIELDS}
+    kept = {name: text for name, text in json.loads(current.unparsed or '{}').items() if name not in values}
+    kept.update(unparsed)
+    card['unparsed'] = json.dumps(kept, ensure_ascii=False) if kept else None
+    return card
+
+def current_measurements(customer_id):
+    """ The customer's newest measurement set (an empty one if they have none). """
+    return (MeasurementSet.query.filter_by(customer_id=customer_id).order_by(MeasurementSet.id.desc()).first()
+            or MeasurementSet())
+
+def latest_measurements(customer_ids):
+    """ {customer id: newest MeasurementSet} for many customers in one query. """
+    newest = (select(func.max(MeasurementSet.id)).where(MeasurementSet.customer_id.in_(customer_ids))
+              .group_by(MeasurementSet.customer_id))
+    return {measurements.customer_id: measurements
+            for measurements in MeasurementSet.query.filter(MeasurementSet.id.in_(newest))}
+
+def measurement_history(customer_id):
+    """ Every measurement set taken for a customer, newest first. """
+    return MeasurementSet.query.filter_by(customer_id=customer_id).order_by(MeasurementSet.id.desc()).all()
+
+def record_measurements(customer_id, values, unparsed):
+    """ Stage a new measurement set if the parsed form changes the current one,
+    so every set in the history differs from the one before. Returns True when
+    a set was added. """
+    current = current_measurements(customer_id)
+    card = measurement_card(current, values, unparsed)
+    if current.id is not None and all(getattr(current, name) == value for name, value in card.items()):
+        return False
+    db.session.add(MeasurementSet(customer_id=customer_id, **card))
+    return True
+
+def current_order(customer_id):
+    """ The customer's latest order (an empty one if they have none). """
+    return (CustomerOrder.query.filter_by(customer_id=customer_id).order_by(CustomerOrder.id.desc()).first()
+            or CustomerOrder())
+
+# --- SEARCH INDEX ---
+# The FTS5 table, its triggers and the rebuild statements live in migrations.py
+
+_search_index_ready = None
+
+def ensure_search_index(conn, rebuild=False):
+    """ Create the FTS5 index and its triggers. Returns False when FTS5 isn't compiled in. """
+    global _search_index_ready
+    existed = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_fts'")).first() is not None
+    try:
+        for statement in SEARCH_INDEX_DDL:
+            conn.execute(text(statement))
+    except OperationalError as e:
+        # "no such module: fts5" - searches fall back to LIKE
+        print(f"⚠️  Search index unavailable ({e}); using basic search.")
+        conn.rollback()
+        _search_index_ready = False
+        return False
+
+    if rebuild or not existed:
+        for statement in SEARCH_INDEX_REBUILD:
+            conn.execute(text(statement))
+    conn.commit()
+    _search_index_ready = True
+    return True
+
+def search_index_ready():
+    global _search_index_ready
+    if _search_index_ready is None:
+        _search_index_ready = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_fts'")).first() is not None
+    return _search_index_ready
+
+def build_match_query(query):
+    """ Turn free text into an FTS5 query: every word must match as a prefix. """
+    words = re.findall(r"\w+", query or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_customers(query, limit=None):
+    """ Best matches for a name, phone, ID or address, most relevant first.
+
+    When nothing live matches, an archived customer with exactly this ID or
+    phone is restored and returned.
+    """
+    results = _search_live_customers(query, limit or app.config['SEARCH_RESULTS_LIMIT'])
+    if not results and query and query.strip():
+        restored = restore_archived_customer(user_id=query.strip(), phone=query.strip())
+        if restored is not None:
+            results = [restored]
+    return results
+
+def _search_live_customers(query, limit):
+    if not search_index_ready():
+        return User.query.filter(
+            or_(
+                User.userId == query,
+                User.phone == query,
+                User.userName.ilike(f"%{query}%")
+            )
+        ).limit(limit).all()
+
+    match = build_match_query(query)
+    if not match:
+        return []
+    # bm25 weights: userName, phone_parts, userId, address
+    ids = [row.rowid for row in db.session.execute(
+        text("SELECT rowid FROM user_fts WHERE user_fts MATCH :match "
+             "ORDER BY bm25(user_fts, 5.0, 5.0, 10.0, 1.0) LIMIT :limit"),
+        {'match': match, 'limit': limit})]
+    customers = {customer.id: customer for customer in User.query.filter(User.id.in_(ids))}
+    return [customers[i] for i in ids if i in customers]
+
+# --- TYPEAHEAD ---
+# Prefix index behind /autocomplete, loaded on first use. Each lookup first
+# applies the customers added, renamed or removed since the last one, read
+# from the customer_change log (see migrations.CUSTOMER_CHANGE_DDL), so the
+# index also follows writes by other processes: a second counter, the CLI,
+# sync and archive.
+
+typeahead = PrefixIndex()
+_typeahead_lock = threading.Lock()
+
+def typeahead_index():
+    """ The typeahead index, up to date with the database. """
+    with _typeahead_lock:
+        oldest, latest = db.session.execute(text(
+            'SELECT (SELECT min(seq) FROM customer_change), (SELECT max(seq) FROM customer_change)')).one()
+        latest = latest or 0
+        if not typeahead.built or latest < typeahead.seq or (oldest or 0) > typeahead.seq + 1:
+            # First use, another database, or the changes it missed were trimmed from the log
+            typeahead.build(db.session.execute(select(User.id, User.userId, User.userName, User.phone)), latest)
+        elif latest > typeahead.seq:
+            changed = db.session.execute(text('SELECT DISTINCT customer_id FROM customer_change WHERE seq > :seq'),
+                                         {'seq': typeahead.seq}).scalars().all()
+            rows = {row.id: row for row in db.session.execute(
+                select(User.id, User.userId, User.userName, User.phone).where(User.id.in_(changed)))}
+            for customer_id in changed:
+                if customer_id in rows:
+                    typeahead.add(*rows[customer_id])
+                else:
+                    typeahead.remove(customer_id)
+            typeahead.seq = latest
+    return typeahead
+
+def cache_marks():
+    """ (highest customer row_version, last typeahead change seq): pass them to
+    mark_restored once a snapshot replaced the data they were read from. """
+    return tuple(db.session.execute(text(
+        'SELECT (SELECT coalesce(max(row_version), 0) FROM user), '
+        '(SELECT coalesce(max(seq), 0) FROM customer_change)')).one())
+
+def mark_restored(row_version, change_seq):
+    """ Make every process drop what it cached from the replaced data: customer
+    rows move past any row_version a page cache or ETag has seen, and the
+    typeahead change log starts again past `change_seq`, so each index is
+    built afresh. """
+    db.session.execute(text('UPDATE user SET row_version = row_version + :bump'), {'bump': row_version})
+    restored = db.session.execute(text('SELECT coalesce(max(seq), 0) FROM customer_change')).scalar()
+    db.session.execute(text('DELETE FROM customer_change'))
+    # A gap after every seq an index can be at: indexes that see it build again
+    db.session.execute(text('INSERT INTO customer_change (seq, customer_id) VALUES (:seq, 0)'),
+                       {'seq': max(change_seq, restored) + 2})
+    db.session.commit()
+
+# --- ARCHIVE ---
+# Settled customers (nothing pending) with no activity since a cutoff move to
+# user_archive (and their journal, orders and measurements to the matching
+# *_archive tables) in batches, which keeps the working tables small. They
+# come back the first time they are looked up by ID or phone. Archiving only
+# moves rows: ledger totals and the daily rollup keep counting archived
+# customers, and the sync log does not record the move.
+
+# Per-customer tables (keyed by customer_id) that move with the customer
+ARCHIVED_CHILD_TABLES = {table: archive for table, archive
+                         in {**migrations.ARCHIVE_TABLES, **migrations.ORDER_ARCHIVE_TABLES}.items()
+                         if table != 'user'}
+
+def _shared_columns(table, archive):
+    """ Columns present in both a live table and its archive, in archive order. """
+    live = {row[1] for row in db.session.execute(text(f'PRAGMA table_info("{table}")'))}
+    return [row[1] for row in db.session.execute(text(f'PRAGMA table_info("{archive}")')) if row[1] in live]
+
+def _column_list(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+def archive_candidates(cutoff, limit=None):
+    """ (id, userId) of settled customers with no booking, edit or transaction since `cutoff`. """
+    sql = '''SELECT id, "userId" FROM user
+        WHERE coalesce(price, 0) = 0 AND date < :cutoff AND coalesce(updated_at, date) < :cutoff
+          AND NOT EXISTS (SELECT 1 FROM ledger_entry
+                          WHERE ledger_entry.customer_id = user.id AND created_at >= :cutoff)'''
+    params = {'cutoff': cutoff.isoformat()}
+    if limit:
+        sql += ' LIMIT :limit'
+        params['limit'] = limit
+    return db.session.execute(text(sql), params).all()
+
+def archive_customers(cutoff, batch_size=None):
+    """ Move every archive candidate out of the working tables, one transaction per batch.
+    Returns the number of customers archived. """
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    user_columns = _column_list(_shared_columns('user', 'user_archive'))
+    statements = [(f'INSERT INTO user_archive ({user_columns}, archived_at) '
+                   f'SELECT {user_columns}, :now FROM user WHERE id IN :ids')]
+    for table, archive in ARCHIVED_CHILD_TABLES.items():
+        columns = _column_list(_shared_columns(table, archive))
+        statements += [f'INSERT INTO {archive} ({columns}) SELECT {columns} FROM {table} WHERE customer_id IN :ids',
+                       f'DELETE FROM {table} WHERE customer_id IN :ids']
+    statements.append('DELETE FROM user WHERE id IN :ids')
+    archived = 0
+    while True:
+        batch = archive_candidates(cutoff, batch_size)
+        if not batch:
+            return archived
+        ids = [row.id for row in batch]
         try:
-            number = int(last_id.replace(prefix, '')) + 1
-        except:
-            number = 1
+            db.session.execute(text(sync.PAUSE_CAPTURE))
+            for sql in statements:
+                params = {'ids': ids, 'now': datetime.now()} if ':now' in sql else {'ids': ids}
+                db.session.execute(text(sql).bindparams(bindparam('ids', expanding=True)), params)
+            db.session.execute(text(sync.RESUME_CAPTURE))
+            db.session.commit()
+        except Exception:
+            # Leave the session usable; batches already moved stay archived
+            db.session.rollback()
+            raise
+        for row in batch:
+            page_cache.invalidate(row.userId)
+        archived += len(batch)
+
+def restore_archived_customer(user_id=None, phone=None):
+    """ Move one archived customer (matched by ID or phone) back into the working
+    tables with their journal, orders and measurements. Returns the live customer,
+    or None if not archived. """
+    row = db.session.execute(text(
+        'SELECT id FROM user_archive WHERE "userId" = :user_id OR phone = :phone '
+        'ORDER BY archived_at DESC LIMIT 1'), {'user_id': user_id, 'phone': phone}).first()
+    if row is None:
+        return None
+
+    db.session.execute(text(sync.PAUSE_CAPTURE))
+    # The customer comes back under a fresh id; their journal, orders and measurements follow it
+    user_columns = _column_list(c for c in _shared_columns('user', 'user_archive') if c != 'id')
+    new_id = db.session.execute(text(
+        f'INSERT INTO user ({user_columns}) SELECT {user_columns} FROM user_archive WHERE id = :id'),
+        {'id': row.id}).lastrowid
+    for table, archive in ARCHIVED_CHILD_TABLES.items():
+        columns = _column_list(c for c in _shared_columns(table, archive) if c not in ('id', 'customer_id'))
+        db.session.execute(text(
+            f'INSERT INTO {table} (customer_id, {columns}) '
+            f'SELECT :new_id, {columns} FROM {archive} WHERE customer_id = :id ORDER BY id'),
+            {'id': row.id, 'new_id': new_id})
+        db.session.execute(text(f'DELETE FROM {archive} WHERE customer_id = :id'), {'id': row.id})
+    db.session.execute(text('DELETE FROM user_archive WHERE id = :id'), {'id': row.id})
+    refresh_last_activity(new_id)
+    db.session.execute(text(sync.RESUME_CAPTURE))
+    db.session.commit()
+
+    customer = db.session.get(User, new_id)
+    return customer
+
+def find_customer_or_404(user_id):
+    """ The live customer with this ID, restored from the archive if need be. """
+    customer = User.query.filter_by(userId=user_id).first()
+    if customer is None:
+        customer = restore_archived_customer(user_id=user_id)
+    if customer is None:
+        abort(404)
+    return customer
+
+# --- SYNC ---
+# Shops exchange customer, order and measurement changes through bundle files;
+# sync.py does the work on a raw connection. Customers a bundle mentions that
+# are archived here are restored first, so their changes land on the live row.
+# Applied changes bump the customer's row_version, which is what a running
+# server's page cache and ETags go by.
+
+def export_sync_bundle(path, peer, full=False):
+    raw = db.engine.raw_connection()
+    try:
+        return sync.export_bundle(raw.driver_connection, path, peer, app.config['CUSTOMER_ID_PREFIX'], full)
+    finally:
+        raw.close()
+
+def import_sync_bundle(path):
+    """ Apply one bundle from another shop; returns sync.apply_bundle's summary. """
+    _, changes = sync.read_bundle(path)
+    user_ids = list({change[4] for change in changes})
+    archived = db.session.execute(text('SELECT "userId" FROM user_archive WHERE "userId" IN :ids')
+                                  .bindparams(bindparam('ids', expanding=True)), {'ids': user_ids}).scalars().all()
+    for user_id in archived:
+        restore_archived_customer(user_id=user_id)
+
+    raw = db.engine.raw_connection()
+    try:
+        return sync.apply_bundle(raw.driver_connection, path, app.config['CUSTOMER_ID_PREFIX'])
+    finally:
+        raw.close()
+
+def resolve_sync_clash(user_id):
+    """ Settle the changes held for one customer ID; returns sync.resolve's outcome. """
+    raw = db.engine.raw_connection()
+    try:
+        new_user_id = None
+        if sync.renumbers_local(raw.driver_connection, user_id):
+            new_user_id = next_customer_id()
+            db.session.commit()
+        return sync.resolve(raw.driver_connection, user_id, new_user_id)
+    finally:
+        raw.close()
+
+# --- EXPORT / IMPORT ---
+# Exports read through a server-side cursor in TRANSFER_BATCH_SIZE chunks and
+# imports insert with one executemany per chunk, so memory stays flat however
+# many customers the shop has.
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+def export_query(kind):
+    if kind == 'customers':
+        # One flat row per customer with the latest order's note and measurements,
+        # the same columns an import file takes
+        latest_order = (select(func.max(CustomerOrder.id)).where(CustomerOrder.customer_id == User.id)
+                        .correlate(User).scalar_subquery())
+        latest_set = (select(func.max(MeasurementSet.id)).where(MeasurementSet.customer_id == User.id)
+                      .correlate(User).scalar_subquery())
+        measurements = [func.coalesce(getattr(MeasurementSet, name),
+                                      func.json_extract(MeasurementSet.unparsed, f'$.{name}')).label(name)
+                        for name in MEASUREMENT_NUMBERS]
+        styles = [getattr(MeasurementSet, name) for name in STYLE_FIELDS]
+        return (select(User.__table__, CustomerOrder.special_notes, *measurements, *styles)
+                .outerjoin(CustomerOrder, CustomerOrder.id == latest_order)
+                .outerjoin(MeasurementSet, MeasurementSet.id == latest_set)
+                .order_by(User.id))
+    if kind == 'ledger':
+        # Customers are referenced by userId so the file makes sense in another shop
+        return (select(LedgerEntry.id, User.userId, LedgerEntry.entry_type,
+                       LedgerEntry.amount, LedgerEntry.created_at)
+                .join(User, User.id == LedgerEntry.customer_id)
+                .order_by(LedgerEntry.id))
+    raise ValueError(f"Unknown export: {kind}")
+
+def _export_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def export_rows(kind, fmt):
+    """ Yield the export file in chunks of one batch each. """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    statement = export_query(kind)
+    batch_size = app.config['TRANSFER_BATCH_SIZE']
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(statement)
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if fmt == 'csv':
+            writer.writerow(columns)
+
+        for batch in result.partitions():
+            for row in batch:
+                values = [_export_value(value) for value in row]
+                if fmt == 'csv':
+                    writer.writerow(['' if value is None else value for value in values])
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+def read_import_records(stream, fmt):
+    """ (line number, dict) for each record of a CSV or JSONL text stream.
+
+    Unreadable JSON lines come back as (line number, None).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
     else:
-        number = 1
-    return f"{prefix}{number:03d}"
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+
+# Local bookkeeping columns that are never taken from an import file
+IMPORT_SKIP_COLUMNS = {'id', 'row_version', 'updated_at', 'last_activity'}
+# Money columns the customer forms do not have
+IMPORT_INT_COLUMNS = {'total_amount', 'advance_payment'}
+# Besides the customer columns an import row carries its order note and measurements
+IMPORT_EXTRA_COLUMNS = {'special_notes', *MEASUREMENT_FIELDS}
+# Checked by fields.parse_form exactly as add_user checks them; measurements are read on insert
+IMPORT_FORM_FIELDS = fields.names(fields.USER) + fields.names(fields.ORDER)
+
+def parse_import_record(record):
+    """ Validate one record the way add_user does. Returns (values, error). """
+    if record is None:
+        return None, "not a valid JSON object"
+    columns = User.__table__.columns
+    values = {}
+    for name, raw in record.items():
+        if (name not in columns and name not in IMPORT_EXTRA_COLUMNS) or name in IMPORT_SKIP_COLUMNS:
+            continue
+        # JSONL can carry numbers or booleans where a CSV has text; nested values have no column to go in
+        if isinstance(raw, (list, dict)):
+            return None, f"{name} must be a single value"
+        raw = str(raw).strip() if raw is not None else None
+        values[name] = None if raw in ('', None) else raw
+
+    parsed, _, errors = fields.parse_form(values, only=IMPORT_FORM_FIELDS)
+    if errors:
+        return None, errors[0]
+    values.update(parsed)
+    for name in IMPORT_INT_COLUMNS:
+        try:
+            values[name] = int(values[name]) if values.get(name) is not None else 0
+        except (TypeError, ValueError):
+            return None, f"{name} must be a whole number"
+    return values, None
+
+def _insert_import_batch(batch, report):
+    """ Insert one batch in its own transaction; on a conflict, retry row by row. """
+    rows = [values for _, values in batch]
+    try:
+        user_columns = User.__table__.columns
+        db.session.execute(insert(User.__table__),
+                           [dict({name: value for name, value in row.items() if name in user_columns},
+                                 last_activity=row['date']) for row in rows])
+        ids = dict(db.session.execute(select(User.userId, User.id)
+                                      .where(User.userId.in_([row['userId'] for row in rows]))).all())
+        db.session.execute(insert(CustomerOrder.__table__), [
+            {'customer_id': ids[row['userId']], 'order_date': row['date'], 'suits': row['numberOfSuit'],
+             'special_notes': row.get('special_notes')} for row in rows])
+        db.session.execute(insert(MeasurementSet.__table__), [
+            dict(measurement_card(MeasurementSet(), *fields.parse_form(row, only=MEASUREMENT_FIELDS)[:2]),
+                 customer_id=ids[row['userId']]) for row in rows])
+        adjust_ledger_totals(receivable=sum(row['total_amount'] for row in rows),
+                             received=sum(row['advance_payment'] for row in rows),
+                             pending=sum(row['price'] for row in rows))
+        days = {}
+        for row in rows:
+            day = days.setdefault(row['date'], [0, 0, 0, 0])
+            for i, name in enumerate(('numberOfSuit', 'total_amount', 'advance_payment', 'price')):
+                day[i] += row[name]
+        for day, (suits, billed, received, pending) in days.items():
+            adjust_daily_rollup(day, suits=suits, billed=billed, received=received, pending=pending)
+        db.session.commit()
+        report['imported'] += len(rows)
+    except Exception as e:
+        db.session.rollback()
+        if len(batch) == 1:
+            report['errors'].append({'line': batch[0][0], 'error': str(e.__cause__ or e)})
+            return
+        for single in batch:
+            _insert_import_batch([single], report)
+
+def import_customers(stream, fmt):
+    """ Import customers from CSV/JSONL. Bad rows are reported, not fatal. """
+    batch_size = app.config['TRANSFER_BATCH_SIZE']
+    report = {'imported': 0, 'errors': []}
+    seen_phones, seen_ids = set(), set()
+
+    def flush(pending):
+        # Phones and IDs already in the database, one lookup per batch
+        phones = {values['phone'] for _, values in pending}
+        ids = {values['userId'] for _, values in pending if values.get('userId')}
+        taken_phones = {row.phone for row in User.query.with_entities(User.phone).filter(User.phone.in_(phones))}
+        taken_ids = {row.userId for row in User.query.with_entities(User.userId).filter(User.userId.in_(ids))}
+
+        batch = []
+        for line_no, values in pending:
+            if values['phone'] in taken_phones:
+                report['errors'].append({'line': line_no, 'error': f"phone {values['phone']} is already registered"})
+            elif values.get('userId') in taken_ids:
+                report['errors'].append({'line': line_no, 'error': f"ID {values['userId']} already exists"})
+            else:
+                batch.append((line_no, values))
+
+        # New customers get IDs from the sequence in one block
+        missing = [values for _, values in batch if not values.get('userId')]
+        if missing:
+            for values, customer_id in zip(missing, reserve_customer_ids(len(missing))):
+                values['userId'] = customer_id
+        if batch:
+            _insert_import_batch(batch, report)
 
-def update_database_schema():
-    """ Auto-Fixer: Adds new columns if missing. """
-    print("Checking Database Schema...")
+    pending = []
+    for line_no, record in read_import_records(stream, fmt):
+        values, error = parse_import_record(record)
+        if not error and values['phone'] in seen_phones:
+            error = f"phone {values['phone']} appears twice in the file"
+        if not error and values.get('userId') in seen_ids:
+            error = f"ID {values['userId']} appears twice in the file"
+        if error:
+            report['errors'].append({'line': line_no, 'error': error})
+            continue
+        seen_phones.add(values['phone'])
+        if values.get('userId'):
+            seen_ids.add(values['userId'])
+        pending.append((line_no, values))
+        if len(pending) >= batch_size:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+
+    # Imported IDs like AS2000 must not be handed out again by add_user
+    db.session.execute(text("""UPDATE id_sequence SET last_value = max(last_value,
+        (SELECT coalesce(max(CAST(substr("userId", length(prefix) + 1) AS INTEGER)), 0)
+         FROM user WHERE "userId" GLOB prefix || '[0-9]*'))"""))
+    db.session.commit()
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+# --- PRINT SHEETS ---
+# Icon (file under static/icon), Urdu label and optional stand-in symbol for
+# every style choice on the printed sheet and the customer page, built from
+# the choices declared in fields.py. One dict lookup per style replaces the
+# if/elif chains the templates used to walk.
+PrintStyle = namedtuple('PrintStyle', 'icon label symbol', defaults=(None,))
+
+def _style_choices(caption):
+    """ {style field: ({stored value: PrintStyle}, PrintStyle for any other value)}, captioned by `caption(choice)`. """
+    def style(choice):
+        return PrintStyle(choice.icon, caption(choice), choice.symbol)
+    return {field.name: ({choice.value: style(choice) for choice in fields.offered(field)},
+                         style(next(choice for choice in field.choices if choice.otherwise)))
+            for field in fields.REGISTRY if any(choice.otherwise for choice in field.choices)}
+
+PRINT_STYLE_CHOICES = _style_choices(lambda choice: choice.printed or choice.label)
+# The customer page has room for the full captions
+VIEW_STYLE_CHOICES = _style_choices(lambda choice: choice.label)
+
+def _styles(lookup, measurements):
+    styles = {}
+    for name, (choices, default) in lookup.items():
+        value = getattr(measurements, name)
+        if fields.FIELDS[name].type == 'choices' and value:
+            # Several ticked values: the first one that has a picture
+            value = next((ticked for ticked in value.split(", ") if ticked in choices), value)
+        styles[name] = choices.get(value, default)
+    return styles
+
+def print_styles(measurements):
+    """ {style field: PrintStyle} for one customer's printed sheet. """
+    return _styles(PRINT_STYLE_CHOICES, measurements)
+
+def view_styles(measurements):
+    """ {style field: PrintStyle} for the customer page. """
+    return _styles(VIEW_STYLE_CHOICES, measurements)
+
+def _with_measurements(customers):
+    sets = latest_measurements([customer.id for customer in customers])
+    return [(customer, sets.get(customer.id) or MeasurementSet()) for customer in customers]
+
+def iter_print_customers(date_from=None, date_to=None, user_ids=None):
+    """ (customer, current measurements) to batch print, fetched PRINT_CHUNK_SIZE at a time.
+
+    A list of userIds is printed in the given order; a date range is walked
+    oldest-first along the (date, id) index.
+    """
+    chunk_size = app.config['PRINT_CHUNK_SIZE']
+    if user_ids:
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            found = {c.userId: c for c in User.query.filter(User.userId.in_(chunk))}
+            yield from _with_measurements([found[user_id] for user_id in chunk if user_id in found])
+            db.session.expunge_all()
+        return
+
+    query = User.query
+    if date_from:
+        query = query.filter(User.date >= date_from)
+    if date_to:
+        query = query.filter(User.date <= date_to)
+    position = None
+    while True:
+        page = query
+        if position:
+            page = page.filter(tuple_(User.date, User.id) > position)
+        customers = page.order_by(User.date, User.id).limit(chunk_size).all()
+        if not customers:
+            return
+        yield from _with_measurements(customers)
+        position = (customers[-1].date, customers[-1].id)
+        # Keep memory flat on long runs
+        db.session.expunge_all()
+
+def run_migrations(dry_run=False):
+    """ Bring tailor.db up to the latest schema version (see migrations.py). """
     with app.app_context():
-        inspector = db.inspect(db.engine)
-        existing_columns = [col['name'] for col in inspector.get_columns('user')]
-
-        # List of ALL columns to check/add
-        new_columns_to_add = [
-            ("lambhai", "VARCHAR(50)"),
-            ("tera", "VARCHAR(50)"),
-            ("bazo", "VARCHAR(50)"),
-            ("chati", "VARCHAR(50)"),
-            ("kamar", "VARCHAR(50)"),
-            ("ghaihr", "VARCHAR(50)"),
-            ("shalwar", "VARCHAR(50)"),
-            ("ghair", "VARCHAR(50)"),
-            ("drzdar", "VARCHAR(50)"),
-            ("price", "INTEGER"),
-            ("mora", "VARCHAR(50)"),      
-            ("darmyan", "VARCHAR(50)"),   
-            ("pocket_width", "VARCHAR(50)"), 
-            ("kaj_count", "VARCHAR(50)"),
-            ("style_patti", "VARCHAR(50)"),
-            ("pocket_size", "VARCHAR(50)"),
-            ("style_bazo", "VARCHAR(50)"),
-            ("side_pocket", "VARCHAR(50)"),
-            ("design_button", "VARCHAR(50)"),
-            ("salai", "VARCHAR(50)")
-        ]
+        raw = db.engine.raw_connection()
+        try:
+            return migrations.migrate(raw.driver_connection, db.metadata, dry_run=dry_run)
+        finally:
+            raw.close()
 
-        with db.engine.connect() as conn:
-            for col_name, col_type in new_columns_to_add:
-                if col_name not in existing_columns:
-                    print(f"🔧 Update: Adding missing column '{col_name}'...")
-                    conn.execute(text(f'ALTER TABLE user ADD COLUMN {col_name} {col_type}'))
-                    conn.commit()
+def print_migration_plan(applied, dry_run=False):
+    if not applied:
+        print("✔️  Database schema is up to date.")
+        return
+    for version, description, statements in applied:
+        print(f"{'Would apply' if dry_run else '🔧 Applied'} {version}: {description}")
+        for statement in statements:
+            print(f"    {statement};")
 
 # --- DATABASE MODEL ---
 class User(db.Model):
+    __table_args__ = (
+        # Keyset paging for /user and /ledger walks this index newest-first
+        db.Index('ix_user_date_id', 'date', 'id'),
+        # Debtors only, for the aging report (see migrations.DEBTORS_INDEX_DDL)
+        db.Index('ix_user_debtors', 'price', 'last_activity', 'date', sqlite_where=text('price > 0')),
+        # Ids are never reused, so an archived customer's id stays theirs (see migrations.CUSTOMER_TABLE_DDL)
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     userId = db.Column(db.String(20), unique=True, nullable=False)
-    userName = db.Column(db.String(100), nullable=False)
-    phone = db.Column(db.String(20), nullable=False)
-    numberOfSuit = db.Column(db.Integer, nullable=False)
+    userName = db.Column(db.String(100), nullable=False, index=True)
+    phone = db.Column(db.String(20), nullable=False, index=True)
     address = db.Column(db.String(200), nullable=False)
+    # Suits and date of the latest order (the date also moves with every new debt),
+    # kept here so the list, ledger and rollup never join customer_order
+    numberOfSuit = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date, nullable=False)
-    
-    # --- Measurements ---
-    # Keeping old English fields for safety, but primary data goes to Urdu fields now
-    height = db.Column(db.String(20))
-    width = db.Column(db.String(20))
-    chestWidth = db.Column(db.String(20))
-    arm = db.Column(db.String(20))
-    teera = db.Column(db.String(20))
-    shalwarLength = db.Column(db.String(20))
-    shalwarWidth = db.Column(db.String(20))
-    
-    # New Urdu Fields
-    lambhai = db.Column(db.String(20))
-    tera = db.Column(db.String(20))
-    bazo = db.Column(db.String(20))
-    collar = db.Column(db.String(20))
-    chati = db.Column(db.String(20))
-    kamar = db.Column(db.String(20))
-    
-    ghaihr = db.Column(db.String(20))
-    shalwar = db.Column(db.String(20))
-    poncha = db.Column(db.String(20))        
-    ghair = db.Column(db.String(20))
-    asan = db.Column(db.String(20))
-    drzdar = db.Column(db.String(20))
+
+    # --- Financial ---
+    price = db.Column(db.Integer, default=0)
+    total_amount = db.Column(db.Integer, default=0)
+    advance_payment = db.Column(db.Integer, default=0)
+
+    # Latest booking or journal posting, which debtors are aged by (see migrations.LAST_ACTIVITY_REFRESH)
+    last_activity = db.Column(db.Date)
+
+    # --- Change tracking (bumped on every write, used for page caching) ---
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+class CustomerOrder(db.Model):
+    """ One booking: when, how many suits and any note for the cutter. """
+    __tablename__ = 'customer_order'
+    __table_args__ = (
+        db.Index('ix_customer_order_customer_id', 'customer_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    order_date = db.Column(db.Date, nullable=False)
+    suits = db.Column(db.Integer, nullable=False, default=1)
+    special_notes = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class MeasurementSet(db.Model):
+    """ A customer's measurements and style choices as taken on one day.
+    A new row is added whenever they change, so older ones are the history. """
+    __tablename__ = 'measurement_set'
+    __table_args__ = (
+        # The current set is the newest one per customer
+        db.Index('ix_measurement_set_customer_id', 'customer_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    # --- Measurements (inches) ---
+    lambhai = db.Column(db.Float)
+    tera = db.Column(db.Float)
+    bazo = db.Column(db.Float)
+    collar = db.Column(db.Float)
+    chati = db.Column(db.Float)
+    kamar = db.Column(db.Float)
+    ghaihr = db.Column(db.Float)
+    shalwar = db.Column(db.Float)
+    poncha = db.Column(db.Float)
+    ghair = db.Column(db.Float)
+    asan = db.Column(db.Float)
 
     # --- Extra Sizes ---
-    mora = db.Column(db.String(20))
-    darmyan = db.Column(db.String(20))
-    pocket_width = db.Column(db.String(20))
+    mora = db.Column(db.Float)
+    darmyan = db.Column(db.Float)
+    pocket_width = db.Column(db.Float)
+    pocket_size = db.Column(db.Float)
+    size_collar = db.Column(db.Float)
+    size_patti = db.Column(db.Float)
+    size_cuff = db.Column(db.Float)
+    kaj_count = db.Column(db.Integer)
 
     # --- Styles ---
+    drzdar = db.Column(db.String(20))
     style_collar = db.Column(db.String(50))
     style_cuff = db.Column(db.String(50))
     style_pocket = db.Column(db.String(50))
     style_patti = db.Column(db.String(50))
     style_daman = db.Column(db.String(50))
-    style_shalwar_pocket = db.Column(db.String(50)) 
-    style_bazo =  db.Column(db.String(50)) 
+    style_shalwar_pocket = db.Column(db.String(50))
+    style_bazo = db.Column(db.String(50))
     side_pocket = db.Column(db.String(50))
     design_button = db.Column(db.String(50))
     salai = db.Column(db.String(50))
 
-    # --- Sizes ---
-    size_collar = db.Column(db.String(20))
-    size_patti = db.Column(db.String(20))
-    size_cuff = db.Column(db.String(20))
-    kaj_count = db.Column(db.String(50))
-    pocket_size = db.Column(db.String(50))
-    
-    special_notes = db.Column(db.String(500))
-    price = db.Column(db.Integer, default=0)
+    # Values typed on the card that are not numbers, as JSON {column: text}
+    unparsed = db.Column(db.Text)
 
-    # --- Financial ---
-    total_amount = db.Column(db.Integer, default=0)
-    advance_payment = db.Column(db.Integer, default=0)
-    remaining_balance = db.Column(db.Integer, default=0)
+    def text(self, name):
+        """ A measurement as shown on the card: 15.0 -> '15', 2.75 -> '2.75', unparsed text as typed. """
+        value = getattr(self, name)
+        if value is None:
+            return json.loads(self.unparsed).get(name, '') if self.unparsed else ''
+        return f"{value:g}"
+
+class IdSequence(db.Model):
+    """ Last customer number handed out per userId prefix. """
+    __tablename__ = 'id_sequence'
+
+    prefix = db.Column(db.String(10), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+class LedgerEntry(db.Model):
+    """ Append-only journal: one row per add_debt/payment. """
+    __tablename__ = 'ledger_entry'
+    __table_args__ = (
+        # Per-customer statements page through this index newest-first
+        db.Index('ix_ledger_entry_customer_id', 'customer_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # 'add_debt' or 'payment'
+    amount = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class LedgerTotals(db.Model):
+    """ Single running-totals row (id=1) for the ledger header. """
+    __tablename__ = 'ledger_totals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    total_receivable = db.Column(db.Integer, nullable=False, default=0)
+    total_received = db.Column(db.Integer, nullable=False, default=0)
+    total_pending = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyRollup(db.Model):
+    """ Per-day suits booked and money billed/received/pending, kept up to date on every write. """
+    __tablename__ = 'daily_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    suits_booked = db.Column(db.Integer, nullable=False, default=0)
+    billed = db.Column(db.Integer, nullable=False, default=0)
+    received = db.Column(db.Integer, nullable=False, default=0)
+    pending = db.Column(db.Integer, nullable=False, default=0)
 
 # --- ROUTES ---
 
@@ -151,86 +1326,38 @@ def home():
 def add_user():
     if request.method == 'POST':
         try:
-            # --- NEW VALIDATION LOGIC START ---
-            phone_input = request.form['phone']
-
-            # 1. Check Format (Must be 03XX-XXXXXXX)
-            # Regex Explanation: ^0 starts with 0, \d{3} means 3 digits, - matches dash, \d{7} means 7 digits
-            if not re.match(r"^0\d{3}-\d{7}$", phone_input):
-                flash('Error: Phone format must be 03XX-XXXXXXX', 'danger')
+            values, unparsed, errors = fields.parse_form(request.form)
+            if errors:
+                for error in errors:
+                    flash(f'Error: {error}', 'danger')
                 return redirect(url_for('add_user'))
+            phone_input = values['phone']
 
-            # 2. Check Uniqueness (Must not exist in DB)
+            # Phone must not exist in DB
             existing_user = User.query.filter_by(phone=phone_input).first()
             if existing_user:
                 flash(f'Error: Phone number {phone_input} is already registered!', 'danger')
                 return redirect(url_for('add_user'))
-            # --- NEW VALIDATION LOGIC END ---
+            returning = restore_archived_customer(phone=phone_input)
+            if returning:
+                flash(f'Welcome back: {returning.userName} ({returning.userId}) was restored from the archive. '
+                      'Update their order here.', 'success')
+                return redirect(url_for('update_customer', user_id=returning.userId))
 
+            userId = next_customer_id()
+            new_user = User(userId=userId, **fields.pick(values, fields.USER))
+            new_user.last_activity = new_user.date
+            db.session.add(new_user)
+            db.session.flush()
 
-            userId = generate_unique_id('AS', User, User.userId)
-            
-            # Handle Pocket Style (Checkbox/Radio lists)
-            pocket_list = request.form.getlist('style_pocket')
-            pocket_str = ", ".join(pocket_list) if pocket_list else request.form.get('style_pocket')
+            # The booking and the measurement card go in their own tables
+            db.session.add(CustomerOrder(customer_id=new_user.id, order_date=new_user.date,
+                                         suits=new_user.numberOfSuit, **fields.pick(values, fields.ORDER)))
+            db.session.add(MeasurementSet(customer_id=new_user.id,
+                                          **measurement_card(MeasurementSet(), values, unparsed)))
 
-            try: num_suits = int(request.form['numberOfSuit'])
-            except: num_suits = 1
-            
-            try: price_val = int(request.form['price'])
-            except: price_val = 0
-
-            new_user = User(
-                userId=userId,
-                userName=request.form['userName'],
-                phone=phone_input, # Use the validated variable
-                numberOfSuit=num_suits,
-                address=request.form['address'],
-                date=datetime.strptime(request.form['date'], '%Y-%m-%d').date(),
-                price=price_val,
-
-                # New Urdu Fields
-                lambhai=request.form.get('lambhai'),
-                tera=request.form.get('tera'),
-                bazo=request.form.get('bazo'),
-                collar=request.form.get('collar'),
-                chati=request.form.get('chati'),
-                kamar=request.form.get('kamar'),
-                ghaihr=request.form.get('ghaihr'),
-                shalwar=request.form.get('shalwar'),
-                poncha=request.form.get('poncha'),
-                ghair=request.form.get('ghair'),
-                asan=request.form.get('asan'),
-                drzdar=request.form.get('drzdar'),
-
-                # Styles
-                style_collar=request.form.get('style_collar'),
-                style_cuff=request.form.get('style_cuff'),
-                style_pocket=pocket_str,
-                style_daman=request.form.get('style_daman'),
-                style_patti=request.form.get('style_patti'),
-                style_shalwar_pocket=request.form.get('style_shalwar_pocket'),
-                style_bazo=request.form.get('style_bazo'),
-                side_pocket=request.form.get('side_pocket'),
-                design_button=request.form.get('design_button'),
-                salai=request.form.get('salai'),
-
-                # style Sizes
-                size_collar=request.form.get('size_collar'),
-                size_patti=request.form.get('size_patti'),
-                kaj_count=request.form.get('kaj_count'),
-                pocket_size=request.form.get('pocket_size'),
-                pocket_width=request.form.get('pocket_width'), 
-                
-                # Unique Size Names (Direct Catch - No Lists)
-                size_cuff=request.form.get('size_cuff'),
-                mora=request.form.get('mora'),       
-                darmyan=request.form.get('darmyan'), 
-                
-                special_notes=request.form.get('special_notes')
-            )
-            
-            db.session.add(new_user)
+            adjust_ledger_totals(pending=new_user.price)
+            adjust_daily_rollup(new_user.date, suits=new_user.numberOfSuit, pending=new_user.price)
             db.session.commit()
             
             flash('Customer Added Successfully!', 'success')
@@ -244,97 +1371,103 @@ def add_user():
 
 @app.route('/user')
 def user():
-    all_users = User.query.all()
-    return render_template('user.html', users=all_users)
+    users, next_cursor = fetch_customer_page(
+        [User.userId, User.userName, User.phone, User.address],
+        request.args.get('cursor'))
+    return render_template('user.html', users=users, next_cursor=next_cursor,
+                           is_paged=bool(request.args.get('cursor')))
 
 @app.route('/print/<string:user_id>')
 def print_customer(user_id):
-    customer = User.query.filter_by(userId=user_id).first_or_404()
-    return render_template('print_customer.html', customer=customer)
+    def render(customer):
+        measurements = current_measurements(customer.id)
+        return render_template('print_customer.html', title=f"Order #{customer.userId}",
+                               sheets=[(customer, measurements, print_styles(measurements))])
+    return cached_customer_page('print', user_id, render)
+
+@app.route('/print/batch')
+def print_batch():
+    """ Many order sheets in one printable document, e.g. a whole day's orders.
+
+    /print/batch?from=2024-01-01&to=2024-01-31  or  /print/batch?ids=AS001,AS002
+    """
+    user_ids = [user_id.strip() for value in request.args.getlist('ids')
+                for user_id in value.split(',') if user_id.strip()]
+    try:
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        abort(400, 'Dates must be YYYY-MM-DD')
+    if not (user_ids or date_from or date_to):
+        abort(400, 'Give a date range (from/to) or a list of ids')
+
+    sheets = ((customer, measurements, print_styles(measurements))
+              for customer, measurements in iter_print_customers(date_from, date_to, user_ids))
+    title = f"Orders {date_from or ''} - {date_to or ''}" if not user_ids else f"Orders ({len(user_ids)})"
+    return Response(stream_template('print_customer.html', title=title, sheets=sheets),
+                    mimetype='text/html')
 
 @app.route('/update/<string:user_id>', methods=['GET', 'POST'])
 def update_customer(user_id):
-    customer = User.query.filter_by(userId=user_id).first_or_404()
+    customer = find_customer_or_404(user_id)
 
     if request.method == 'POST':
         try:
-            # --- NEW VALIDATION LOGIC START ---
-            phone_input = request.form['phone']
-
-            # 1. Check Format (Must be 03XX-XXXXXXX)
-            if not re.match(r"^0\d{3}-\d{7}$", phone_input):
-                flash('Error: Phone format must be 03XX-XXXXXXX', 'danger')
+            # Only the fields the form sent are touched (the page has no balance box, for one)
+            values, unparsed, errors = fields.parse_form(request.form, partial=True)
+            if errors:
+                for error in errors:
+                    flash(f'Error: {error}', 'danger')
                 return redirect(url_for('update_customer', user_id=user_id))
 
-            # 2. Check Uniqueness (But ignore if it belongs to THIS customer)
+            # Phone must not belong to another customer
+            phone_input = values.get('phone', customer.phone)
             existing_user = User.query.filter_by(phone=phone_input).first()
-            
-            # If a user exists AND it is NOT the current user we are editing
             if existing_user and existing_user.userId != user_id:
                 flash(f'Error: Phone number {phone_input} is already registered to another customer!', 'danger')
                 return redirect(url_for('update_customer', user_id=user_id))
-            # --- NEW VALIDATION LOGIC END ---
 
+            # Work out what actually changed before writing anything
+            changed = {name: value for name, value in fields.pick(values, fields.USER).items()
+                       if getattr(customer, name) != value}
+            # The latest order is edited in place
+            order = current_order(customer.id)
+            # Adding remaining moves the customer's date to today, so the booking
+            # only moves when the date is actually edited
+            booked_on = order.order_date or customer.date
+            order_values = dict(fields.pick(values, fields.ORDER),
+                                order_date=changed['date'] if 'date' in changed else booked_on,
+                                suits=values.get('numberOfSuit', customer.numberOfSuit))
+            order_changed = {name: value for name, value in order_values.items() if getattr(order, name) != value}
+            # Changed measurements or styles are a new set; the old one stays as history
+            measured = record_measurements(customer.id, fields.pick(values, fields.MEASUREMENTS), unparsed)
+            if not (changed or order_changed or measured):
+                # Nothing to write: cached pages for this customer stay valid
+                flash('No changes to save.', 'success')
+                return redirect(url_for('view_customer', user_id=user_id))
 
-            customer.userName = request.form['userName']
-            customer.phone = phone_input # Use the validated input
-            
-            try: customer.numberOfSuit = int(request.form['numberOfSuit'])
-            except: customer.numberOfSuit = 1
-            
-            try: customer.price = int(request.form['price'])
-            except: customer.price = 0
-
-            customer.address = request.form['address']
-            customer.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
-            
-            # Update Urdu Fields
-            customer.lambhai = request.form.get('lambhai')
-            customer.tera = request.form.get('tera')
-            customer.bazo = request.form.get('bazo')
-            customer.collar = request.form.get('collar')
-            customer.chati = request.form.get('chati')
-            customer.kamar = request.form.get('kamar')
-            
-            customer.ghaihr = request.form.get('ghaihr')
-            customer.shalwar = request.form.get('shalwar')
-            customer.poncha = request.form.get('poncha')
-            customer.ghair = request.form.get('ghair')
-            customer.asan = request.form.get('asan')
-            customer.drzdar = request.form.get('drzdar')
-
-            # Update Styles
-            customer.style_collar = request.form.get('style_collar')
-            customer.style_cuff = request.form.get('style_cuff')
-            customer.style_daman = request.form.get('style_daman')
-            customer.style_patti = request.form.get('style_patti')
-            customer.style_shalwar_pocket = request.form.get('style_shalwar_pocket')
-            customer.style_bazo = request.form.get('style_bazo')
-            customer.side_pocket = request.form.get('side_pocket')
-            customer.design_button=request.form.get('design_button')
-            customer.salai=request.form.get('salai')
-
-            # Handle Pockets
-            pocket_list = request.form.getlist('style_pocket')
-            if pocket_list:
-                 customer.style_pocket = ", ".join(pocket_list)
-            else:
-                 customer.style_pocket = request.form.get('style_pocket')
-
-            # Update Sizes
-            customer.size_cuff = request.form.get('size_cuff')
-            customer.mora = request.form.get('mora')
-            customer.darmyan = request.form.get('darmyan')
-
-            customer.pocket_size = request.form.get('pocket_size')
-            customer.pocket_width = request.form.get('pocket_width')
-
-            customer.size_collar = request.form.get('size_collar')
-            customer.size_patti = request.form.get('size_patti')
-            customer.kaj_count = request.form.get('kaj_count')
-            
-            customer.special_notes = request.form.get('special_notes')
-
+            # Only the changed columns are written
+            moved = 'order_date' in order_changed or changed.keys() & {'numberOfSuit', 'price'}
+            if moved:
+                journal = journal_sums(customer.id)
+                old_share = booking_share(customer, journal)
+            old_price = customer.price or 0
+            for name, value in changed.items():
+                setattr(customer, name, value)
+            touch_customer(customer)
+            if order_changed and order.id is None:
+                order.customer_id = customer.id
+                db.session.add(order)
+            for name, value in order_changed.items():
+                setattr(order, name, value)
+            if 'price' in changed:
+                adjust_ledger_totals(pending=customer.price - old_price)
+            if moved:
+                # Move the booking to its (possibly new) day in the rollup, with the new suits and price
+                adjust_daily_rollup(booked_on, **_reversed(old_share))
+                adjust_daily_rollup(order.order_date, **booking_share(customer, journal))
+            if 'order_date' in order_changed:
+                refresh_last_activity(customer.id)
             db.session.commit()
             flash('Customer Updated Successfully!', 'success')
             
@@ -345,30 +1478,82 @@ def update_customer(user_id):
             flash(f"Update Error: {str(e)}", 'danger')
             return redirect(url_for('update_customer', user_id=user_id))
 
-    return render_template('update_customer.html', customer=customer)
+    return render_template('update_customer.html', customer=customer, m=current_measurements(customer.id),
+                           order=current_order(customer.id))
 
 @app.route('/view/<string:user_id>')
 def view_customer(user_id):
-    customer = User.query.filter_by(userId=user_id).first_or_404()
-    return render_template('view_customer.html', customer=customer)
+    def render(customer):
+        measurements = current_measurements(customer.id)
+        return render_template('view_customer.html', customer=customer, m=measurements,
+                               styles=view_styles(measurements), order=current_order(customer.id))
+    return cached_customer_page('view', user_id, render)
+
+@app.route('/measurements/<string:user_id>')
+def customer_measurements(user_id):
+    """ A customer's measurement history and orders, newest first. """
+    customer = find_customer_or_404(user_id)
+    orders = CustomerOrder.query.filter_by(customer_id=customer.id).order_by(CustomerOrder.id.desc())
+    return jsonify(
+        userId=customer.userId,
+        measurements=[dict({name: getattr(measurements, name) for name in MEASUREMENT_FIELDS},
+                           taken_at=measurements.taken_at.isoformat(timespec='seconds'),
+                           unparsed=json.loads(measurements.unparsed or '{}'))
+                      for measurements in measurement_history(customer.id)],
+        orders=[{'order_date': order.order_date.isoformat(), 'suits': order.suits,
+                 'special_notes': order.special_notes} for order in orders])
+
+@app.route('/stats/page_cache')
+def page_cache_stats():
+    return jsonify(page_cache.stats())
+
+@app.route('/stats/requests')
+def request_stats():
+    return jsonify(latency=request_metrics.rolling(), slow_queries=list(request_metrics.slow_queries),
+                   slow_query_ms=app.config['SLOW_QUERY_MS'])
+
+@app.route('/metrics')
+def metrics():
+    cache = page_cache.stats()
+    gauges = [('tailor_page_cache_entries', 'Rendered pages held in the page cache.', cache['entries'])]
+    counters = [
+        ('tailor_page_cache_hits_total', 'Page cache hits since start.', cache['hits']),
+        ('tailor_page_cache_misses_total', 'Page cache misses since start.', cache['misses']),
+    ]
+    return Response(request_metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
 
 @app.route('/search', methods=['POST'])
 def search_customer():
     query = request.form.get('search_query')
-    customer = User.query.filter(or_(User.phone == query, User.userName.ilike(f"%{query}%"))).first()
+    customers = search_customers(query)
     
-    if customer:
+    if len(customers) == 1:
+        customer = customers[0]
         flash(f'Found: {customer.userName}', 'success')
         return redirect(url_for('view_customer', user_id=customer.userId))
+    elif customers:
+        # Several matches (e.g. same name): let the shop pick the right one
+        flash(f'{len(customers)} customers match "{query}"', 'success')
+        return render_template('user.html', users=customers, next_cursor=None, is_paged=False)
     else:
         flash('No customer found with that Name or Phone!', 'danger')
         return redirect(url_for('home'))
 
+@app.route('/autocomplete')
+def autocomplete():
+    limit = min(request.args.get('limit', 10, type=int), app.config['SEARCH_RESULTS_LIMIT'])
+    ids = typeahead_index().search(request.args.get('q', ''), limit)
+    customers = {row.id: row for row in db.session.execute(
+        select(User.id, User.userId, User.userName, User.phone).where(User.id.in_(ids)))}
+    matches = [customers[i] for i in ids if i in customers]
+    return jsonify([{'userId': row.userId, 'userName': row.userName, 'phone': row.phone,
+                     'url': url_for('view_customer', user_id=row.userId)} for row in matches])
+
 @app.route('/delete/<string:user_id>', methods=['POST'])
 def delete_customer(user_id):
-    customer = User.query.filter_by(userId=user_id).first_or_404()
+    customer = find_customer_or_404(user_id)
     try:
-        db.session.delete(customer)
+        delete_customer_record(customer)
         db.session.commit()
         flash('Customer Deleted Successfully!', 'success')
         return redirect('/user')
@@ -383,7 +1568,8 @@ def remove_customer_page():
     error = None
     if request.method == 'POST':
         search_id = request.form.get('search_id')
-        found_customer = User.query.filter_by(userId=search_id).first()
+        found_customer = (User.query.filter_by(userId=search_id).first()
+                          or restore_archived_customer(user_id=search_id))
         if not found_customer:
             error = f"No customer found with ID: {search_id}"
     return render_template('remove_customer.html', customer=found_customer, error=error)
@@ -391,9 +1577,9 @@ def remove_customer_page():
 @app.route('/deleteCustomer_submit', methods=['POST'])
 def remove_customer_submit():
     user_id = request.form.get('customer_userId')
-    customer = User.query.filter_by(userId=user_id).first_or_404()
+    customer = find_customer_or_404(user_id)
     try:
-        db.session.delete(customer)
+        delete_customer_record(customer)
         db.session.commit()
         return render_template('remove_customer.html', success=f"Customer {user_id} deleted successfully.")
     except Exception as e:
@@ -405,41 +1591,36 @@ def remove_customer_submit():
 def ledger():
     search_query = ""
     
-    # --- 1. Global Stats Calculation ---
-    # Using specific entities makes it faster than fetching whole objects
-    all_data = User.query.with_entities(User.total_amount, User.advance_payment, User.price).all()
-    
-    total_receivable = sum((u.total_amount or 0) for u in all_data)
-    total_received = sum((u.advance_payment or 0) for u in all_data)
-    total_pending = sum((u.price or 0) for u in all_data)
+    # --- 1. Global Stats ---
+    # Read from the running-totals row instead of summing every customer
+    totals = get_ledger_totals()
 
     # --- 2. List Fetching Logic ---
+    next_cursor = None
+    ledger_columns = [User.userId, User.userName, User.phone,
+                      User.advance_payment, User.price]
     if request.method == 'POST':
         search_query = request.form.get('search_query')
         if search_query:
             # Filtered List (Search)
-            users = User.query.filter(
-                or_(
-                    User.userId == search_query,
-                    User.phone == search_query,
-                    User.userName.ilike(f"%{search_query}%")
-                )
-            ).all()
+            users = search_customers(search_query)
             if not users:
                 flash("No customer found with those details.", "danger")
         else:
-            # If search is empty, show all
-            users = User.query.order_by(User.date.desc()).all()
+            # If search is empty, show the first page
+            users, next_cursor = fetch_customer_page(ledger_columns)
     else:
-        # Default View: Show ALL users (Newest First)
-        users = User.query.order_by(User.date.desc()).all()
+        # Default View: One page of users (Newest First)
+        users, next_cursor = fetch_customer_page(ledger_columns, request.args.get('cursor'))
 
     return render_template('ledger.html', 
                            users=users, 
+                           next_cursor=next_cursor,
+                           is_paged=bool(request.args.get('cursor')),
                            search_query=search_query,
-                           total_receivable=total_receivable,
-                           total_received=total_received,
-                           total_pending=total_pending)
+                           total_receivable=totals.total_receivable,
+                           total_received=totals.total_received,
+                           total_pending=totals.total_pending)
 
 @app.route('/process_transaction', methods=['POST'])
 def process_transaction():
@@ -451,44 +1632,370 @@ def process_transaction():
 
     transaction_type = request.form.get('type') # 'add_debt' or 'payment'
     
-    customer = User.query.filter_by(userId=user_id).first_or_404()
+    customer = find_customer_or_404(user_id)
     
     try:
-        # Initialize values if they are None (null in database)
-        if customer.price is None: customer.price = 0
-        if customer.total_amount is None: customer.total_amount = 0
-        if customer.advance_payment is None: customer.advance_payment = 0
-
         if transaction_type == 'add_debt':
             # Logic: Add Remaining -> Increases Total Bill & Increases Pending Balance
-            customer.price += amount
-            customer.total_amount += amount
+            apply_transaction(customer, transaction_type, amount)
+            db.session.commit()
             flash(f"Added {amount} to remaining. New Balance: {customer.price}", "warning")
-            
-            # Updates the date to RIGHT NOW whenever add remaining
-            customer.date = datetime.now()
 
         elif transaction_type == 'payment':
             # Logic: Payment -> Increases Received & Decreases Pending Balance
-            customer.price -= amount
-            customer.advance_payment += amount
+            apply_transaction(customer, transaction_type, amount)
+            db.session.commit()
             flash(f"Payment of {amount} received. Remaining Balance: {customer.price}", "success")
 
-        db.session.commit()
+        else:
+            flash(f"Unknown transaction type: {transaction_type}", "danger")
         
     except Exception as e:
+        db.session.rollback()
         flash(f"Error processing transaction: {str(e)}", "danger")
         
     # Reload ledger to show updated values
+    totals = get_ledger_totals()
     return render_template('ledger.html', 
                            users=[customer], # Show the updated user immediately
                            search_query=customer.phone, # Keep the search active
-                           total_receivable=User.query.with_entities(func.sum(User.total_amount)).scalar() or 0,
-                           total_received=User.query.with_entities(func.sum(User.advance_payment)).scalar() or 0,
-                           total_pending=User.query.with_entities(func.sum(User.price)).scalar() or 0)
+                           total_receivable=totals.total_receivable,
+                           total_received=totals.total_received,
+                           total_pending=totals.total_pending)
+
+@app.route('/statement/<string:user_id>')
+def customer_statement(user_id):
+    """ One customer's payment history, a page at a time from the journal index. """
+    customer = find_customer_or_404(user_id)
+    per_page = app.config['STATEMENT_PER_PAGE']
+
+    query = LedgerEntry.query.filter_by(customer_id=customer.id)
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(LedgerEntry.id < before)
+
+    entries = query.order_by(LedgerEntry.id.desc()).limit(per_page + 1).all()
+    next_before = None
+    if len(entries) > per_page:
+        entries = entries[:per_page]
+        next_before = entries[-1].id
+
+    return render_template('statement.html', customer=customer, entries=entries,
+                           next_before=next_before, is_paged=bool(before))
+
+@app.route('/reports')
+def reports():
+    """ Monthly (or daily) bookings and money, read from the rollup table only. """
+    today = datetime.now().date()
+    period = 'day' if request.args.get('period') == 'day' else 'month'
+    try:
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        date_from = today.replace(day=1) if period == 'day' else today.replace(month=1, day=1)
+    try:
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        date_to = today
+
+    rows = rollup_report(date_from, date_to, period)
+    totals = [sum(row[i] for row in rows) for i in range(1, 5)]
+    return render_template('report.html', rows=rows, totals=totals, period=period,
+                           date_from=date_from, date_to=date_to)
+
+@app.route('/reports/aging')
+def aging():
+    """ Who owes us and for how long: debtors bucketed by last activity, plus the largest balances. """
+    today = datetime.now().date()
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    buckets, debtors = aging_report(today, top)
+    totals = (sum(bucket[1] for bucket in buckets), sum(bucket[2] for bucket in buckets))
+    return render_template('aging.html', buckets=buckets, debtors=debtors, totals=totals, top=top, today=today)
+
+@app.route('/reports/aging/print')
+def print_debtors():
+    """ Printable list of every debtor (or one bucket's), largest balance first. """
+    bucket = request.args.get('bucket') or None
+    if bucket is not None and bucket not in [label for label, _ in AGING_BUCKETS]:
+        abort(400, f"Bucket must be one of {', '.join(label for label, _ in AGING_BUCKETS)}")
+    today = datetime.now().date()
+    return Response(stream_template('debtors_print.html', debtors=iter_debtors(today, bucket),
+                                    bucket=bucket, today=today), mimetype='text/html')
+
+# --- EXPORT / IMPORT ROUTES ---
+
+@app.route('/export/<string:kind>.<string:fmt>')
+def export_data(kind, fmt):
+    """ Download all customers or ledger entries as CSV or JSONL, streamed. """
+    if kind not in ('customers', 'ledger') or fmt not in EXPORT_FORMATS:
+        abort(404)
+    filename = f"{kind}-{datetime.now():%Y-%m-%d}.{fmt}"
+    return Response(stream_with_context(export_rows(kind, fmt)), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/import', methods=['POST'])
+def import_data():
+    """ Upload a CSV/JSONL customer file; answers with the per-row report. """
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    fmt = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'File must be .csv or .jsonl'}), 400
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    return jsonify(import_customers(stream, fmt))
+
+# --- CLI COMMANDS ---
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['customers', 'ledger']))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-')
+def export_command(kind, fmt, output):
+    """ Stream all customers or ledger entries to a file (default: stdout). """
+    for chunk in export_rows(kind, fmt):
+        output.write(chunk)
+
+@app.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)),
+              help='Defaults to the file extension.')
+def import_command(path, fmt):
+    """ Import customers from a CSV or JSONL file. """
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    if fmt not in EXPORT_FORMATS:
+        raise click.BadParameter('use --format csv or --format jsonl', param_hint='--format')
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        report = import_customers(stream, fmt)
+    click.echo(f"✔️  Imported {report['imported']} customers.")
+    for error in report['errors']:
+        click.echo(f"❌  Line {error['line']}: {error['error']}")
+
+@app.cli.command('migrate')
+@click.option('--dry-run', is_flag=True, help='Only report the DDL that would run.')
+def migrate_command(dry_run):
+    """ Apply pending schema migrations. """
+    print_migration_plan(run_migrations(dry_run=dry_run), dry_run=dry_run)
+
+@app.cli.command('db-settings')
+def db_settings_command():
+    """ Show the active SQLite concurrency settings. """
+    print_database_settings()
+
+@app.cli.command('reserve-ids')
+@click.argument('count', type=int)
+@click.option('--prefix', help="ID prefix (default: this shop's, from TAILOR_ID_PREFIX).")
+def reserve_ids_command(count, prefix):
+    """ Reserve a block of customer IDs, e.g. for a bulk import. """
+    ids = reserve_customer_ids(count, prefix)
+    db.session.commit()
+    click.echo(f"Reserved {count} IDs: {ids[0]} - {ids[-1]}")
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """ (Re)create the customer search index from the customer table. """
+    with db.engine.connect() as conn:
+        if ensure_search_index(conn, rebuild=True):
+            count = conn.execute(text("SELECT count(*) FROM user_fts")).scalar()
+            click.echo(f"✔️  Search index rebuilt with {count} customers.")
+
+@app.cli.command('verify-totals')
+@click.option('--rebuild', is_flag=True, help='Overwrite the running totals with the recomputed values.')
+def verify_totals_command(rebuild):
+    """ Recompute ledger totals from scratch and report any drift. """
+    totals = get_ledger_totals()
+    expected = compute_ledger_totals()
+    drift = {name: getattr(totals, name) - value for name, value in expected.items()
+             if getattr(totals, name) != value}
+
+    if not drift:
+        click.echo("✔️  Ledger totals match the customer table.")
+        return
+    for name, difference in drift.items():
+        click.echo(f"⚠️  {name}: stored {getattr(totals, name)}, actual {expected[name]} (drift {difference:+d})")
+    if rebuild:
+        for name, value in expected.items():
+            setattr(totals, name, value)
+        db.session.commit()
+        click.echo("🔧 Ledger totals rebuilt.")
+    else:
+        click.echo("Run again with --rebuild to fix them.")
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """ Rebuild the daily rollup from the customer table. """
+    for statement in migrations.DAILY_ROLLUP_BACKFILL + [migrations.ARCHIVED_ROLLUP_BACKFILL]:
+        db.session.execute(text(statement))
+    db.session.commit()
+    days = db.session.query(func.count(DailyRollup.day)).scalar()
+    click.echo(f"✔️  Daily rollup rebuilt: {days} days.")
+
+@app.cli.command('archive')
+@click.option('--inactive-days', default=730, show_default=True,
+              help='Archive settled customers with no activity for this many days.')
+@click.option('--before', help='Cutoff date YYYY-MM-DD (instead of --inactive-days).')
+@click.option('--dry-run', is_flag=True, help='Only count the customers that would be archived.')
+def archive_command(inactive_days, before, dry_run):
+    """ Move settled, inactive customers out of the working tables. """
+    if before:
+        cutoff = datetime.strptime(before, '%Y-%m-%d').date()
+    else:
+        cutoff = datetime.now().date() - timedelta(days=inactive_days)
+    if dry_run:
+        click.echo(f"🔍 {len(archive_candidates(cutoff))} customers would be archived (inactive since {cutoff}).")
+        return
+    click.echo(f"📦 Archived {archive_customers(cutoff)} customers inactive since {cutoff}.")
+
+@app.cli.command('restore-archived')
+@click.argument('id_or_phone')
+def restore_archived_command(id_or_phone):
+    """ Bring one archived customer back by customer ID or phone. """
+    customer = restore_archived_customer(user_id=id_or_phone, phone=id_or_phone)
+    if customer is None:
+        click.echo(f"⚠️  No archived customer with ID or phone {id_or_phone}.")
+        sys.exit(1)
+    click.echo(f"✔️  Restored {customer.userId} ({customer.userName}).")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """ Optimize and fingerprint static files into static/dist. """
+    summary = assets.build(app.static_folder)
+    asset_manifest.load(ASSET_MANIFEST_PATH)
+    saved = summary['bytes_before'] - summary['bytes_after']
+    click.echo(f"✔️  {summary['files']} assets built, {summary['inlined']} inlined, "
+               f"{saved // 1024} KB saved ({summary['bytes_after'] // 1024} KB total).")
+
+@app.cli.command('backup')
+def backup_command():
+    """ Take a snapshot of the database now and rotate old ones. """
+    path = backup.create_snapshot(db_path, app.config['BACKUP_DIR'])
+    click.echo(f"💾 Snapshot written: {path}")
+    for deleted in backup.rotate_snapshots(app.config['BACKUP_DIR'], app.config['BACKUP_KEEP'],
+                                           app.config['BACKUP_MAX_AGE_DAYS']):
+        click.echo(f"🗑️  Rotated out: {os.path.basename(deleted)}")
+
+@app.cli.command('verify-backup')
+@click.argument('paths', nargs=-1, type=click.Path(dir_okay=False))
+def verify_backup_command(paths):
+    """ Check snapshot checksums and integrity (all snapshots when no PATHS are given). """
+    paths = paths or backup.list_snapshots(app.config['BACKUP_DIR'])
+    if not paths:
+        click.echo(f"⚠️  No snapshots in {app.config['BACKUP_DIR']}")
+        return
+    failed = False
+    for path in paths:
+        problems = backup.verify_snapshot(path)
+        if problems:
+            failed = True
+            click.echo(f"❌ {os.path.basename(path)}: {'; '.join(problems)}")
+        else:
+            click.echo(f"✔️  {os.path.basename(path)}")
+    if failed:
+        sys.exit(1)
+
+@app.cli.command('restore-backup')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore_backup_command(path, yes):
+    """ Replace the database with a snapshot (the current data is snapshotted first). """
+    if not yes:
+        click.confirm(f"Replace {db_path} with {os.path.basename(path)}?", abort=True)
+    safety = backup.create_snapshot(db_path, app.config['BACKUP_DIR'])
+    click.echo(f"💾 Current data saved as {os.path.basename(safety)}")
+    marks = cache_marks()
+    db.session.close()
+    try:
+        backup.restore_snapshot(path, db_path)
+    except ValueError as e:
+        click.echo(f"❌ {e}")
+        sys.exit(1)
+    # An older snapshot is brought up to date, then a server running on this
+    # database is made to drop what it cached
+    run_migrations()
+    mark_restored(*marks)
+    click.echo(f"✔️  Restored {os.path.basename(path)}")
+
+@app.cli.command('sync-export')
+@click.argument('path', type=click.Path())
+@click.option('--to', 'peer', required=True, help="Site id of the shop the bundle is for (flask sync-status there).")
+@click.option('--full', is_flag=True, help='Send every change, not only those that shop has not acknowledged.')
+def sync_export_command(path, peer, full):
+    """ Write the changes another shop has not acknowledged to a sync bundle (a file, or a folder such as a
+    USB stick). A change is acknowledged once a bundle from that shop, made after it received it, is imported. """
+    path, count = export_sync_bundle(path, peer, full)
+    click.echo(f"📦 {count} changes written to {path}")
+
+@app.cli.command('sync-import')
+@click.argument('path', type=click.Path(exists=True))
+def sync_import_command(path):
+    """ Apply a sync bundle from another shop, or every bundle in a folder. """
+    with db.engine.connect() as conn:
+        site = conn.execute(text('SELECT site_id FROM sync_site')).scalar()
+    bundles = sync.list_bundles(path, exclude_site=site) if os.path.isdir(path) else [path]
+    if not bundles:
+        click.echo("No bundles from other shops found.")
+    for bundle in bundles:
+        try:
+            summary = import_sync_bundle(bundle)
+        except ValueError as e:
+            click.echo(f"❌ {e}")
+            sys.exit(1)
+        click.echo(f"✔️  {os.path.basename(bundle)}: {summary['applied']} changes applied, "
+                   f"{summary['skipped']} already here")
+        if summary['dropped']:
+            click.echo(f"   {summary['dropped']} changes dropped: their customer was deleted here or lost the ID")
+        for user_id in sorted(summary['conflicts']):
+            click.echo(f"⚠️  Changes to {user_id} are held: a different customer has the ID here, "
+                       f"or the customer has not arrived yet (flask sync-resolve)")
+
+@app.cli.command('sync-resolve')
+@click.argument('user_ids', nargs=-1)
+def sync_resolve_command(user_ids):
+    """ Settle customer IDs with held changes (all of them when no USER_IDS are given). Every shop settles a
+    clash the same way: the customer logged first keeps the ID, and one added here that loses it gets a new ID. """
+    if not user_ids:
+        with db.engine.connect() as conn:
+            user_ids = conn.execute(text('SELECT DISTINCT user_id FROM sync_conflict ORDER BY user_id')).scalars().all()
+    if not user_ids:
+        click.echo("No held changes.")
+    for user_id in user_ids:
+        try:
+            outcome = resolve_sync_clash(user_id)
+        except ValueError as e:
+            click.echo(f"❌ {e}")
+            sys.exit(1)
+        if outcome['kept']:
+            click.echo(f"✔️  {user_id} stays with the customer here; {outcome['dropped']} changes to another "
+                       f"customer under that ID dropped")
+        elif outcome['applied']:
+            click.echo(f"✔️  {user_id} goes to the customer from the other shop: {outcome['applied']} changes applied")
+        if outcome['renumbered']:
+            click.echo(f"🔁 The customer who had {user_id} here is now {outcome['renumbered']}")
+        if outcome['waiting']:
+            click.echo(f"⚠️  {outcome['waiting']} changes to {user_id} still wait for their customer to arrive")
+
+@app.cli.command('sync-status')
+def sync_status_command():
+    """ Show this shop's site id and what it has sent to and received from other shops. """
+    raw = db.engine.raw_connection()
+    try:
+        state = sync.status(raw.driver_connection)
+    finally:
+        raw.close()
+    click.echo(f"🏪 Site id: {state['site']} (IDs {app.config['CUSTOMER_ID_PREFIX']}...), "
+               f"{state['changes']} changes logged")
+    for peer, last_seq, acked_seq, exported_at in state['peers']:
+        click.echo(f"   sent to {peer}: {last_seq} of {state['last_seq']} (last bundle {exported_at}), "
+                   f"{acked_seq} acknowledged")
+    for origin, origin_seq in state['origins']:
+        if origin != state['site']:
+            click.echo(f"   received from {origin}: up to change {origin_seq}")
+    for user_id, received_from, count in state['conflicts']:
+        click.echo(f"⚠️  {count} changes held for {user_id} from {received_from} (flask sync-resolve)")
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        update_database_schema() 
+    print_migration_plan(run_migrations())
+    print_database_settings()
+    # With the debug reloader the app runs in a child process; back up only from that one
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_backup_scheduler()
     app.run(debug=True)
\ No newline at end of file
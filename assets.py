@@ -0,0 +1,130 @@
+""" Static asset build: optimized, fingerprinted copies of static/.
+
+`flask build-assets` writes every file under static/ to static/dist/ with a
+content hash in its name (icon/ban.png -> dist/icon/ban.1a2b3c4d5e.png) and
+records the mapping in static/dist/manifest.json. PNGs are optimized on the
+way: metadata chunks are dropped and the image data is recompressed at the
+highest zlib level (pure Python, no Pillow). Icons small enough are inlined
+as data: URIs instead, which saves a request each.
+
+Hashed files never change, so they are served with a one-year immutable
+Cache-Control and the browser does not ask for them again.
+"""
+import base64
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# PNGs at or below this size (after optimizing) are inlined as data: URIs
+INLINE_LIMIT = 4096
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Chunks that change how the image looks; everything else (text, time,
+# physical size, significant bits) is metadata and dropped
+PNG_KEEP = {b'IHDR', b'PLTE', b'tRNS', b'sRGB', b'gAMA', b'cHRM', b'iCCP', b'IEND'}
+
+
+def _png_chunks(data):
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        yield kind, data[position + 8:position + 8 + length]
+        position += 12 + length
+
+def _png_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+def optimize_png(data):
+    """ The PNG without metadata chunks and with its image data recompressed
+    as tightly as zlib allows; the original if that is not smaller. """
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+    chunks, image = [], []
+    for kind, body in _png_chunks(data):
+        if kind == b'IDAT':
+            image.append(body)
+        elif kind in PNG_KEEP and kind != b'IEND':
+            chunks.append(_png_chunk(kind, body))
+    if not image:
+        return data
+    raw = zlib.decompress(b''.join(image))
+    candidates = []
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidates.append(compressor.compress(raw) + compressor.flush())
+    optimized = (PNG_SIGNATURE + b''.join(chunks) + _png_chunk(b'IDAT', min(candidates, key=len))
+                 + _png_chunk(b'IEND', b''))
+    return optimized if len(optimized) < len(data) else data
+
+def _fingerprinted(path, data):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+def build(static_dir, inline_limit=INLINE_LIMIT):
+    """ Rebuild static_dir/dist and its manifest. Returns a summary dict. """
+    dist = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+    summary = {'files': 0, 'inlined': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir):
+            dirs[:] = [name for name in dirs if name != DIST_DIR]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                original = f.read()
+            is_png = name.lower().endswith('.png')
+            data = optimize_png(original) if is_png else original
+            summary['files'] += 1
+            summary['bytes_before'] += len(original)
+            summary['bytes_after'] += len(data)
+
+            if is_png and len(data) <= inline_limit:
+                manifest[relative] = 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')
+                summary['inlined'] += 1
+                continue
+            target = f"{DIST_DIR}/{_fingerprinted(relative, data)}"
+            os.makedirs(os.path.dirname(os.path.join(static_dir, target)), exist_ok=True)
+            with open(os.path.join(static_dir, target), 'wb') as f:
+                f.write(data)
+            manifest[relative] = target
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return summary
+
+
+class AssetManifest:
+    """ static/ path -> fingerprinted path or data: URI, from the last build. """
+
+    def __init__(self):
+        self._entries = {}
+        self._folded = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """ Read a manifest; a missing one leaves the plain static files in use. """
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        with self._lock:
+            self._entries = entries
+            # Templates refer to some icons with different capitalization (KaniBazo.png)
+            self._folded = {name.lower(): target for name, target in entries.items()}
+        return len(entries)
+
+    def lookup(self, filename):
+        return self._entries.get(filename) or self._folded.get(filename.lower())
+
+    def __len__(self):
+        return len(self._entries)
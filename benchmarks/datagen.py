@@ -0,0 +1,151 @@
+""" Synthetic shop data for benchmarks.
+
+Fills a tailor.db with realistic customers: Urdu style choices, 03XX-XXXXXXX
+phones, dates spread over five years, balances and a few ledger entries each.
+
+    python -m benchmarks.datagen --scale 10k --db /tmp/bench/tailor.db
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from migrations import COUNT_COLUMNS, DAILY_ROLLUP_BACKFILL, MEASUREMENT_COLUMNS, STYLE_COLUMNS
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+FIRST_NAMES = ['Muhammad', 'Imran', 'Bilal', 'Zahid', 'Asad', 'Hamza', 'Usman', 'Faisal', 'Tariq', 'Kamran',
+               'محمد', 'عمران', 'بلال', 'زاہد', 'اسد', 'حمزہ', 'عثمان', 'فیصل']
+LAST_NAMES = ['Khan', 'Afridi', 'Yousafzai', 'Shinwari', 'Ahmad', 'Ali', 'Shah', 'Hussain',
+              'خان', 'آفریدی', 'یوسفزئی', 'شاہ', 'حسین']
+AREAS = ['Hayatabad', 'Saddar', 'University Town', 'Board Bazaar', 'Tehkal', 'Gulbahar', 'Warsak Road',
+         'حیات آباد', 'صدر', 'یونیورسٹی ٹاؤن']
+NETWORKS = ['300', '301', '310', '312', '321', '333', '334', '345', '346']
+
+STYLE_CHOICES = {
+    'style_collar': ['collar', 'collarGoll', 'ban', 'benGoll', 'benChoras', 'hindiGalla', 'SamneyHindiBackBen'],
+    'style_patti': ['samplePatti', 'roundPatti', 'anglePatti'],
+    'style_cuff': ['fetCuff', 'fetChuras', 'cutCuff', 'fitGollCuff', 'fitCuff', 'studCuff', 'gollBazo', 'kaniBazo'],
+    'style_bazo': ['sholder'],
+    'style_pocket': ['samplePocket', 'flapPocket', 'nokdarPocket', 'None'],
+    'side_pocket': ['doubleSidePocket', 'ekSidePocket'],
+    'style_daman': ['chorasDaman', 'gollDaman'],
+    'style_shalwar_pocket': ['Side', 'None'],
+    'design_button': ['sample_button', 'steel_button', 'ring_button', 'apple_button', 'goll_button'],
+    'salai': ['single_salai', 'double_salai', 'single_chamaktar', 'double_chamaktar', 'triple_chamaktar',
+              'choka_salai', 'zanjari', 'ktk'],
+}
+
+# (column, low, high) in inches; halves are common on the measurement card
+MEASUREMENTS = [('lambhai', 38, 46), ('tera', 17, 22), ('bazo', 21, 26), ('collar', 14, 18), ('chati', 36, 48),
+                ('kamar', 32, 46), ('ghaihr', 22, 30), ('shalwar', 38, 44), ('poncha', 7, 10), ('ghair', 20, 28),
+                ('asan', 12, 16), ('mora', 4, 7), ('darmyan', 3, 5), ('pocket_width', 5, 7),
+                ('size_collar', 2, 4), ('size_patti', 1, 2), ('size_cuff', 2, 4), ('pocket_size', 6, 8)]
+
+BATCH_SIZE = 5000
+
+
+def phone_number(n):
+    """ A unique 03XX-XXXXXXX for customer n (multiplying by a prime coprime to 10**7 permutes the digits). """
+    network = NETWORKS[n % len(NETWORKS)]
+    return f"0{network}-{(n * 7_919_993) % 10_000_000:07d}"
+
+CUSTOMER_COLUMNS = ['userId', 'userName', 'phone', 'numberOfSuit', 'address', 'date',
+                    'total_amount', 'advance_payment', 'price', 'row_version', 'updated_at']
+MEASUREMENT_SET_COLUMNS = list(MEASUREMENT_COLUMNS + COUNT_COLUMNS + STYLE_COLUMNS)
+
+
+def customer_row(n, rng, start):
+    booked = start + timedelta(days=rng.randrange(5 * 365))
+    bill = rng.choice([0, 1500, 2500, 3200, 4000, 6500]) * rng.randint(1, 3)
+    paid = bill if rng.random() < 0.7 else rng.randrange(0, bill + 1, 100)
+    row = {
+        'userId': f"AS{n:03d}",
+        'userName': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        'phone': phone_number(n),
+        'numberOfSuit': rng.randint(1, 4),
+        'address': rng.choice(AREAS),
+        'date': booked.isoformat(),
+        'drzdar': rng.choice(['Yes', 'No']),
+        'kaj_count': rng.randint(3, 6),
+        'special_notes': rng.choice([None, None, None, 'Eid se pehle', 'عید سے پہلے']),
+        'total_amount': bill,
+        'advance_payment': paid,
+        'price': bill - paid,
+        'row_version': 1,
+        'updated_at': datetime.combine(booked, datetime.min.time()).isoformat(sep=' '),
+    }
+    for column, choices in STYLE_CHOICES.items():
+        row[column] = rng.choice(choices)
+    for column, low, high in MEASUREMENTS:
+        row[column] = rng.randint(low, high) + rng.choice([0, 0, 0.5])
+    return row
+
+def generate(conn, count, seed=42, start=date(2020, 1, 1)):
+    """ Insert `count` customers (plus their order, measurements and ledger entries)
+    into a migrated sqlite3 connection. """
+    rng = random.Random(seed)
+    quoted = ", ".join(f'"{column}"' for column in CUSTOMER_COLUMNS)
+    insert_customer = f'INSERT INTO user (id, {quoted}) VALUES ({", ".join("?" * (len(CUSTOMER_COLUMNS) + 1))})'
+    insert_order = ('INSERT INTO customer_order (customer_id, order_date, suits, special_notes, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)')
+    insert_measurements = (f'INSERT INTO measurement_set (customer_id, taken_at, {", ".join(MEASUREMENT_SET_COLUMNS)}) '
+                           f'VALUES ({", ".join("?" * (len(MEASUREMENT_SET_COLUMNS) + 2))})')
+    insert_entry = 'INSERT INTO ledger_entry (customer_id, entry_type, amount, created_at) VALUES (?, ?, ?, ?)'
+
+    next_id = (conn.execute('SELECT coalesce(max(id), 0) FROM user').fetchone()[0]) + 1
+    for batch_start in range(1, count + 1, BATCH_SIZE):
+        rows, orders, measurements, entries = [], [], [], []
+        for n in range(batch_start, min(batch_start + BATCH_SIZE, count + 1)):
+            row = customer_row(n, rng, start)
+            rows.append([next_id] + [row[c] for c in CUSTOMER_COLUMNS])
+            orders.append((next_id, row['date'], row['numberOfSuit'], row['special_notes'], row['updated_at']))
+            measurements.append([next_id, row['updated_at']] + [row.get(c) for c in MEASUREMENT_SET_COLUMNS])
+            booked = datetime.fromisoformat(row['updated_at'])
+            if row['total_amount']:
+                entries.append((next_id, 'add_debt', row['total_amount'], booked))
+            if row['advance_payment']:
+                entries.append((next_id, 'payment', row['advance_payment'], booked + timedelta(days=rng.randint(0, 20))))
+            next_id += 1
+        conn.executemany(insert_customer, rows)
+        conn.executemany(insert_order, orders)
+        conn.executemany(insert_measurements, measurements)
+        conn.executemany(insert_entry, [(i, kind, amount, when.isoformat(sep=' ')) for i, kind, amount, when in entries])
+        conn.commit()
+
+    # Keep the app's derived tables consistent with what was loaded
+    conn.execute("INSERT OR REPLACE INTO id_sequence (prefix, last_value) "
+                 "SELECT 'AS', coalesce(max(CAST(substr(\"userId\", 3) AS INTEGER)), 0) FROM user")
+    # The running totals are re-seeded from the table on first use
+    conn.execute("DELETE FROM ledger_totals")
+    for statement in DAILY_ROLLUP_BACKFILL:
+        conn.execute(statement)
+    conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--db', required=True, help='database file to create (must not exist)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    # The app picks its database at import time
+    os.environ['TAILOR_DB_PATH'] = args.db
+    from app import db, app, run_migrations
+
+    run_migrations()
+    with app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            generate(raw.driver_connection, SCALES[args.scale], seed=args.seed)
+        finally:
+            raw.close()
+    print(f"✔️  {SCALES[args.scale]} customers written to {args.db}")
+
+if __name__ == '__main__':
+    sys.exit(main())
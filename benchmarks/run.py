@@ -0,0 +1,213 @@
+""" Route benchmarks against a synthetic shop database.
+
+Runs every main route through the Flask test client and records p50/p95
+latency, SQL statements per request and peak Python memory per request.
+Results are written as JSON (to benchmarks/results/, which git ignores) so
+two runs can be compared.
+
+    python -m benchmarks.run --scales 1k,10k            generate data (cached) and benchmark
+    python -m benchmarks.run --db my.db --scale 10k     benchmark one existing database
+    python -m benchmarks.run --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.datagen import SCALES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class Workload:
+    """ Sample customers and search terms picked once per database. """
+
+    def __init__(self, conn, seed=7):
+        self.rng = random.Random(seed)
+        self.customers = conn.execute(
+            'SELECT "userId", phone, "userName" FROM user ORDER BY random() LIMIT 100').fetchall()
+        count = conn.execute('SELECT count(*) FROM user').fetchone()[0]
+        deep = conn.execute('SELECT date, id FROM user ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?',
+                            (max(count * 9 // 10 - 1, 0),)).fetchone()
+        self.deep_cursor = f"{deep[0]}_{deep[1]}" if deep else ''
+
+    def customer(self):
+        return self.rng.choice(self.customers)
+
+
+# name -> (method, build(workload) -> (url, form data))
+ROUTES = {
+    'home': ('GET', lambda w: ('/', None)),
+    'user_first_page': ('GET', lambda w: ('/user', None)),
+    'user_deep_page': ('GET', lambda w: (f'/user?cursor={w.deep_cursor}', None)),
+    'ledger': ('GET', lambda w: ('/ledger', None)),
+    'ledger_search': ('POST', lambda w: ('/ledger', {'search_query': w.customer()[2].split()[0]})),
+    'search_phone': ('POST', lambda w: ('/search', {'search_query': w.customer()[1][-5:]})),
+    'view': ('GET', lambda w: (f'/view/{w.customer()[0]}', None)),
+    'print': ('GET', lambda w: (f'/print/{w.customer()[0]}', None)),
+    'statement': ('GET', lambda w: (f'/statement/{w.customer()[0]}', None)),
+    'process_transaction': ('POST', lambda w: ('/process_transaction',
+                                               {'user_id': w.customer()[0], 'type': 'payment', 'amount': '1'})),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def benchmark(app, db, workload, repeat=50, routes=None):
+    """ {route: stats} for each route, measured in-process. """
+    from sqlalchemy import event
+
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    results = {}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        for name in routes or ROUTES:
+            method, build = ROUTES[name]
+
+            def request():
+                url, data = build(workload)
+                # A fresh client per request so flashed messages don't pile up in the cookie
+                response = app.test_client().open(url, method=method, data=data)
+                response.get_data()
+                return response.status_code
+
+            status = request()   # warm-up: template compile, caches, connections
+            timings, queries = [], []
+            for _ in range(repeat):
+                statements[0] = 0
+                start = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - start) * 1000)
+                queries.append(statements[0])
+
+            tracemalloc.start()
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[name] = {
+                'status': status,
+                'requests': repeat,
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p95_ms': round(percentile(timings, 95), 3),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+                'queries': round(sum(queries) / len(queries), 1),
+                'peak_kb': round(peak / 1024, 1),
+            }
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return results
+
+def run_single(db_path, scale, repeat, output):
+    # The app picks its database at import time
+    os.environ['TAILOR_DB_PATH'] = db_path
+    from app import app, db, run_migrations
+
+    run_migrations()
+    with sqlite3.connect(db_path) as conn:
+        workload = Workload(conn)
+        rows = conn.execute('SELECT count(*) FROM user').fetchone()[0]
+    report = {
+        'meta': {
+            'scale': scale,
+            'customers': rows,
+            'repeat': repeat,
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'commit': _git_commit(),
+        },
+        'routes': benchmark(app, db, workload, repeat),
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"📄 {output}")
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_report(report):
+    meta = report['meta']
+    print(f"\n== {meta['scale']} ({meta['customers']} customers, {meta['repeat']} requests/route) ==")
+    print(f"{'route':<22}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}{'peak KB':>10}")
+    for name, stats in report['routes'].items():
+        print(f"{name:<22}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['queries']:>10}{stats['peak_kb']:>10}")
+
+def compare(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)['routes']
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['routes']
+    print(f"{'route':<22}{'p50 old':>10}{'p50 new':>10}{'change':>9}{'queries':>14}")
+    for name in new:
+        if name not in old:
+            continue
+        before, after = old[name]['p50_ms'], new[name]['p50_ms']
+        change = f"{(after - before) / before * 100:+.0f}%" if before else 'n/a'
+        queries = f"{old[name]['queries']} -> {new[name]['queries']}"
+        print(f"{name:<22}{before:>10}{after:>10}{change:>9}{queries:>14}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1k,10k', help=f"comma-separated, from {', '.join(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'tailor-bench'),
+                        help='where generated databases are cached')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--db', help='benchmark this database only (in this process)')
+    parser.add_argument('--scale', default='custom', help='label for --db runs')
+    parser.add_argument('--output', help='result file for --db runs')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.db:
+        run_single(args.db, args.scale, args.repeat,
+                   args.output or os.path.join(args.output_dir, f"{stamp}-{args.scale}.json"))
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    for scale in args.scales.split(','):
+        template = os.path.join(args.data_dir, f"tailor-{scale}.db")
+        if not os.path.exists(template):
+            subprocess.run([sys.executable, '-m', 'benchmarks.datagen', '--scale', scale, '--db', template],
+                           check=True)
+        # Work on a copy: process_transaction writes to the database
+        working = os.path.join(args.data_dir, f"run-{scale}.db")
+        shutil.copyfile(template, working)
+        # Each scale runs in its own process because the app binds its database at import
+        subprocess.run([sys.executable, '-m', 'benchmarks.run', '--db', working, '--scale', scale,
+                        '--repeat', str(args.repeat),
+                        '--output', os.path.join(args.output_dir, f"{stamp}-{scale}.json")], check=True)
+        os.remove(working)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,149 @@
-import webview
-from threading import Thread
-from app import app  # Tera main Flask file (app.py) import kar
+""" Desktop launcher: the shop app in its own window.
+
+The window opens first with a splash page; the app itself (SQLAlchemy, the
+schema check) loads in the background and the window switches to it once
+the server answers requests. The server listens on a free port
+picked by the OS and uses waitress when it is installed, otherwise
+Werkzeug's threaded server.
+
+    python desktop.py            open the window
+    python desktop.py --serve    serve only, print the URL (no window)
+"""
+from time import perf_counter, sleep
+
+_started = perf_counter()
+
+import http.client
+import socket
+import sys
+import threading
+
+SERVER_THREADS = 8
+# Any answer to this request, even a 404, means the server is handling requests
+READY_PROBE = '/favicon.ico'
+
+SPLASH = """<!doctype html><html><body style="margin:0;height:100vh;display:flex;align-items:center;
+justify-content:center;font-family:sans-serif;background:#f5f5f5;color:#555">
+<h2>Tailor Management System &mdash; loading&hellip;</h2></body></html>"""
+
+
+class StartupTimer:
+    """ Time between named startup milestones, for the cold-start report. """
+
+    def __init__(self, start):
+        self.start = self.last = start
+        self.steps = []
+
+    def mark(self, label):
+        now = perf_counter()
+        self.steps.append((label, now - self.last))
+        self.last = now
+
+    def report(self):
+        parts = ", ".join(f"{label} {seconds:.2f}s" for label, seconds in self.steps)
+        return f"⏱️  Cold start {self.last - self.start:.2f}s: {parts}"
+
+
+def bind_free_port(host='127.0.0.1'):
+    """ A listening socket on a port the OS picked. Binding it here (not just
+    choosing a number) means nothing else can grab the port before we serve. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    sock.listen(128)
+    return sock
+
+def make_server(app, sock, threads=SERVER_THREADS):
+    """ (name, serve_forever, shutdown) for a multi-threaded server on `sock`. """
+    try:
+        from waitress.server import create_server
+    except ImportError:
+        from werkzeug.serving import make_server as make_werkzeug_server
+
+        host, port = sock.getsockname()
+        server = make_werkzeug_server(host, port, app, threaded=True, fd=sock.fileno())
+        return 'werkzeug (threaded)', server.serve_forever, server.shutdown
+
+    server = create_server(app, sockets=[sock], threads=threads)
+    return f'waitress ({threads} threads)', server.run, server.close
+
+def wait_until_serving(sock, ready, timeout=30):
+    """ Set `ready` once the server on `sock` answers a request. Connecting
+    alone proves nothing: the pre-bound socket accepts into its backlog before
+    the server runs, so the probe waits for a response. """
+    host, port = sock.getsockname()
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        conn = http.client.HTTPConnection(host, port, timeout=1)
+        try:
+            conn.request('HEAD', READY_PROBE)
+            conn.getresponse()
+        except OSError:
+            sleep(0.01)
+            continue
+        finally:
+            conn.close()
+        ready.set()
+        return
+
+def start_server(app, sock):
+    """ Serve `app` from a daemon thread; returns (name, ready event, shutdown).
+    The event is set once the server has answered a request. """
+    name, serve_forever, shutdown = make_server(app, sock)
+    ready = threading.Event()
+    threading.Thread(target=serve_forever, name='wsgi-server', daemon=True).start()
+    threading.Thread(target=wait_until_serving, args=(sock, ready), name='wsgi-ready', daemon=True).start()
+    return name, ready, shutdown
+
+def load_app(timer):
+    """ Import the app and bring the schema up to date (the slow part of startup). """
+    from app import app, print_migration_plan, run_migrations, start_backup_scheduler
+    timer.mark("import app")
+    print_migration_plan(run_migrations())
+    timer.mark("schema check")
+    start_backup_scheduler()
+    return app
+
+def boot(timer, sock, window=None):
+    if window is not None and window.events.shown.wait(10):
+        timer.mark("window shown")
+    app = load_app(timer)
+    name, ready, _ = start_server(app, sock)
+    ready.wait()
+    timer.mark("server ready")
+    host, port = sock.getsockname()
+    url = f'http://{host}:{port}/'
+    print(f"🌐 Serving on {url} with {name}")
+    if window is not None:
+        window.load_url(url)
+        window.events.loaded.wait(30)
+        timer.mark("first page")
+    print(timer.report())
+    return url
 
 if __name__ == '__main__':
-    # Flask ko background mein chala
-    t = Thread(target=app.run, kwargs={'debug': False, 'use_reloader': False, 'port': 5000})
-    t.daemon = True
-    t.start()
+    timer = StartupTimer(_started)
+    sock = bind_free_port()
+
+    if '--serve' in sys.argv:
+        boot(timer, sock)
+        try:
+            while True:
+                sleep(1)
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    import webview
+    timer.mark("import webview")
 
     # Desktop window khol (tera app browser jaisa dikhega)
-    webview.create_window(
+    window = webview.create_window(
         title='Tailor Management System',
-        url='http://127.0.0.1:5000',
+        html=SPLASH,
         width=1200,
         height=800,
         resizable=True,
         # Icon agar daalna hai to:
         # icon='static/icon.ico'   ← pehle .ico file bana ke yahan path daal
     )
-    webview.start()
-    
\ No newline at end of file
+    # boot runs in its own thread once the window is up
+    webview.start(boot, (timer, sock, window))
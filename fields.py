@@ -0,0 +1,228 @@
+""" The customer form fields, declared once.
+
+Every field the add/update forms submit is a Field: the column it fills,
+the table that column lives on, how the typed text is read, an optional
+validator, the Urdu label the pages show and, for the style fields, the
+choices offered. parse_form() reads and checks a whole form in one pass; the
+templates take labels, measurement rows and style choices from here, so the
+forms, the customer page and the printed sheet all list the same fields.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from migrations import parse_measurement
+
+# Phone format: 03XX-XXXXXXX (0, 3 digits, dash, 7 digits)
+PHONE_PATTERN = re.compile(r"^0\d{3}-\d{7}$")
+
+USER, ORDER, MEASUREMENTS = 'user', 'customer_order', 'measurement_set'
+
+# type is how the submitted text is read:
+#   text         stripped string ('' becomes the default)
+#   int, date    whole number / YYYY-MM-DD
+#   measurement  inches, see migrations.parse_measurement; text that is not a
+#                number is kept as typed (returned in `unparsed`), not rejected
+#   count        like measurement, but a whole number
+#   choices      several ticked values joined with ", "
+# validator(value) returns an error message or None; it only sees values that were given.
+Field = namedtuple('Field', 'name table type label validator default choices', defaults=(None, None, ()))
+
+# One option of a style field: the value stored, its caption, an icon under
+# static/icon/ or a symbol shown instead, and the caption on the printed sheet
+# when that one is shorter. `checked` is ticked on a new form; `otherwise` is
+# printed when the stored value is none of the choices (a value of None is
+# only printed, never offered on the form).
+Choice = namedtuple('Choice', 'value label icon symbol printed checked otherwise',
+                    defaults=(None, None, None, False, False))
+
+
+def _required(message):
+    return lambda value: message if value in (None, '') else None
+
+def _phone(value):
+    return None if PHONE_PATTERN.match(value) else 'Phone format must be 03XX-XXXXXXX'
+
+def _at_least_one(value):
+    return None if value >= 1 else 'Number of suits must be at least 1'
+
+
+REGISTRY = [
+    Field('userName', USER, 'text', 'نام', _required('Name is required')),
+    Field('phone', USER, 'text', 'فون نمبر', _phone, ''),
+    Field('numberOfSuit', USER, 'int', 'سوٹ کی تعداد', _at_least_one, 1),
+    Field('address', USER, 'text', 'پتہ', _required('Address is required')),
+    Field('date', USER, 'date', 'تاریخ', _required('Date is required')),
+    Field('price', USER, 'int', 'بقایا', None, 0),
+
+    Field('special_notes', ORDER, 'text', 'نوٹ'),
+
+    Field('lambhai', MEASUREMENTS, 'measurement', 'لمبائی'),
+    Field('tera', MEASUREMENTS, 'measurement', 'تیرا'),
+    Field('bazo', MEASUREMENTS, 'measurement', 'بازو'),
+    Field('collar', MEASUREMENTS, 'measurement', 'کالر'),
+    Field('chati', MEASUREMENTS, 'measurement', 'چھاتی'),
+    Field('kamar', MEASUREMENTS, 'measurement', 'کمر'),
+    Field('ghaihr', MEASUREMENTS, 'measurement', 'گیحر'),
+    Field('shalwar', MEASUREMENTS, 'measurement', 'شلوار'),
+    Field('poncha', MEASUREMENTS, 'measurement', 'پانچیہ'),
+    Field('ghair', MEASUREMENTS, 'measurement', 'گیر'),
+    Field('asan', MEASUREMENTS, 'measurement', 'اسن'),
+    Field('mora', MEASUREMENTS, 'measurement', 'موڑا'),
+    Field('darmyan', MEASUREMENTS, 'measurement', 'درمیان'),
+    Field('pocket_width', MEASUREMENTS, 'measurement', 'جیب کی چوڑائی'),
+    Field('pocket_size', MEASUREMENTS, 'measurement', 'جیب کی لمبائی'),
+    Field('size_collar', MEASUREMENTS, 'measurement', 'کلر کی پیمائش'),
+    Field('size_patti', MEASUREMENTS, 'measurement', 'پٹی کی چوڑائی'),
+    Field('size_cuff', MEASUREMENTS, 'measurement', 'کف کی چوڑائی'),
+    Field('kaj_count', MEASUREMENTS, 'count', 'کاج کی تعداد'),
+
+    Field('drzdar', MEASUREMENTS, 'text', 'درز دار', choices=(
+        Choice('Yes', 'ہاں'),
+        Choice('No', 'نہیں', checked=True),
+    )),
+    Field('style_collar', MEASUREMENTS, 'text', 'کلر کی انداز', choices=(
+        Choice('collar', 'کالر', 'collar.png', otherwise=True),
+        Choice('collarGoll', 'کالر گول', 'collarGoll.png'),
+        Choice('ban', 'بین', 'ban.png', checked=True),
+        Choice('benGoll', 'بین گول', 'benGoll.png'),
+        Choice('benChoras', 'بین چورس', 'benChoras.png'),
+        Choice('hindiGalla', 'ہندی گلہ', 'hindiGalla.png'),
+        Choice('SamneyHindiBackBen', 'ہندی بیگ بین', 'samneyHindiBackBen.png'),
+    )),
+    Field('style_patti', MEASUREMENTS, 'text', 'پٹی کی انداز', choices=(
+        Choice('samplePatti', 'سادہ پٹی', 'samplePatti.png', checked=True, otherwise=True),
+        Choice('roundPatti', 'گول پٹی', 'roundPatti.png'),
+        Choice('anglePatti', 'نکدار پٹی', 'anglePatti.png'),
+    )),
+    Field('style_cuff', MEASUREMENTS, 'text', 'کف کی انداز', choices=(
+        Choice('fetCuff', 'کف', 'fetCuff.png', checked=True, otherwise=True),
+        Choice('fetChuras', 'فٹ چورس کف', 'fetChuras.png', printed='فٹ چورس'),
+        Choice('cutCuff', 'کٹ کف', 'cutCuff.png'),
+        Choice('fitGollCuff', 'فٹ گول کف', 'fitGollCuff.png', printed='فٹ گول'),
+        Choice('fitCuff', 'فٹ کف', 'fitGollCuff.png'),
+        Choice('studCuff', 'سٹڈ کف', 'studCuff.png'),
+        Choice('gollBazo', 'گول بازو', 'gollBazo.png'),
+        Choice('kaniBazo', 'کنی بازو', 'kaniBazo.png'),
+    )),
+    Field('style_bazo', MEASUREMENTS, 'text', 'بازو کی انداز', choices=(
+        Choice('sholder', 'شولڈر', 'sholder.png', checked=True),
+    )),
+    Field('style_pocket', MEASUREMENTS, 'choices', 'سامنے جیب', choices=(
+        Choice('samplePocket', 'سادہ جیب', 'samplePocket.png', checked=True, otherwise=True),
+        Choice('flapPocket', 'فلپ جیب', 'flapPocket.png'),
+        Choice('nokdarPocket', 'نکدار جیب', 'nokdarPocket.png'),
+        Choice('None', 'سامنے جیب نہیں', symbol='❌', printed='سامنےجیب نہیں'),
+    )),
+    Field('side_pocket', MEASUREMENTS, 'text', 'سائیڈ جیب', choices=(
+        Choice('doubleSidePocket', 'ڈبل سایڈ جیب', 'doubleSidePocket.png', printed='ڈبل سائیڈ', checked=True),
+        Choice('ekSidePocket', 'ایک سایڈ جیب', 'ekSidePocket.png', printed='ایک سائیڈ'),
+        Choice(None, 'سائیڈ جیب', symbol='-', otherwise=True),
+    )),
+    Field('style_daman', MEASUREMENTS, 'text', 'دامن', choices=(
+        Choice('chorasDaman', 'چورس دامن', 'chorasDaman.png', checked=True, otherwise=True),
+        Choice('gollDaman', 'گول دامن', 'gollDaman.png'),
+    )),
+    Field('style_shalwar_pocket', MEASUREMENTS, 'text', 'شلوار جیب', choices=(
+        Choice('Side', 'شلوار جیب', 'pantPocket.png'),
+        Choice('None', 'شلوار جیب نہیں', symbol='❌', checked=True, otherwise=True),
+    )),
+    Field('design_button', MEASUREMENTS, 'text', 'بٹن', choices=(
+        Choice('sample_button', 'سادہ بٹن', checked=True),
+        Choice('steel_button', 'سٹیل بٹن'),
+        Choice('ring_button', 'رینگ بٹن'),
+        Choice('apple_button', 'بعیر کاج (ایپل بٹن)'),
+        Choice('goll_button', 'بعیر کاج (گول بٹن)', otherwise=True),
+    )),
+    Field('salai', MEASUREMENTS, 'text', 'سلائی', choices=(
+        Choice('single_salai', 'سنگل سلایئ', checked=True),
+        Choice('double_salai', 'ڈبل سلایئ'),
+        Choice('single_chamaktar', 'سنگل چمک تار'),
+        Choice('double_chamaktar', 'ڈبل چمک تار'),
+        Choice('triple_chamaktar', 'ٹرپل چمک تار'),
+        Choice('choka_salai', 'چوکہ سلا یئ'),
+        Choice('zanjari', 'زنجیریئ'),
+        Choice('ktk', 'KTK', otherwise=True),
+    )),
+]
+
+FIELDS = {field.name: field for field in REGISTRY}
+
+# The main measurement card, in the order it is written down
+CARD_FIELDS = [FIELDS[name] for name in ('lambhai', 'tera', 'bazo', 'collar', 'chati', 'kamar',
+                                         'ghaihr', 'shalwar', 'poncha', 'ghair', 'asan')]
+
+
+def names(table, types=None):
+    """ Names of the fields stored on `table`, optionally only those of some types. """
+    return tuple(field.name for field in REGISTRY if field.table == table and (types is None or field.type in types))
+
+def pick(values, table):
+    """ The part of parsed `values` that belongs on `table`. """
+    return {name: value for name, value in values.items() if FIELDS[name].table == table}
+
+def offered(field):
+    """ The choices a form shows for a style field. """
+    return [choice for choice in field.choices if choice.value is not None]
+
+def selected(field, value):
+    """ The choice value a form ticks for a stored `value`: its own, or the
+    preselected one when the value is empty or not offered any more. """
+    given = set(value.split(", ")) if field.type == 'choices' and value else {value}
+    for choice in offered(field):
+        if choice.value in given:
+            return choice.value
+    return next((choice.value for choice in field.choices if choice.checked), None)
+
+def _raw(form, field):
+    if field.type == 'choices' and hasattr(form, 'getlist'):
+        ticked = [value for value in form.getlist(field.name) if value]
+        return ", ".join(ticked) if ticked else None
+    value = form.get(field.name)
+    return value.strip() if isinstance(value, str) else value
+
+def parse_form(form, partial=False, only=None):
+    """ Read and validate the registered fields of a form (or any mapping) in one pass.
+
+    Returns (values, unparsed, errors): {name: value} for every field read,
+    {name: text as typed} for measurements that are not numbers, and a list of
+    error messages. With partial=True fields missing from the form are left
+    out rather than blanked, so an edit only touches what was submitted.
+    `only` limits parsing to some field names.
+    """
+    values, unparsed, errors = {}, {}, []
+    for field in REGISTRY:
+        if only is not None and field.name not in only:
+            continue
+        if partial and field.name not in form:
+            continue
+        raw = _raw(form, field)
+        if raw in (None, ''):
+            value = field.default
+        elif field.type in ('measurement', 'count'):
+            try:
+                value = parse_measurement(raw, whole=field.type == 'count')
+            except ValueError:
+                value = None
+                unparsed[field.name] = str(raw)
+        elif field.type == 'int':
+            try:
+                value = int(raw)
+            except (TypeError, ValueError):
+                errors.append(f"{field.label} must be a whole number")
+                continue
+        elif field.type == 'date':
+            try:
+                value = datetime.strptime(str(raw)[:10], '%Y-%m-%d').date()
+            except ValueError:
+                errors.append(f"{field.label} must be a date (YYYY-MM-DD)")
+                continue
+        else:
+            value = raw
+        if field.validator is not None:
+            error = field.validator(value)
+            if error:
+                errors.append(error)
+                continue
+        values[field.name] = value
+    return values, unparsed, errors
@@ -0,0 +1,121 @@
+""" In-process request metrics.
+
+Counters and histograms kept in memory and rendered in the Prometheus text
+exposition format. Every histogram also remembers its most recent samples,
+so p50/p95 over the last few hundred requests can be read without an
+external metrics server. Safe to share between request threads.
+"""
+import threading
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds in seconds, as in the Prometheus client defaults
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def rolling(self):
+        """ count/p50/p95/max over the recent samples. """
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {'samples': 0}
+        def pick(pct):
+            return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))]
+        return {'samples': len(ordered), 'p50': pick(50), 'p95': pick(95), 'max': ordered[-1]}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    def __init__(self, window=500, slow_log_size=50):
+        self.window = window
+        self._lock = threading.Lock()
+        # name -> (kind, help, buckets); series: name -> {labels tuple: Histogram | number}
+        self._families = {}
+        self._series = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+
+    def counter(self, name, help_text):
+        self._families[name] = ('counter', help_text, None)
+        self._series[name] = {}
+
+    def histogram(self, name, help_text, buckets=TIME_BUCKETS):
+        self._families[name] = ('histogram', help_text, tuple(buckets))
+        self._series[name] = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            if key not in series:
+                series[key] = Histogram(self._families[name][2], self.window)
+            series[key].observe(value)
+
+    def record_slow_query(self, **details):
+        with self._lock:
+            self.slow_queries.append(details)
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+            self.slow_queries.clear()
+
+    def render(self, gauges=(), counters=()):
+        """ Text exposition of every series, plus (name, help, value) gauges and counters read by the caller. """
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._families.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in sorted(self._series[name].items()):
+                    if kind == 'counter':
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        for kind, readings in (('gauge', gauges), ('counter', counters)):
+            for name, help_text, value in readings:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"]
+        return '\n'.join(lines) + '\n'
+
+    def rolling(self):
+        """ {histogram: {"label=value,...": {samples, p50, p95, max}}} over recent samples. """
+        with self._lock:
+            return {
+                name: {','.join(f"{k}={v}" for k, v in labels) or 'all': histogram.rolling()
+                       for labels, histogram in sorted(self._series[name].items())}
+                for name, (kind, _, _) in self._families.items() if kind == 'histogram'
+            }
@@ -0,0 +1,754 @@
+""" Versioned schema migrations for tailor.db.
+
+The schema version lives in SQLite's `PRAGMA user_version`, so a current
+database costs one integer read at startup. Pending migrations run in
+order inside a single transaction (SQLite DDL is transactional): either
+every step lands and the version is bumped, or nothing changes.
+
+To change the schema, append a migration to MIGRATIONS - never edit one
+that has already shipped.
+"""
+import json
+import math
+import re
+import sqlite3
+
+from sqlalchemy.dialects import sqlite as sqlite_dialect
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+
+class MigrationContext:
+    """ What a migration step gets: the cursor, DDL recording and schema lookups. """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        # True when the tables were just created from the models, so steps that
+        # only patch up old databases have nothing to do
+        self.fresh = False
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append(sql.strip())
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        """ Like execute, for data batches: the statement is recorded once however many batches run. """
+        if sql.strip() not in self.statements:
+            self.statements.append(sql.strip())
+        return self.cursor.executemany(sql, rows)
+
+    def has_table(self, name):
+        return self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+    def columns(self, table):
+        return {row[1] for row in self.cursor.execute(f'PRAGMA table_info("{table}")')}
+
+    def has_index_on(self, table, column):
+        """ True if some index on `table` starts with `column` (including UNIQUE autoindexes). """
+        for index in self.cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+            first = self.cursor.execute(f'PRAGMA index_info("{index[1]}")').fetchone()
+            if first and first[2] == column:
+                return True
+        return False
+
+
+# --- SEARCH INDEX ---
+# user_fts is an FTS5 table kept in sync with `user` by triggers. Phones are
+# indexed as their digits plus every suffix of 4+ digits, so a prefix query
+# like "4567*" also finds numbers that merely contain those digits.
+
+def _phone_parts_sql(row):
+    digits = f"replace({row}.phone, '-', '')"
+    suffixes = " || ' ' || ".join(f"substr({digits}, {start})" for start in range(2, 9))
+    return f"{row}.phone || ' ' || {digits} || ' ' || {suffixes}"
+
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5("
+    "userName, phone_parts, userId, address, tokenize = 'unicode61', prefix = '2 3 4')",
+    f"""CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON user BEGIN
+        INSERT INTO user_fts(rowid, userName, phone_parts, userId, address)
+        VALUES (new.id, new.userName, {_phone_parts_sql('new')}, new.userId, new.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON user BEGIN
+        DELETE FROM user_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF userName, phone, userId, address ON user BEGIN
+        DELETE FROM user_fts WHERE rowid = old.id;
+        INSERT INTO user_fts(rowid, userName, phone_parts, userId, address)
+        VALUES (new.id, new.userName, {_phone_parts_sql('new')}, new.userId, new.address);
+    END""",
+]
+
+SEARCH_INDEX_REBUILD = [
+    "DELETE FROM user_fts",
+    f"""INSERT INTO user_fts(rowid, userName, phone_parts, userId, address)
+        SELECT id, userName, {_phone_parts_sql('user')}, userId, address FROM user""",
+]
+
+# --- TYPEAHEAD CHANGE LOG ---
+# Every process keeps its own typeahead index (app.typeahead_index). Triggers
+# note each customer added, renamed or removed here, whoever wrote it - a
+# second counter, the CLI, sync, archive - and an index catches up by reading
+# the ids logged since it last looked. Only the newest CUSTOMER_CHANGES_KEPT
+# are kept; an index that fell further behind is built again.
+CUSTOMER_CHANGES_KEPT = 10000
+
+CUSTOMER_CHANGE_DDL = [
+    """CREATE TABLE IF NOT EXISTS customer_change (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS customer_change_ai AFTER INSERT ON user BEGIN
+        INSERT INTO customer_change (customer_id) VALUES (NEW.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customer_change_au AFTER UPDATE OF "userId", "userName", phone ON user BEGIN
+        INSERT INTO customer_change (customer_id) VALUES (NEW.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customer_change_ad AFTER DELETE ON user BEGIN
+        INSERT INTO customer_change (customer_id) VALUES (OLD.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS customer_change_trim AFTER INSERT ON customer_change BEGIN
+        DELETE FROM customer_change WHERE seq <= NEW.seq - {CUSTOMER_CHANGES_KEPT};
+    END""",
+]
+
+# --- DAILY ROLLUP ---
+# Rebuilds daily_rollup the way the app posts to it: each journal entry on the
+# day it was posted, and the rest of a customer (suits, and amounts not from
+# the journal) on the booking day - the latest order's date, or the
+# customer's date when there is no order.
+
+_ROLLUP_BACKFILL = """INSERT INTO daily_rollup (day, suits_booked, billed, received, pending)
+    SELECT day, sum(suits), sum(billed), sum(received), sum(pending) FROM (
+        SELECT coalesce((SELECT order_date FROM {orders} AS o WHERE o.customer_id = c.id
+                         ORDER BY o.id DESC LIMIT 1), c.date) AS day,
+               coalesce(c."numberOfSuit", 0) AS suits,
+               coalesce(c.total_amount, 0) - coalesce(j.debts, 0) AS billed,
+               coalesce(c.advance_payment, 0) - coalesce(j.payments, 0) AS received,
+               coalesce(c.price, 0) - coalesce(j.debts, 0) + coalesce(j.payments, 0) AS pending
+        FROM {customers} AS c LEFT JOIN (
+            SELECT customer_id, sum(CASE WHEN entry_type = 'add_debt' THEN amount ELSE 0 END) AS debts,
+                   sum(CASE WHEN entry_type = 'payment' THEN amount ELSE 0 END) AS payments
+            FROM {journal} GROUP BY customer_id) AS j ON j.customer_id = c.id
+        UNION ALL
+        SELECT date(created_at), 0, CASE WHEN entry_type = 'add_debt' THEN amount ELSE 0 END,
+               CASE WHEN entry_type = 'payment' THEN amount ELSE 0 END,
+               CASE WHEN entry_type = 'add_debt' THEN amount ELSE -amount END
+        FROM {journal} WHERE customer_id IN (SELECT id FROM {customers}))
+    WHERE true GROUP BY day
+    ON CONFLICT (day) DO UPDATE SET suits_booked = suits_booked + excluded.suits_booked,
+        billed = billed + excluded.billed, received = received + excluded.received,
+        pending = pending + excluded.pending"""
+
+DAILY_ROLLUP_BACKFILL = [
+    "DELETE FROM daily_rollup",
+    _ROLLUP_BACKFILL.format(customers='user', orders='customer_order', journal='ledger_entry'),
+]
+
+# --- ARCHIVE ---
+# Cold copies of user/ledger_entry for settled, inactive customers. They are
+# plain tables created from the live ones, plus archived_at; rows keep their
+# original ids so journal entries can be matched up on restore.
+
+ARCHIVE_TABLES = {'user': 'user_archive', 'ledger_entry': 'ledger_entry_archive'}
+
+# Adds archived customers on top of DAILY_ROLLUP_BACKFILL
+ARCHIVED_ROLLUP_BACKFILL = _ROLLUP_BACKFILL.format(customers='user_archive', orders='customer_order_archive',
+                                                   journal='ledger_entry_archive')
+
+# Keep the running totals and one day's rollup row in step with a change
+LEDGER_TOTALS_ADJUST = """UPDATE ledger_totals SET total_receivable = total_receivable + :receivable,
+    total_received = total_received + :received, total_pending = total_pending + :pending WHERE id = 1"""
+DAILY_ROLLUP_ADJUST = """INSERT INTO daily_rollup (day, suits_booked, billed, received, pending)
+    VALUES (:day, :suits, :billed, :received, :pending)
+    ON CONFLICT (day) DO UPDATE SET suits_booked = suits_booked + excluded.suits_booked,
+        billed = billed + excluded.billed, received = received + excluded.received,
+        pending = pending + excluded.pending"""
+
+# --- RECEIVABLES ---
+# Queries must spell the condition as the literal `price > 0` for SQLite to use it
+DEBTORS_INDEX_DDL = ('CREATE INDEX IF NOT EXISTS ix_user_debtors ON user (price, last_activity, date) '
+                     'WHERE price > 0')
+# Migrations 9 and 12 run before user has last_activity and build the index as it was then
+_DEBTORS_BY_EDIT_INDEX_DDL = ('CREATE INDEX IF NOT EXISTS ix_user_debtors ON user (price, updated_at, date) '
+                              'WHERE price > 0')
+# A customer's last booking or journal posting, which is what debtors are aged by.
+# Edits do not count: fixing an address must not make an old debt look new.
+LAST_ACTIVITY_REFRESH = """UPDATE user SET last_activity = max(
+    coalesce((SELECT order_date FROM customer_order WHERE customer_id = user.id ORDER BY id DESC LIMIT 1), date),
+    coalesce((SELECT date(max(created_at)) FROM ledger_entry WHERE customer_id = user.id), date))"""
+
+# --- SYNC LOG ---
+# Change capture for syncing shops (see sync.py). Triggers write one sync_log
+# row per insert, update or delete on `user` and per ledger_entry posted,
+# tagged with this shop's site id, its own sequence number and a clock in
+# milliseconds that never goes back past a change already logged. Money
+# columns are logged as the amount added or taken off, the rest as new
+# values (only those that changed). Setting sync_site.capture to 0 inside a
+# transaction keeps its writes out of the log (archiving, applying bundles).
+
+SYNC_FIELDS = ('userName', 'phone', 'address', 'numberOfSuit', 'date')
+SYNC_MONEY = ('price', 'total_amount', 'advance_payment')
+
+_SYNC_CLOCK = ("max(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER), "
+               "coalesce((SELECT max(clock) FROM sync_log), 0) + 1)")
+
+def _sync_log_insert(op, user_id, data):
+    return f"""INSERT INTO sync_log (origin, origin_seq, clock, op, user_id, data)
+        SELECT site_id, coalesce((SELECT max(origin_seq) FROM sync_log WHERE origin = site_id), 0) + 1,
+               {_SYNC_CLOCK}, '{op}', {user_id}, {data}
+        FROM sync_site WHERE capture = 1;"""
+
+def _quoted(column):
+    return f'"{column}"'
+
+_SYNC_NEW_ROW = "json_object({})".format(", ".join(
+    [f"'{name}', NEW.{_quoted(name)}" for name in SYNC_FIELDS]
+    + [f"'{name}', coalesce(NEW.{name}, 0)" for name in SYNC_MONEY]))
+# Every field and money delta, minus those that did not change
+_SYNC_CHANGES = "json_remove(json_object({}), {})".format(
+    ", ".join([f"'{name}', NEW.{_quoted(name)}" for name in SYNC_FIELDS]
+              + [f"'{name}', coalesce(NEW.{name}, 0) - coalesce(OLD.{name}, 0)" for name in SYNC_MONEY]),
+    ", ".join([f"CASE WHEN NEW.{_quoted(name)} IS OLD.{_quoted(name)} THEN '$.{name}' ELSE '$.unchanged' END"
+               for name in SYNC_FIELDS]
+              + [f"CASE WHEN coalesce(NEW.{name}, 0) = coalesce(OLD.{name}, 0) THEN '$.{name}' "
+                 f"ELSE '$.unchanged' END" for name in SYNC_MONEY]))
+_SYNC_ANY_CHANGE = " OR ".join([f"NEW.{_quoted(name)} IS NOT OLD.{_quoted(name)}" for name in SYNC_FIELDS]
+                               + [f"coalesce(NEW.{name}, 0) != coalesce(OLD.{name}, 0)" for name in SYNC_MONEY])
+
+SYNC_LOG_DDL = [
+    """CREATE TABLE IF NOT EXISTS sync_site (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        site_id TEXT NOT NULL,
+        capture INTEGER NOT NULL DEFAULT 1)""",
+    "INSERT OR IGNORE INTO sync_site (id, site_id) VALUES (1, lower(hex(randomblob(4))))",
+    """CREATE TABLE IF NOT EXISTS sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        origin_seq INTEGER NOT NULL,
+        clock INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        -- Site id of the bundle a remote change came in (NULL for changes made here)
+        received_from TEXT)""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_sync_log_origin ON sync_log (origin, origin_seq)",
+    "CREATE INDEX IF NOT EXISTS ix_sync_log_user_id ON sync_log (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_sync_log_clock ON sync_log (clock)",
+    # Local sync_log seq already written to bundles for each peer (by site id)
+    """CREATE TABLE IF NOT EXISTS sync_peer (
+        peer TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL DEFAULT 0,
+        exported_at DATETIME)""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_user_ai AFTER INSERT ON user BEGIN
+        {_sync_log_insert('insert', 'NEW."userId"', _SYNC_NEW_ROW)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_user_au AFTER UPDATE ON user WHEN {_SYNC_ANY_CHANGE} BEGIN
+        {_sync_log_insert('update', 'NEW."userId"', _SYNC_CHANGES)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_user_ad AFTER DELETE ON user BEGIN
+        {_sync_log_insert('delete', 'OLD."userId"', "'{}'")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_ledger_entry_ai AFTER INSERT ON ledger_entry BEGIN
+        {_sync_log_insert('entry', '(SELECT "userId" FROM user WHERE id = NEW.customer_id)',
+                          "json_object('entry_type', NEW.entry_type, 'amount', NEW.amount, "
+                          "'created_at', NEW.created_at)")}
+    END""",
+]
+
+# --- ORDERS AND MEASUREMENTS ---
+# Measurements and style choices live in measurement_set (one row per time a
+# customer was measured) and bookings in customer_order; `user` keeps the
+# identity and money columns. Measurements are stored as numbers of inches.
+# The card is typed by hand, so "15,5", "2 3/4" and "3/4" are understood, and
+# anything that still isn't a number is kept as typed in `unparsed` (JSON).
+
+MEASUREMENT_COLUMNS = ('lambhai', 'tera', 'bazo', 'collar', 'chati', 'kamar', 'ghaihr', 'shalwar', 'poncha',
+                       'ghair', 'asan', 'mora', 'darmyan', 'pocket_width', 'pocket_size',
+                       'size_collar', 'size_patti', 'size_cuff')
+# Whole numbers
+COUNT_COLUMNS = ('kaj_count',)
+STYLE_COLUMNS = ('drzdar', 'style_collar', 'style_cuff', 'style_pocket', 'style_patti', 'style_daman',
+                 'style_shalwar_pocket', 'style_bazo', 'side_pocket', 'design_button', 'salai')
+
+# Columns `user` keeps after the split; the rest moved out or were never used
+CUSTOMER_COLUMNS = ('id', 'userId', 'userName', 'phone', 'numberOfSuit', 'address', 'date',
+                    'price', 'total_amount', 'advance_payment', 'row_version', 'updated_at')
+# Added to `user` after the split
+LATER_CUSTOMER_COLUMNS = ('last_activity',)
+# AUTOINCREMENT: an archived customer's id must never be given to a new one
+CUSTOMER_TABLE_DDL = """CREATE TABLE {name} (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    "userId" VARCHAR(20) NOT NULL UNIQUE,
+    "userName" VARCHAR(100) NOT NULL,
+    phone VARCHAR(20) NOT NULL,
+    "numberOfSuit" INTEGER NOT NULL,
+    address VARCHAR(200) NOT NULL,
+    date DATE NOT NULL,
+    price INTEGER,
+    total_amount INTEGER,
+    advance_payment INTEGER,
+    row_version INTEGER DEFAULT '1' NOT NULL,
+    updated_at DATETIME
+)"""
+
+# Archive copies of the per-customer tables, next to ARCHIVE_TABLES
+ORDER_ARCHIVE_TABLES = {'customer_order': 'customer_order_archive', 'measurement_set': 'measurement_set_archive'}
+
+# Customers converted per batch when splitting the old wide rows
+SPLIT_BATCH_SIZE = 500
+
+# --- SYNC LOG: ORDERS AND MEASUREMENTS ---
+# Orders and measurement cards travel between shops too (migration 13). Order
+# fields are logged like the customer's, only those that changed; a new
+# measurement set is logged whole. Changes that cannot be applied because the
+# customer ID belongs to a different customer here wait in sync_conflict, and
+# sync_peer learns what each peer has acknowledged receiving.
+
+SYNC_ORDER_FIELDS = ('order_date', 'suits', 'special_notes')
+SYNC_MEASUREMENT_COLUMNS = ('taken_at', 'unparsed') + MEASUREMENT_COLUMNS + COUNT_COLUMNS + STYLE_COLUMNS
+
+_SYNC_CUSTOMER_ID = '(SELECT "userId" FROM user WHERE id = NEW.customer_id)'
+_SYNC_ORDER_CHANGES = "json_remove(json_object({}), {})".format(
+    ", ".join(f"'{name}', NEW.{name}" for name in SYNC_ORDER_FIELDS),
+    ", ".join(f"CASE WHEN NEW.{name} IS OLD.{name} THEN '$.{name}' ELSE '$.unchanged' END"
+              for name in SYNC_ORDER_FIELDS))
+
+SYNC_ORDERS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS sync_customer_order_ai AFTER INSERT ON customer_order BEGIN
+        {_sync_log_insert('order', _SYNC_CUSTOMER_ID,
+                          "json_object({})".format(", ".join(f"'{name}', NEW.{name}" for name in SYNC_ORDER_FIELDS)))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_customer_order_au AFTER UPDATE ON customer_order
+        WHEN {" OR ".join(f"NEW.{name} IS NOT OLD.{name}" for name in SYNC_ORDER_FIELDS)} BEGIN
+        {_sync_log_insert('order', _SYNC_CUSTOMER_ID, _SYNC_ORDER_CHANGES)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS sync_measurement_set_ai AFTER INSERT ON measurement_set BEGIN
+        {_sync_log_insert('measurements', _SYNC_CUSTOMER_ID,
+                          "json_object({})".format(", ".join(f"'{name}', NEW.{name}"
+                                                             for name in SYNC_MEASUREMENT_COLUMNS)))}
+    END""",
+    """CREATE TABLE IF NOT EXISTS sync_conflict (
+        origin TEXT NOT NULL,
+        origin_seq INTEGER NOT NULL,
+        clock INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        received_from TEXT,
+        held_at DATETIME,
+        PRIMARY KEY (origin, origin_seq))""",
+    "CREATE INDEX IF NOT EXISTS ix_sync_conflict_user_id ON sync_conflict (user_id)",
+]
+
+# --- SYNC LOG: CUSTOMER IDENTITY ---
+# A customer ID can name different people at two shops (customers typed in
+# before the shops synced, or by hand under another shop's prefix), so a
+# customer is known across shops by the (origin, origin_seq) of its logged
+# insert, and every change in a bundle carries it (migration 16). Changes
+# whose customer is a different one here, or not here yet, wait in
+# sync_conflict; customers that lost their ID to another (flask sync-resolve)
+# are listed in sync_retired and their later changes are dropped.
+#
+# SYNC_SEED logs an insert for every customer that has none - customers from
+# before the log, or renumbered when they lost their ID - and the latest order
+# and measurement card of customers added here that have none logged since.
+
+# Local seq of the insert the customer's current row was logged under
+_SYNC_BORN = """(SELECT max(seq) FROM sync_log WHERE sync_log.user_id = user."userId" AND op = 'insert')"""
+_SYNC_SEED_SEQ = ("(SELECT coalesce(max(origin_seq), 0) FROM sync_log WHERE origin = site_id) "
+                  "+ row_number() OVER (ORDER BY user.id)")
+_SYNC_SEED_LATEST = """FROM user JOIN {table} ON {table}.id = (
+            SELECT max(id) FROM {table} WHERE customer_id = user.id), sync_site
+        WHERE (SELECT origin FROM sync_log WHERE seq = {born}) = site_id
+          AND NOT EXISTS (SELECT 1 FROM sync_log WHERE sync_log.user_id = user."userId" AND op = '{kind}'
+                          AND seq > {born})"""
+
+SYNC_SEED = [
+    f"""INSERT INTO sync_log (origin, origin_seq, clock, op, user_id, data)
+        SELECT site_id, {_SYNC_SEED_SEQ}, {_SYNC_CLOCK}, 'insert', "userId", {_SYNC_NEW_ROW.replace('NEW.', 'user.')}
+        FROM user, sync_site WHERE {_SYNC_BORN} IS NULL""",
+    f"""INSERT INTO sync_log (origin, origin_seq, clock, op, user_id, data)
+        SELECT site_id, {_SYNC_SEED_SEQ}, {_SYNC_CLOCK}, 'order', "userId",
+               json_object({", ".join(f"'{name}', customer_order.{name}" for name in SYNC_ORDER_FIELDS)})
+        {_SYNC_SEED_LATEST.format(kind='order', table='customer_order', born=_SYNC_BORN)}""",
+    f"""INSERT INTO sync_log (origin, origin_seq, clock, op, user_id, data)
+        SELECT site_id, {_SYNC_SEED_SEQ}, {_SYNC_CLOCK}, 'measurements', "userId",
+               json_object({", ".join(f"'{name}', measurement_set.{name}" for name in SYNC_MEASUREMENT_COLUMNS)})
+        {_SYNC_SEED_LATEST.format(kind='measurements', table='measurement_set', born=_SYNC_BORN)}""",
+]
+
+SYNC_IDENTITY_DDL = [
+    """CREATE TABLE IF NOT EXISTS sync_retired (
+        origin TEXT NOT NULL,
+        origin_seq INTEGER NOT NULL,
+        user_id TEXT NOT NULL,
+        retired_at DATETIME,
+        PRIMARY KEY (origin, origin_seq))""",
+    "CREATE INDEX IF NOT EXISTS ix_sync_conflict_born ON sync_conflict (born_origin, born_seq)",
+]
+
+_FRACTION = re.compile(r"^(?:(\d+(?:\.\d+)?)\s+)?(\d+)\s*/\s*(\d+)$")
+
+def parse_measurement(value, whole=False):
+    """ A typed measurement as a number: "15", "15.5", "15,5", "2 3/4", "3/4".
+    None when blank; ValueError when it isn't a number (or not whole, if required). """
+    text = '' if value is None else str(value).strip().replace(',', '.')
+    if not text:
+        return None
+    match = _FRACTION.match(text)
+    if match:
+        integral, numerator, denominator = match.groups()
+        if int(denominator) == 0:
+            raise ValueError(f"not a measurement: {value}")
+        number = float(integral or 0) + int(numerator) / int(denominator)
+    else:
+        number = float(text)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"not a measurement: {value}")
+    if whole:
+        if not number.is_integer():
+            raise ValueError(f"not a whole number: {value}")
+        return int(number)
+    return number
+
+def convert_measurements(values):
+    """ ({column: number or None}, {column: text as typed}) for the measurement and
+    count columns in `values`; the second dict holds what could not be read as a number. """
+    numbers, unparsed = {}, {}
+    for name in MEASUREMENT_COLUMNS + COUNT_COLUMNS:
+        try:
+            numbers[name] = parse_measurement(values.get(name), whole=name in COUNT_COLUMNS)
+        except ValueError:
+            numbers[name] = None
+            unparsed[name] = str(values[name]).strip()
+    return numbers, unparsed
+
+
+# --- MIGRATIONS ---
+
+def _legacy_columns(ctx):
+    """ Columns added to `user` over time (formerly update_database_schema and fix_db.py). """
+    if ctx.fresh:
+        return
+    legacy_columns = [
+        ("lambhai", "VARCHAR(50)"),
+        ("tera", "VARCHAR(50)"),
+        ("bazo", "VARCHAR(50)"),
+        ("chati", "VARCHAR(50)"),
+        ("kamar", "VARCHAR(50)"),
+        ("ghaihr", "VARCHAR(50)"),
+        ("shalwar", "VARCHAR(50)"),
+        ("ghair", "VARCHAR(50)"),
+        ("drzdar", "VARCHAR(50)"),
+        ("price", "INTEGER"),
+        ("mora", "VARCHAR(50)"),
+        ("darmyan", "VARCHAR(50)"),
+        ("pocket_width", "VARCHAR(50)"),
+        ("kaj_count", "VARCHAR(50)"),
+        ("style_patti", "VARCHAR(50)"),
+        ("pocket_size", "VARCHAR(50)"),
+        ("style_bazo", "VARCHAR(50)"),
+        ("side_pocket", "VARCHAR(50)"),
+        ("design_button", "VARCHAR(50)"),
+        ("salai", "VARCHAR(50)"),
+        ("total_amount", "INTEGER DEFAULT 0"),
+        ("advance_payment", "INTEGER DEFAULT 0"),
+        ("remaining_balance", "INTEGER DEFAULT 0"),
+    ]
+    existing = ctx.columns('user')
+    for name, sql_type in legacy_columns:
+        if name not in existing:
+            ctx.execute(f'ALTER TABLE user ADD COLUMN {name} {sql_type}')
+
+def _lookup_indexes(ctx):
+    """ Secondary indexes the list, ledger, search and lookup routes depend on. """
+    ctx.execute('CREATE INDEX IF NOT EXISTS ix_user_date_id ON user (date, id)')
+    ctx.execute('CREATE INDEX IF NOT EXISTS ix_user_phone ON user (phone)')
+    ctx.execute('CREATE INDEX IF NOT EXISTS "ix_user_userName" ON user ("userName")')
+    # userId is normally covered by its UNIQUE constraint's autoindex
+    if not ctx.has_index_on('user', 'userId'):
+        ctx.execute('CREATE UNIQUE INDEX "ix_user_userId" ON user ("userId")')
+
+def _search_index(ctx):
+    """ FTS5 customer search index; skipped when SQLite lacks FTS5. """
+    try:
+        ctx.execute(SEARCH_INDEX_DDL[0])
+    except sqlite3.OperationalError:
+        ctx.statements.pop()
+        print("⚠️  FTS5 is not available; customer search will use basic matching.")
+        return
+    for statement in SEARCH_INDEX_DDL[1:] + SEARCH_INDEX_REBUILD:
+        ctx.execute(statement)
+
+def _id_sequence(ctx):
+    """ Seed the customer ID counter from the highest numeric AS id in use. """
+    ctx.execute("""INSERT OR IGNORE INTO id_sequence (prefix, last_value)
+        SELECT 'AS', coalesce(max(CAST(substr("userId", 3) AS INTEGER)), 0)
+        FROM user WHERE "userId" GLOB 'AS[0-9]*'""")
+
+def _row_version(ctx):
+    """ Change-tracking columns behind the view/print page cache. """
+    existing = ctx.columns('user')
+    if 'row_version' not in existing:
+        ctx.execute('ALTER TABLE user ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1')
+    if 'updated_at' not in existing:
+        ctx.execute('ALTER TABLE user ADD COLUMN updated_at DATETIME')
+
+def _daily_rollup(ctx):
+    """ Backfill the daily rollup behind the reports page. """
+    for statement in DAILY_ROLLUP_BACKFILL:
+        ctx.execute(statement)
+
+def _archive_tables(ctx):
+    """ Archive tables for customers moved out of the working set. """
+    for table, archive in ARCHIVE_TABLES.items():
+        if not ctx.has_table(archive):
+            ctx.execute(f'CREATE TABLE {archive} AS SELECT * FROM {table} WHERE 0')
+    ctx.execute('ALTER TABLE user_archive ADD COLUMN archived_at DATETIME')
+    ctx.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_user_archive_id ON user_archive (id)')
+    ctx.execute('CREATE INDEX IF NOT EXISTS "ix_user_archive_userId" ON user_archive ("userId")')
+    ctx.execute('CREATE INDEX IF NOT EXISTS ix_user_archive_phone ON user_archive (phone)')
+    ctx.execute('CREATE INDEX IF NOT EXISTS ix_ledger_entry_archive_customer_id '
+                'ON ledger_entry_archive (customer_id, id)')
+
+def _split_rows(ctx, source, order_table, measurement_table, ids):
+    """ One order and one measurement set per row of the wide `source` table, in batches.
+    `ids` holds the next order and measurement ids, shared between the live and archive tables. """
+    available = ctx.columns(source)
+    wanted = ('date', 'numberOfSuit', 'special_notes', 'updated_at') + MEASUREMENT_COLUMNS + COUNT_COLUMNS + STYLE_COLUMNS
+    # Very old databases lack some of the columns; they read as empty
+    select_list = ", ".join(f'"{name}"' if name in available else f'NULL AS "{name}"' for name in wanted)
+    measurement_columns = MEASUREMENT_COLUMNS + COUNT_COLUMNS + STYLE_COLUMNS
+    insert_order = (f'INSERT INTO {order_table} (id, customer_id, order_date, suits, special_notes, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)')
+    insert_measurements = (
+        f'INSERT INTO {measurement_table} (id, customer_id, taken_at, unparsed, '
+        f'{", ".join(measurement_columns)}) VALUES ({", ".join("?" * (len(measurement_columns) + 4))})')
+
+    last_id = 0
+    while True:
+        batch = ctx.cursor.execute(f'SELECT id, {select_list} FROM {source} WHERE id > ? ORDER BY id LIMIT ?',
+                                   (last_id, SPLIT_BATCH_SIZE)).fetchall()
+        if not batch:
+            return
+        orders, measurements = [], []
+        for customer_id, *row in batch:
+            values = dict(zip(wanted, row))
+            taken_at = values['updated_at'] or values['date']
+            orders.append((ids['order'], customer_id, values['date'], values['numberOfSuit'] or 1,
+                           values['special_notes'] or None, taken_at))
+            numbers, unparsed = convert_measurements(values)
+            measurements.append((ids['measurement'], customer_id, taken_at,
+                                 json.dumps(unparsed, ensure_ascii=False) if unparsed else None,
+                                 *(numbers[name] for name in MEASUREMENT_COLUMNS + COUNT_COLUMNS),
+                                 *(values[name] for name in STYLE_COLUMNS)))
+            ids['order'] += 1
+            ids['measurement'] += 1
+        ctx.executemany(insert_order, orders)
+        ctx.executemany(insert_measurements, measurements)
+        last_id = batch[-1][0]
+
+def _split_customer_tables(ctx):
+    """ Move orders and measurements out of the wide user rows into their own tables. """
+    for table, archive in ORDER_ARCHIVE_TABLES.items():
+        if not ctx.has_table(archive):
+            ctx.execute(f'CREATE TABLE {archive} AS SELECT * FROM {table} WHERE 0')
+        ctx.execute(f'CREATE INDEX IF NOT EXISTS ix_{archive}_customer_id ON {archive} (customer_id, id)')
+    if set(ctx.columns('user')) <= set(CUSTOMER_COLUMNS + LATER_CUSTOMER_COLUMNS):
+        return
+
+    ids = {'order': ctx.cursor.execute('SELECT coalesce(max(id), 0) + 1 FROM customer_order').fetchone()[0],
+           'measurement': ctx.cursor.execute('SELECT coalesce(max(id), 0) + 1 FROM measurement_set').fetchone()[0]}
+    _split_rows(ctx, 'user', 'customer_order', 'measurement_set', ids)
+    _split_rows(ctx, 'user_archive', 'customer_order_archive', 'measurement_set_archive', ids)
+
+    # Rebuild user with only the columns it keeps (dropping user also drops its indexes and search triggers)
+    columns = ", ".join(f'"{name}"' for name in CUSTOMER_COLUMNS)
+    ctx.execute(CUSTOMER_TABLE_DDL.format(name='user_narrow'))
+    ctx.execute(f'INSERT INTO user_narrow ({columns}) SELECT {columns} FROM user')
+    ctx.execute('DROP TABLE user')
+    ctx.execute('ALTER TABLE user_narrow RENAME TO user')
+    _lookup_indexes(ctx)
+    if ctx.has_table('user_fts'):
+        for statement in SEARCH_INDEX_DDL[1:]:
+            ctx.execute(statement)
+
+    archived = ctx.columns('user_archive')
+    archive_columns = ", ".join(f'"{name}"' if name in archived else f'NULL AS "{name}"'
+                                for name in CUSTOMER_COLUMNS)
+    ctx.execute(f'CREATE TABLE user_archive_narrow AS SELECT {archive_columns}, archived_at FROM user_archive')
+    ctx.execute('DROP TABLE user_archive')
+    ctx.execute('ALTER TABLE user_archive_narrow RENAME TO user_archive')
+    ctx.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_user_archive_id ON user_archive (id)')
+    ctx.execute('CREATE INDEX IF NOT EXISTS "ix_user_archive_userId" ON user_archive ("userId")')
+    ctx.execute('CREATE INDEX IF NOT EXISTS ix_user_archive_phone ON user_archive (phone)')
+
+def _debtors_index(ctx):
+    """ Partial index over customers who still owe (price is the outstanding
+    balance). It holds every column the aging report groups on, so the report
+    reads only the debtors and never the whole table. """
+    ctx.execute(_DEBTORS_BY_EDIT_INDEX_DDL)
+
+def _sync_log(ctx):
+    """ Change log, site id and capture triggers for syncing shops. Existing
+    customers are not logged: shops that already share them by hand keep
+    their copies, and only changes from here on travel. """
+    for statement in SYNC_LOG_DDL:
+        ctx.execute(statement)
+
+def _rebuild_daily_rollup(ctx):
+    """ Rebuild the rollup with bookings on their order date and journal
+    entries on the day they were posted. Adding remaining used to move a
+    customer's date, and later edits and deletes were reversed on that day. """
+    for statement in DAILY_ROLLUP_BACKFILL + [ARCHIVED_ROLLUP_BACKFILL]:
+        ctx.execute(statement)
+
+def _customer_id_sequence(ctx):
+    """ Stop customer ids from being reused. Without AUTOINCREMENT SQLite gave
+    the highest id to the next new customer once that row was archived, and
+    archiving the newcomer then clashed with the archived copy. Archived
+    customers whose id is already taken again get a new one. """
+    table_sql = ctx.cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'user'").fetchone()[0]
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        columns = ", ".join(f'"{name}"' for name in CUSTOMER_COLUMNS)
+        ctx.execute(CUSTOMER_TABLE_DDL.format(name='user_keyed'))
+        ctx.execute(f'INSERT INTO user_keyed ({columns}) SELECT {columns} FROM user')
+        # Recreated below, once user is back
+        ctx.execute('DROP TRIGGER IF EXISTS sync_ledger_entry_ai')
+        ctx.execute('DROP TABLE user')
+        ctx.execute('ALTER TABLE user_keyed RENAME TO user')
+        _lookup_indexes(ctx)
+        ctx.execute(_DEBTORS_BY_EDIT_INDEX_DDL)
+        if ctx.has_table('user_fts'):
+            for statement in SEARCH_INDEX_DDL[1:]:
+                ctx.execute(statement)
+        for statement in SYNC_LOG_DDL:
+            ctx.execute(statement)
+
+    top = ctx.cursor.execute('SELECT max(coalesce((SELECT max(id) FROM user), 0), '
+                             'coalesce((SELECT max(id) FROM user_archive), 0))').fetchone()[0]
+    clashes = [row[0] for row in ctx.cursor.execute(
+        'SELECT id FROM user_archive WHERE id IN (SELECT id FROM user) ORDER BY id').fetchall()]
+    renumbered = [(top + n, old_id) for n, old_id in enumerate(clashes, start=1)]
+    if renumbered:
+        ctx.executemany('UPDATE user_archive SET id = ? WHERE id = ?', renumbered)
+        for table, archive in {**ARCHIVE_TABLES, **ORDER_ARCHIVE_TABLES}.items():
+            if table != 'user':
+                ctx.executemany(f'UPDATE {archive} SET customer_id = ? WHERE customer_id = ?', renumbered)
+        top += len(renumbered)
+    ctx.execute("DELETE FROM sqlite_sequence WHERE name = 'user'")
+    ctx.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('user', ?)", (top,))
+
+def _sync_orders(ctx):
+    """ Log order and measurement changes, hold clashing changes, and record
+    acknowledgements so a lost bundle is sent again. """
+    for statement in SYNC_ORDERS_DDL:
+        ctx.execute(statement)
+    existing = ctx.columns('sync_peer')
+    # Highest local seq the peer has confirmed, and highest seq of the peer's we have
+    for column in ('acked_seq', 'received_seq'):
+        if column not in existing:
+            ctx.execute(f'ALTER TABLE sync_peer ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+
+def _last_activity(ctx):
+    """ Age debtors by their last booking or journal posting instead of
+    updated_at, which every edit (and every synced change) moves. """
+    if 'last_activity' not in ctx.columns('user'):
+        ctx.execute('ALTER TABLE user ADD COLUMN last_activity DATE')
+    ctx.execute(LAST_ACTIVITY_REFRESH)
+    ctx.execute('DROP INDEX IF EXISTS ix_user_debtors')
+    ctx.execute(DEBTORS_INDEX_DDL)
+
+def _customer_change_log(ctx):
+    """ Log customer adds, renames and removals so every process's typeahead index sees them. """
+    for statement in CUSTOMER_CHANGE_DDL:
+        ctx.execute(statement)
+
+def _sync_identity(ctx):
+    """ Note which customer each held change belongs to, and log an insert for
+    the customers from before the sync log (migration 10 left them out), so
+    they reach the other shops and changes to them can be matched. """
+    if 'born_origin' not in ctx.columns('sync_conflict'):
+        ctx.execute('ALTER TABLE sync_conflict ADD COLUMN born_origin TEXT')
+        ctx.execute('ALTER TABLE sync_conflict ADD COLUMN born_seq INTEGER')
+        # Changes held so far belong to the customer whose insert was held with them
+        ctx.execute("""UPDATE sync_conflict SET
+            born_origin = (SELECT held.origin FROM sync_conflict held WHERE held.user_id = sync_conflict.user_id
+                           AND held.op = 'insert' ORDER BY held.clock DESC LIMIT 1),
+            born_seq = (SELECT held.origin_seq FROM sync_conflict held WHERE held.user_id = sync_conflict.user_id
+                        AND held.op = 'insert' ORDER BY held.clock DESC LIMIT 1)""")
+    for statement in SYNC_IDENTITY_DDL + SYNC_SEED:
+        ctx.execute(statement)
+
+MIGRATIONS = [
+    (1, "Add legacy measurement, style and money columns", _legacy_columns),
+    (2, "Create secondary indexes on user", _lookup_indexes),
+    (3, "Create the FTS5 customer search index", _search_index),
+    (4, "Seed the customer ID sequence", _id_sequence),
+    (5, "Add row_version and updated_at to user", _row_version),
+    (6, "Backfill the daily rollup", _daily_rollup),
+    (7, "Create the customer archive tables", _archive_tables),
+    (8, "Split orders and measurements out of user", _split_customer_tables),
+    (9, "Create the partial index on outstanding balances", _debtors_index),
+    (10, "Create the sync change log and its triggers", _sync_log),
+    (11, "Rebuild the daily rollup on booking and posting days", _rebuild_daily_rollup),
+    (12, "Never reuse customer row ids", _customer_id_sequence),
+    (13, "Sync orders and measurements, hold clashes and track acknowledgements", _sync_orders),
+    (14, "Age debtors by their last booking or payment", _last_activity),
+    (15, "Log customer changes for the typeahead index", _customer_change_log),
+    (16, "Tell synced customers apart by where they were added, and log existing ones", _sync_identity),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def _create_missing_tables(ctx, metadata):
+    """ CREATE TABLE/INDEX for every model table the database doesn't have yet. """
+    dialect = sqlite_dialect.dialect()
+    for table in metadata.sorted_tables:
+        if ctx.has_table(table.name):
+            continue
+        ctx.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            ctx.execute(str(CreateIndex(index).compile(dialect=dialect)))
+
+def migrate(conn, metadata, dry_run=False):
+    """ Bring a sqlite3 connection up to LATEST_VERSION.
+
+    Returns [(version, description, [sql, ...]), ...] for the steps that ran
+    (or would run, with dry_run=True - the transaction is then rolled back).
+    """
+    current = schema_version(conn)
+    if current >= LATEST_VERSION:
+        return []
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        ctx = MigrationContext(cursor)
+        ctx.fresh = not ctx.has_table('user')
+        _create_missing_tables(ctx, metadata)
+        applied = [(0, "Create missing tables", ctx.statements)]
+
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            ctx.statements = []
+            step(ctx)
+            applied.append((version, description, ctx.statements))
+
+        cursor.execute(f'PRAGMA user_version = {LATEST_VERSION}')
+    except Exception:
+        conn.rollback()
+        raise
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return [step for step in applied if step[0] or step[2]]
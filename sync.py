@@ -0,0 +1,476 @@
+""" Offline sync between shops, one bundle file at a time.
+
+Each shop's tailor.db logs its own customer, order, measurement and journal
+changes in sync_log (triggers, see migrations.SYNC_LOG_DDL and
+SYNC_ORDERS_DDL). `export_bundle` writes the log rows a peer has not
+acknowledged yet to a bundle file - a USB stick is enough, no network - and
+`apply_bundle` applies a bundle from another shop. Bundles are JSON lines: a
+header, one line per change and a trailer with the count and a sha256 of the
+change lines, so a damaged copy is refused before anything is applied.
+
+Applying is idempotent and ends in the same state whatever order bundles
+arrive in:
+- a change is identified by (origin site, origin seq) and applied once; it is
+  kept in the local log, so it travels on to the next shop as well;
+- money columns travel as amounts added or taken off, so payments taken at
+  both shops all count;
+- the other customer and order columns are last-writer-wins per column,
+  ordered by (clock, origin site); a shop's clock always runs ahead of every
+  change it has seen. The newest measurement card wins the same way;
+- a delete wins: a customer deleted at one shop is deleted everywhere.
+
+Customers are matched by userId, so every shop needs its own ID prefix;
+bundles from a shop with the same prefix are refused. Each change also
+carries the customer it belongs to - the (origin, origin seq) of the
+customer's insert - and is applied only to that customer: a change for a
+customer that is a different one here, or not here yet, is held in
+sync_conflict. Held changes of a customer that arrives later are applied
+with it; clashes over an ID wait for `resolve`, which every shop settles the
+same way.
+
+A bundle's header carries what the exporting shop has received from the
+shop it is addressed to. Changes count as delivered only once acknowledged
+that way, so a bundle lost on the way is covered by the next one.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from migrations import (DAILY_ROLLUP_ADJUST, LAST_ACTIVITY_REFRESH, LEDGER_TOTALS_ADJUST, SYNC_FIELDS,
+                        SYNC_MEASUREMENT_COLUMNS, SYNC_MONEY, SYNC_ORDER_FIELDS, SYNC_SEED)
+
+BUNDLE_FORMAT = 'tailor-sync'
+BUNDLE_VERSION = 3
+BUNDLE_PREFIX = 'tailor-sync-'
+BUNDLE_SUFFIX = '.jsonl'
+
+PAUSE_CAPTURE = 'UPDATE sync_site SET capture = 0'
+RESUME_CAPTURE = 'UPDATE sync_site SET capture = 1'
+
+
+def site_id(conn):
+    row = conn.execute('SELECT site_id FROM sync_site').fetchone()
+    return row[0] if row else None
+
+def bundle_name(site):
+    return f"{BUNDLE_PREFIX}{site}-{datetime.now():%Y%m%d-%H%M%S-%f}{BUNDLE_SUFFIX}"
+
+def export_bundle(conn, path, peer, prefix, full=False):
+    """ Write the changes the shop with site id `peer` has not acknowledged
+    (all of them with full=True) to `path`, or to a new bundle file inside it
+    when it is a directory. Changes that came from that shop are not sent
+    back. `prefix` is this shop's customer ID prefix. Returns (path, number
+    of changes). Customers that were never logged are logged first. """
+    site = site_id(conn)
+    for statement in SYNC_SEED:
+        conn.execute(statement)
+    if os.path.isdir(path):
+        path = os.path.join(path, bundle_name(site))
+    conn.execute('INSERT OR IGNORE INTO sync_peer (peer) VALUES (?)', (peer,))
+    acked, received = conn.execute('SELECT acked_seq, received_seq FROM sync_peer WHERE peer = ?',
+                                   (peer,)).fetchone()
+    since = 0 if full else acked
+    upto = conn.execute('SELECT coalesce(max(seq), 0) FROM sync_log').fetchone()[0]
+    # Each change with the customer it belongs to: the insert logged last before it for the ID
+    rows = conn.execute("""SELECT origin, origin_seq, clock, op, user_id, data,
+                                  (SELECT json_array(born.origin, born.origin_seq) FROM sync_log born
+                                   WHERE born.user_id = sync_log.user_id AND born.op = 'insert'
+                                     AND born.seq <= sync_log.seq ORDER BY born.seq DESC LIMIT 1)
+                           FROM sync_log
+                           WHERE seq > ? AND seq <= ? AND origin != ? AND coalesce(received_from, '') != ?
+                           ORDER BY seq""", (since, upto, peer, peer))
+
+    digest, count = hashlib.sha256(), 0
+    partial = path + '.partial'
+    with open(partial, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION, 'site': site, 'prefix': prefix,
+                            'peer': peer, 'since': since, 'upto': upto, 'ack': received,
+                            'created_at': datetime.now().isoformat(timespec='seconds')}) + '\n')
+        for origin, origin_seq, clock, op, user_id, data, born in rows:
+            if born is None:
+                # Logged before the customer's insert was (see SYNC_SEED), which carries it already
+                continue
+            line = json.dumps([origin, origin_seq, clock, op, user_id, json.loads(data), json.loads(born)],
+                              ensure_ascii=False)
+            digest.update(line.encode('utf-8'))
+            f.write(line + '\n')
+            count += 1
+        f.write(json.dumps({'count': count, 'sha256': digest.hexdigest()}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+    conn.execute('UPDATE sync_peer SET last_seq = ?, exported_at = ? WHERE peer = ?',
+                 (upto, datetime.now().isoformat(sep=' '), peer))
+    conn.commit()
+    return path, count
+
+def read_bundle(path):
+    """ (header, [change, ...]) of a bundle file; ValueError if it is not a
+    complete, undamaged bundle. """
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    try:
+        header, trailer = json.loads(lines[0]), json.loads(lines[-1])
+    except (IndexError, ValueError):
+        raise ValueError(f"{os.path.basename(path)} is not a sync bundle")
+    if not isinstance(header, dict) or header.get('format') != BUNDLE_FORMAT or header.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"{os.path.basename(path)} is not a sync bundle")
+    changes = lines[1:-1]
+    digest = hashlib.sha256()
+    for line in changes:
+        digest.update(line.encode('utf-8'))
+    complete = isinstance(trailer, dict) and trailer.get('count') == len(changes)
+    if not complete or trailer.get('sha256') != digest.hexdigest():
+        raise ValueError(f"{os.path.basename(path)} is incomplete or damaged")
+    return header, [json.loads(line) for line in changes]
+
+def list_bundles(directory, exclude_site=None):
+    """ Bundle files in a directory, oldest first, leaving out those exported by `exclude_site`. """
+    own = f"{BUNDLE_PREFIX}{exclude_site}-"
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(BUNDLE_PREFIX) and name.endswith(BUNDLE_SUFFIX)
+                   and not (exclude_site and name.startswith(own)))
+    return [os.path.join(directory, name) for name in names]
+
+
+# Log rows of the customer who has the ID now: from its insert on
+_CURRENT = "seq >= coalesce((SELECT max(seq) FROM sync_log WHERE user_id = ? AND op = 'insert'), 0)"
+
+def _field_clocks(cursor, user_id):
+    """ {field: (clock, origin)} of the newest logged write to each of a customer's and their order's fields. """
+    clocks = {}
+    for clock, origin, data in cursor.execute(
+            "SELECT clock, origin, data FROM sync_log WHERE user_id = ? AND op IN ('insert', 'update', 'order') "
+            f"AND {_CURRENT}", (user_id, user_id)).fetchall():
+        for name in json.loads(data):
+            if name in SYNC_FIELDS + SYNC_ORDER_FIELDS and (clock, origin) > clocks.get(name, (0, '')):
+                clocks[name] = (clock, origin)
+    return clocks
+
+def _winning(cursor, user_id, origin, clock, data, names):
+    clocks = _field_clocks(cursor, user_id)
+    return {name: data[name] for name in names if name in data and (clock, origin) > clocks.get(name, (0, ''))}
+
+def _booking(cursor, customer_id):
+    """ (booking day, share) of a customer in the daily rollup, as the app
+    posts it: journal entries count on their own day and the rest - suits,
+    and amounts not from the journal - on the latest order's date. """
+    row = cursor.execute(
+        """SELECT coalesce((SELECT order_date FROM customer_order WHERE customer_id = user.id
+                            ORDER BY id DESC LIMIT 1), date),
+                  coalesce("numberOfSuit", 0), coalesce(total_amount, 0), coalesce(advance_payment, 0),
+                  coalesce(price, 0),
+                  (SELECT coalesce(sum(CASE WHEN entry_type = 'add_debt' THEN amount ELSE 0 END), 0)
+                   FROM ledger_entry WHERE customer_id = user.id),
+                  (SELECT coalesce(sum(CASE WHEN entry_type = 'payment' THEN amount ELSE 0 END), 0)
+                   FROM ledger_entry WHERE customer_id = user.id)
+           FROM user WHERE id = ?""", (customer_id,)).fetchone()
+    if row is None:
+        return None, {}
+    day, suits, billed, received, pending, debts, payments = row
+    return day, {'suits': suits, 'billed': billed - debts, 'received': received - payments,
+                 'pending': pending - debts + payments}
+
+def _journal_posting(entry_type, amount):
+    if entry_type == 'add_debt':
+        return {'billed': amount, 'pending': amount}
+    return {'received': amount, 'pending': -amount}
+
+def _rollup(cursor, day, sign=1, suits=0, billed=0, received=0, pending=0):
+    cursor.execute(DAILY_ROLLUP_ADJUST, {'day': day, 'suits': sign * suits, 'billed': sign * billed,
+                                         'received': sign * received, 'pending': sign * pending})
+
+def _totals(cursor, sign=1, **money):
+    # No totals row yet is fine: the app builds it from the table on first use
+    cursor.execute(LEDGER_TOTALS_ADJUST, {'receivable': sign * money.get('total_amount', 0),
+                                          'received': sign * money.get('advance_payment', 0),
+                                          'pending': sign * money.get('price', 0)})
+
+def _delete_customer(cursor, customer_id):
+    day, share = _booking(cursor, customer_id)
+    _rollup(cursor, day, -1, **share)
+    for posted_on, entry_type, amount in cursor.execute(
+            'SELECT date(created_at), entry_type, sum(amount) FROM ledger_entry WHERE customer_id = ? '
+            'GROUP BY 1, 2', (customer_id,)).fetchall():
+        _rollup(cursor, posted_on, -1, **_journal_posting(entry_type, amount))
+    money = cursor.execute('SELECT coalesce(price, 0), coalesce(total_amount, 0), coalesce(advance_payment, 0) '
+                           'FROM user WHERE id = ?', (customer_id,)).fetchone()
+    _totals(cursor, -1, **dict(zip(SYNC_MONEY, money)))
+    for table in ('ledger_entry', 'customer_order', 'measurement_set'):
+        cursor.execute(f'DELETE FROM {table} WHERE customer_id = ?', (customer_id,))
+    cursor.execute('DELETE FROM user WHERE id = ?', (customer_id,))
+
+def _write_customer(cursor, customer_id, origin, clock, op, user_id, data):
+    """ Apply an insert, update, order, entry or measurements change; returns the customer id. """
+    now = datetime.now().isoformat(sep=' ')
+    if op == 'entry':
+        cursor.execute('INSERT INTO ledger_entry (customer_id, entry_type, amount, created_at) VALUES (?, ?, ?, ?)',
+                       (customer_id, data['entry_type'], data['amount'], data['created_at']))
+        _rollup(cursor, data['created_at'][:10], **_journal_posting(data['entry_type'], data['amount']))
+        return customer_id
+
+    if op == 'measurements':
+        newest = cursor.execute("SELECT clock, origin FROM sync_log WHERE user_id = ? AND op = 'measurements' "
+                                f'AND {_CURRENT} ORDER BY clock DESC, origin DESC LIMIT 1',
+                                (user_id, user_id)).fetchone()
+        if newest and tuple(newest) > (clock, origin):
+            # A newer card is already current here; this one stays in the log only
+            return customer_id
+        values = {name: data[name] for name in SYNC_MEASUREMENT_COLUMNS if name in data}
+        cursor.execute(f'INSERT INTO measurement_set (customer_id, {", ".join(values)}) '
+                       f'VALUES (?, {", ".join("?" * len(values))})', [customer_id, *values.values()])
+        return customer_id
+
+    if op == 'order':
+        fields = _winning(cursor, user_id, origin, clock, data, SYNC_ORDER_FIELDS)
+        order = cursor.execute('SELECT id FROM customer_order WHERE customer_id = ? ORDER BY id DESC LIMIT 1',
+                               (customer_id,)).fetchone()
+        if order is None:
+            date, suits = cursor.execute('SELECT date, "numberOfSuit" FROM user WHERE id = ?',
+                                         (customer_id,)).fetchone()
+            cursor.execute('INSERT INTO customer_order (customer_id, order_date, suits, special_notes, created_at) '
+                           'VALUES (?, ?, ?, ?, ?)', (customer_id, fields.get('order_date', date),
+                                                      fields.get('suits', suits), fields.get('special_notes'), now))
+        elif fields:
+            cursor.execute(f'UPDATE customer_order SET {", ".join(f"{name} = ?" for name in fields)} WHERE id = ?',
+                           [*fields.values(), order[0]])
+        return customer_id
+
+    money = {name: data.get(name, 0) for name in SYNC_MONEY}
+    _totals(cursor, **money)
+    if customer_id is None:
+        # A new customer: nothing logged here is theirs, so every field counts
+        fields = {name: data[name] for name in SYNC_FIELDS if name in data}
+        columns = ", ".join(f'"{name}"' for name in ['userId', *fields, *money])
+        cursor.execute(f'INSERT INTO user ({columns}) VALUES ({", ".join("?" * (len(fields) + len(money) + 1))})',
+                       [user_id, *fields.values(), *money.values()])
+        return cursor.lastrowid
+    fields = _winning(cursor, user_id, origin, clock, data, SYNC_FIELDS)
+    assignments = [f'"{name}" = ?' for name in fields] + [f'{name} = coalesce({name}, 0) + ?' for name in money]
+    cursor.execute(f'UPDATE user SET {", ".join(assignments)} WHERE id = ?',
+                   [*fields.values(), *money.values(), customer_id])
+    return customer_id
+
+def _apply_change(cursor, origin, clock, op, user_id, data):
+    """ Apply one remote change to the working tables (see _placement for when). """
+    row = cursor.execute('SELECT id FROM user WHERE "userId" = ?', (user_id,)).fetchone()
+    if op == 'delete':
+        _delete_customer(cursor, row[0])
+        return
+
+    customer_id = row[0] if row else None
+    day, share = _booking(cursor, customer_id)
+    customer_id = _write_customer(cursor, customer_id, origin, clock, op, user_id, data)
+    cursor.execute(LAST_ACTIVITY_REFRESH + ' WHERE id = ?', (customer_id,))
+    # Cached view and print pages, in every process, are keyed by row_version
+    cursor.execute('UPDATE user SET row_version = row_version + 1, updated_at = ? WHERE id = ?',
+                   (datetime.now().isoformat(sep=' '), customer_id))
+    # Move the customer's booking share to its (possibly new) day, with its new amounts
+    new_day, new_share = _booking(cursor, customer_id)
+    if (day, share) != (new_day, new_share):
+        if day is not None:
+            _rollup(cursor, day, -1, **share)
+        _rollup(cursor, new_day, **new_share)
+
+def _identity(cursor, user_id):
+    """ (origin, origin seq, clock) of the insert of the customer who has this ID here, or None. """
+    return cursor.execute("SELECT origin, origin_seq, clock FROM sync_log WHERE user_id = ? AND op = 'insert' "
+                          'ORDER BY seq DESC LIMIT 1', (user_id,)).fetchone()
+
+def _placement(cursor, op, user_id, born):
+    """ What becomes of a remote change of the customer `born` here: 'apply';
+    'hold' when the ID is a different customer's here, or the customer is not
+    here yet; 'deleted' when the customer was deleted here (a delete wins), or
+    'retired' when the customer lost the ID to another one (see resolve). """
+    if cursor.execute('SELECT 1 FROM sync_retired WHERE origin = ? AND origin_seq = ?', born).fetchone():
+        return 'retired'
+    if cursor.execute('SELECT 1 FROM user WHERE "userId" = ?', (user_id,)).fetchone():
+        local = _identity(cursor, user_id)
+        same = op != 'insert' and local is not None and tuple(local[:2]) == tuple(born)
+        return 'apply' if same else 'hold'
+    if op == 'insert':
+        return 'apply'
+    inserted = cursor.execute("SELECT seq FROM sync_log WHERE origin = ? AND origin_seq = ? AND op = 'insert'",
+                              born).fetchone()
+    if inserted and cursor.execute("SELECT 1 FROM sync_log WHERE user_id = ? AND op = 'delete' AND seq > ?",
+                                   (user_id, inserted[0])).fetchone():
+        return 'deleted'
+    return 'hold'
+
+def _take(cursor, change, received_from, summary):
+    """ Apply, hold or drop one remote change, counting it in `summary`. """
+    origin, origin_seq, clock, op, user_id, data, born = change
+    row = (origin, origin_seq, clock, op, user_id, json.dumps(data, ensure_ascii=False), received_from)
+    placement = _placement(cursor, op, user_id, born)
+    if placement == 'hold':
+        cursor.execute('INSERT INTO sync_conflict (origin, origin_seq, clock, op, user_id, data, received_from, '
+                       'born_origin, born_seq, held_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       row + tuple(born) + (datetime.now().isoformat(sep=' '),))
+        summary['held'] += 1
+        summary['conflicts'].add(user_id)
+        return
+    if placement == 'retired':
+        summary['dropped'] += 1
+        return
+    if placement == 'apply':
+        _apply_change(cursor, origin, clock, op, user_id, data)
+        summary['applied'] += 1
+    else:
+        # Settled by the delete; logged so it is not asked for again
+        summary['dropped'] += 1
+    cursor.execute('INSERT INTO sync_log (origin, origin_seq, clock, op, user_id, data, received_from) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+    if placement == 'apply' and op == 'insert':
+        # Changes that came before their customer did
+        _replay(cursor, born, summary)
+
+def _replay(cursor, born, summary):
+    held = cursor.execute('SELECT origin, origin_seq, clock, op, user_id, data, received_from FROM sync_conflict '
+                          'WHERE born_origin = ? AND born_seq = ? ORDER BY rowid', born).fetchall()
+    cursor.execute('DELETE FROM sync_conflict WHERE born_origin = ? AND born_seq = ?', born)
+    for origin, origin_seq, clock, op, user_id, data, received_from in held:
+        _take(cursor, (origin, origin_seq, clock, op, user_id, json.loads(data), born), received_from, summary)
+
+def _new_summary():
+    return {'applied': 0, 'held': 0, 'skipped': 0, 'dropped': 0, 'conflicts': set()}
+
+def apply_bundle(conn, path, prefix):
+    """ Apply a bundle from another shop in one transaction. `prefix` is this
+    shop's customer ID prefix. Returns {'applied': n, 'held': n, 'skipped': n
+    (already here), 'dropped': n (their customer was deleted or lost its ID),
+    'conflicts': {userId held, ...}}. """
+    header, changes = read_bundle(path)
+    site = site_id(conn)
+    if header['site'] == site:
+        raise ValueError(f"{os.path.basename(path)} was exported by this shop")
+    if header.get('prefix') == prefix:
+        raise ValueError(f"{os.path.basename(path)} comes from a shop that also numbers its customers {prefix}...; "
+                         "give each shop its own ID prefix before syncing")
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # So every customer here can be told apart from the bundle's
+        for statement in SYNC_SEED:
+            cursor.execute(statement)
+        # Applied changes are logged as they came, not as new local changes
+        cursor.execute(PAUSE_CAPTURE)
+        summary = _new_summary()
+        for change in changes:
+            key = tuple(change[:2])
+            if (cursor.execute('SELECT 1 FROM sync_log WHERE origin = ? AND origin_seq = ?', key).fetchone()
+                    or cursor.execute('SELECT 1 FROM sync_conflict WHERE origin = ? AND origin_seq = ?',
+                                      key).fetchone()):
+                summary['skipped'] += 1
+                continue
+            _take(cursor, change, header['site'], summary)
+
+        if header['peer'] == site:
+            # Only a bundle addressed to this shop covers everything it should
+            # get from the sender, so only such a bundle moves the marks
+            cursor.execute('INSERT OR IGNORE INTO sync_peer (peer) VALUES (?)', (header['site'],))
+            cursor.execute('UPDATE sync_peer SET acked_seq = max(acked_seq, ?), '
+                           'received_seq = CASE WHEN received_seq >= ? THEN max(received_seq, ?) '
+                           'ELSE received_seq END WHERE peer = ?',
+                           (header['ack'], header['since'], header['upto'], header['site']))
+        cursor.execute(RESUME_CAPTURE)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return summary
+
+def _claims(cursor, user_id):
+    """ The customers claiming an ID here, oldest first: [(clock, origin, origin seq, local), ...]
+    with local True for the customer who has it now, plus the number of held changes
+    whose customer's insert has not arrived. """
+    claims, waiting = [], 0
+    if cursor.execute('SELECT 1 FROM user WHERE "userId" = ?', (user_id,)).fetchone():
+        local = _identity(cursor, user_id)
+        if local:
+            claims.append((local[2], local[0], local[1], True))
+    for born_origin, born_seq, count in cursor.execute(
+            'SELECT born_origin, born_seq, count(*) FROM sync_conflict WHERE user_id = ? '
+            'GROUP BY born_origin, born_seq', (user_id,)).fetchall():
+        insert = cursor.execute('SELECT clock FROM sync_conflict WHERE origin = ? AND origin_seq = ?',
+                                (born_origin, born_seq)).fetchone()
+        if insert:
+            claims.append((insert[0], born_origin, born_seq, False))
+        else:
+            waiting += count
+    return sorted(claims), waiting
+
+def renumbers_local(conn, user_id):
+    """ True if resolving `user_id` takes the ID from a customer added at this
+    shop, who then needs a new ID of this shop's. """
+    claims, _ = _claims(conn.cursor(), user_id)
+    return bool(claims) and not claims[0][3] and any(
+        local and origin == site_id(conn) for _, origin, _, local in claims)
+
+def resolve(conn, user_id, new_user_id=None):
+    """ Settle the changes held for `user_id`, the same way at every shop: of
+    the customers claiming the ID, the one whose insert was logged first
+    (by clock, then origin) keeps it. A customer here that loses it is given
+    `new_user_id` if it was added at this shop - and goes out to the other
+    shops again under that ID - or else taken out without logging, until the
+    shop that added it sends it under its new ID. Changes held for other
+    losers are dropped, along with any that come later; the winner's are
+    applied. Changes whose customer has not arrived stay held. Returns
+    {'kept': True if the customer here keeps the ID, 'renumbered': new ID or
+    None, 'applied': n, 'dropped': n, 'waiting': n}. """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        site = site_id(conn)
+        claims, waiting = _claims(cursor, user_id)
+        outcome = {'kept': bool(claims) and claims[0][3], 'renumbered': None, 'applied': 0, 'dropped': 0,
+                   'waiting': waiting}
+        cursor.execute(PAUSE_CAPTURE)
+        now = datetime.now().isoformat(sep=' ')
+        for _, origin, origin_seq, local in claims[1:]:
+            cursor.execute('INSERT OR IGNORE INTO sync_retired (origin, origin_seq, user_id, retired_at) '
+                           'VALUES (?, ?, ?, ?)', (origin, origin_seq, user_id, now))
+            if not local:
+                outcome['dropped'] += cursor.execute('DELETE FROM sync_conflict WHERE born_origin = ? AND born_seq = ?',
+                                                     (origin, origin_seq)).rowcount
+                continue
+            customer_id = cursor.execute('SELECT id FROM user WHERE "userId" = ?', (user_id,)).fetchone()[0]
+            if origin == site:
+                if not new_user_id:
+                    raise ValueError(f"{user_id} goes to another shop's customer; the one here needs a new ID")
+                cursor.execute('UPDATE user SET "userId" = ?, row_version = row_version + 1, updated_at = ? '
+                               'WHERE id = ?', (new_user_id, now, customer_id))
+                outcome['renumbered'] = new_user_id
+            else:
+                _delete_customer(cursor, customer_id)
+        if claims and not claims[0][3]:
+            summary = _new_summary()
+            _replay(cursor, claims[0][1:3], summary)
+            outcome['applied'] += summary['applied']
+            outcome['dropped'] += summary['dropped']
+        # The renumbered customer travels as a new one
+        for statement in SYNC_SEED:
+            cursor.execute(statement)
+        cursor.execute(RESUME_CAPTURE)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return outcome
+
+def status(conn):
+    """ This shop's site id, log size, what each peer was sent and has
+    acknowledged, the newest change seen from every site and the held
+    changes per customer ID. """
+    return {
+        'site': site_id(conn),
+        'changes': conn.execute('SELECT count(*) FROM sync_log').fetchone()[0],
+        'last_seq': conn.execute('SELECT coalesce(max(seq), 0) FROM sync_log').fetchone()[0],
+        'peers': conn.execute('SELECT peer, last_seq, acked_seq, exported_at FROM sync_peer ORDER BY peer').fetchall(),
+        'origins': conn.execute('SELECT origin, max(origin_seq) FROM sync_log GROUP BY origin '
+                                'ORDER BY origin').fetchall(),
+        'conflicts': conn.execute('SELECT user_id, received_from, count(*) FROM sync_conflict '
+                                  'GROUP BY user_id, received_from ORDER BY user_id').fetchall(),
+    }
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import text
+
+# Point the app at a throwaway database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['TAILOR_DB_PATH'] = os.path.join(_db_dir, 'tailor.db')
+os.environ['TAILOR_BACKUP_DIR'] = os.path.join(_db_dir, 'backups')
+
+import migrations  # noqa: E402
+from app import app, db, page_cache, run_migrations, typeahead  # noqa: E402
+
+run_migrations()
+
+
+@pytest.fixture
+def client():
+    """ Test client on an emptied database. """
+    with app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        for archive in {**migrations.ARCHIVE_TABLES, **migrations.ORDER_ARCHIVE_TABLES}.values():
+            db.session.execute(text(f'DELETE FROM {archive}'))
+        # After the deletes above, which the sync triggers log
+        for table in ('sync_log', 'sync_peer', 'sync_conflict', 'sync_retired'):
+            db.session.execute(text(f'DELETE FROM {table}'))
+        db.session.commit()
+    page_cache.clear()
+    typeahead.reset()
+    return app.test_client()
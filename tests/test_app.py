@@ -1,9 +1,405 @@
-from app import app
+import sqlite3
+import threading
+from sqlalchemy import event, func, text
+from datetime import date, timedelta
+
+from app import (app, db, db_path, User, LedgerEntry, DailyRollup, compute_ledger_totals, get_ledger_totals, rollup_report,
+                 page_cache, reserve_customer_ids, search_customers, aging_report, iter_debtors,
+                 _aging_bucket, _owes)
+
+
+def add_customers(count):
+    with app.app_context():
+        start = date(2024, 1, 1)
+        for n in range(count):
+            db.session.add(User(userId=f"AS{n + 1:03d}", userName=f"Customer {n + 1}",
+                                phone=f"0300-{n + 1:07d}", numberOfSuit=1, address="Peshawar",
+                                date=start + timedelta(days=n // 2), price=100))
+        db.session.commit()
+
 
 def test_home_page():
     client = app.test_client()
     response = client.get('/')
     assert response.status_code == 200
 
+def test_customer_list_pages_by_cursor(client):
+    add_customers(app.config['CUSTOMERS_PER_PAGE'] + 5)
+
+    first = client.get('/user').get_data(as_text=True)
+    assert 'AS055' in first and 'AS005' not in first
+    assert 'cursor=' in first
+
+    cursor = first.split('cursor=')[1].split('"')[0]
+    second = client.get(f'/user?cursor={cursor}').get_data(as_text=True)
+    assert 'AS005' in second and 'AS001' in second
+    assert 'AS055' not in second
+    assert 'cursor=' not in second
+
+def test_ledger_pages_by_cursor(client):
+    add_customers(app.config['CUSTOMERS_PER_PAGE'] + 1)
+
+    first = client.get('/ledger').get_data(as_text=True)
+    cursor = first.split('cursor=')[1].split('"')[0]
+    second = client.get(f'/ledger?cursor={cursor}').get_data(as_text=True)
+    assert 'AS001' in second and 'AS051' not in second
+
+def customer_form(**overrides):
+    form = {'userName': 'Ali', 'phone': '0300-1234567', 'numberOfSuit': '2',
+            'address': 'Peshawar', 'date': '2024-03-01', 'price': '1500'}
+    form.update(overrides)
+    return form
+
+def test_ledger_totals_follow_every_money_change(client):
+    client.post('/add_user', data=customer_form())
+    client.post('/add_user', data=customer_form(userName='Bilal', phone='0311-7654321', price='800'))
+    client.post('/update/AS001', data=customer_form(price='2000'))
+    client.post('/process_transaction', data={'user_id': 'AS002', 'type': 'payment', 'amount': '300'})
+    client.post('/process_transaction', data={'user_id': 'AS002', 'type': 'add_debt', 'amount': '100'})
+    client.post('/delete/AS001')
+
+    with app.app_context():
+        totals = get_ledger_totals()
+        assert compute_ledger_totals() == {'total_receivable': 100, 'total_received': 300, 'total_pending': 600}
+        assert (totals.total_receivable, totals.total_received, totals.total_pending) == (100, 300, 600)
+
+def test_verify_totals_reports_and_rebuilds_drift(client):
+    client.post('/add_user', data=customer_form())
+    with app.app_context():
+        get_ledger_totals().total_pending = 99
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['verify-totals'])
+    assert 'drift -1401' in result.output
+    result = runner.invoke(args=['verify-totals', '--rebuild'])
+    assert 'rebuilt' in result.output
+    assert 'match' in runner.invoke(args=['verify-totals']).output
+
+def test_transactions_are_journaled_and_paged(client):
+    client.post('/add_user', data=customer_form(price='0'))
+    for amount in range(1, app.config['STATEMENT_PER_PAGE'] + 3):
+        client.post('/process_transaction', data={'user_id': 'AS001', 'type': 'add_debt', 'amount': str(amount)})
+    client.post('/process_transaction', data={'user_id': 'AS001', 'type': 'payment', 'amount': '7'})
+
+    with app.app_context():
+        customer = User.query.filter_by(userId='AS001').one()
+        total = sum(range(1, app.config['STATEMENT_PER_PAGE'] + 3))
+        assert (customer.total_amount, customer.advance_payment, customer.price) == (total, 7, total - 7)
+        assert LedgerEntry.query.filter_by(customer_id=customer.id).count() == app.config['STATEMENT_PER_PAGE'] + 3
+
+    first = client.get('/statement/AS001').get_data(as_text=True)
+    assert 'before=' in first
+    before = first.split('before=')[1].split('"')[0]
+    second = client.get(f'/statement/AS001?before={before}').get_data(as_text=True)
+    # 53 entries: the payment and 49 debts on page one, the three oldest debts on page two
+    assert second.count('<td class="type-add_debt">') == 2 * 3 and 'before=' not in second
+
+def test_search_matches_prefixes_and_partial_phones(client):
+    client.post('/add_user', data=customer_form(userName='Imran Khan', phone='0301-5551234'))
+    client.post('/add_user', data=customer_form(userName='Imran Ali', phone='0345-9876543'))
+
+    with app.app_context():
+        assert len(search_customers('imr')) == 2
+        assert [c.phone for c in search_customers('1234')] == ['0301-5551234']
+        assert [c.phone for c in search_customers('98765')] == ['0345-9876543']
+        assert [c.userName for c in search_customers('AS002')] == ['Imran Ali']
+
+    # Two matches: the list is shown instead of jumping to one customer
+    page = client.post('/search', data={'search_query': 'Imran'}).get_data(as_text=True)
+    assert 'AS001' in page and 'AS002' in page
+    response = client.post('/search', data={'search_query': 'Imran Khan'})
+    assert response.headers['Location'].endswith('/view/AS001')
+
+def test_search_index_follows_updates_and_deletes(client):
+    client.post('/add_user', data=customer_form(userName='Imran Khan'))
+    client.post('/update/AS001', data=customer_form(userName='Zahid Khan'))
+    with app.app_context():
+        assert search_customers('Imran') == []
+        assert len(search_customers('Zahid')) == 1
+    client.post('/delete/AS001')
+    with app.app_context():
+        assert search_customers('Zahid') == []
+
+def test_search_falls_back_without_fts5(client, monkeypatch):
+    monkeypatch.setattr('app._search_index_ready', False)
+    client.post('/add_user', data=customer_form(userName='Imran Khan'))
+    with app.app_context():
+        assert [c.userId for c in search_customers('mran')] == ['AS001']
+        assert [c.userId for c in search_customers('0300-1234567')] == ['AS001']
+
+def test_customer_ids_keep_increasing_past_999(client):
+    with app.app_context():
+        db.session.add(User(userId='AS999', userName='Old', phone='0300-0000999', numberOfSuit=1,
+                            address='Peshawar', date=date(2024, 1, 1)))
+        db.session.commit()
+    client.post('/add_user', data=customer_form(phone='0300-0001000'))
+    client.post('/add_user', data=customer_form(phone='0300-0001001'))
+    with app.app_context():
+        assert {u.userId for u in User.query.all()} == {'AS999', 'AS1000', 'AS1001'}
+
+def test_concurrent_id_reservations_never_collide(client):
+    taken = []
+
+    def reserve():
+        for _ in range(10):
+            with app.app_context():
+                taken.extend(reserve_customer_ids(3))
+                db.session.commit()
+
+    workers = [threading.Thread(target=reserve) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sorted(taken) == sorted(f"AS{n:03d}" for n in range(1, 121))
+
+def test_print_sheet_uses_style_lookup(client):
+    client.post('/add_user', data=customer_form(style_collar='benGoll', style_cuff='kaniBazo', style_pocket='None'))
+    page = client.get('/print/AS001').get_data(as_text=True)
+    assert 'icon/benGoll.png' in page and 'icon/kaniBazo.png' in page
+    assert 'سامنےجیب نہیں' in page
+    assert page.count('class="sticker-container"') == 1
+
+def test_customer_page_uses_the_registry_captions(client):
+    client.post('/add_user', data=customer_form(style_collar='SamneyHindiBackBen', style_cuff='kaniBazo',
+                                                style_pocket='None', salai='zanjari'))
+    page = client.get('/view/AS001').get_data(as_text=True)
+    assert 'icon/samneyHindiBackBen.png' in page and 'ہندی بیگ بین' in page and 'سامنے ہندی' not in page
+    assert 'icon/kaniBazo.png' in page and 'KaniBazo' not in page
+    # The page has room for the full caption the print sheet shortens
+    assert 'سامنے جیب نہیں' in page and 'زنجیریئ' in page
+
+def test_forms_take_style_choices_from_the_registry_and_need_an_address(client):
+    page = client.get('/add_user').get_data(as_text=True)
+    assert 'name="style_collar" value="ban" checked' in page and 'icon/kaniBazo.png' in page
+    page = client.post('/add_user', data=customer_form(address=''), follow_redirects=True).get_data(as_text=True)
+    assert 'Address is required' in page
+
+    client.post('/add_user', data=customer_form(design_button='steel_button', salai='zanjari'))
+    page = client.get('/update/AS001').get_data(as_text=True)
+    assert 'value="steel_button" checked' in page and 'value="zanjari" checked' in page
+    assert 'value="sample_button" checked' not in page
+
+def test_batch_print_streams_a_date_range_or_id_list(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PRINT_CHUNK_SIZE', 3)
+    add_customers(10)  # two customers per day from 2024-01-01
+
+    response = client.get('/print/batch?from=2024-01-02&to=2024-01-04')
+    assert response.is_streamed
+    page = response.get_data(as_text=True)
+    assert page.count('class="sticker-container"') == 6
+    assert page.index('AS003') < page.index('AS008')
+
+    page = client.get('/print/batch?ids=AS009,AS002&ids=AS404').get_data(as_text=True)
+    assert page.count('class="sticker-container"') == 2
+    assert page.index('AS009') < page.index('AS002')
+    assert client.get('/print/batch').status_code == 400
+
+def test_view_and_print_pages_are_cached_until_the_row_changes(client):
+    client.post('/add_user', data=customer_form(style_pocket='samplePocket'))
+    before = page_cache.stats()
+
+    first = client.get('/view/AS001')
+    assert first.headers['ETag'] and first.headers['Last-Modified']
+    again = client.get('/view/AS001')
+    assert again.get_data() == first.get_data()
+    assert page_cache.stats()['hits'] == before['hits'] + 1
+
+    # The browser's copy is still good: no body
+    assert client.get('/view/AS001', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    client.post('/process_transaction', data={'user_id': 'AS001', 'type': 'payment', 'amount': '500'})
+    changed = client.get('/view/AS001', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and changed.headers['ETag'] != first.headers['ETag']
+
+    printed = client.get('/print/AS001')
+    client.post('/update/AS001', data=customer_form(userName='Zahid', style_pocket='samplePocket'))
+    assert 'Zahid' in client.get('/print/AS001', headers={'If-None-Match': printed.headers['ETag']}).get_data(as_text=True)
+
+    client.post('/delete/AS001')
+    assert page_cache.stats()['entries'] == 0
+    assert client.get('/view/AS001').status_code == 404
+
+def test_autocomplete_follows_adds_updates_and_deletes(client):
+    add_customers(3)
+
+    assert [c['userId'] for c in client.get('/autocomplete?q=customer 2').get_json()] == ['AS002']
+
+    client.post('/add_user', data=customer_form(userName='Naveed Ahmad', phone='0321-5550001'))
+    added = client.get('/autocomplete?q=nave').get_json()
+    assert [c['userName'] for c in added] == ['Naveed Ahmad']
+    user_id = added[0]['userId']
+
+    client.post(f'/update/{user_id}', data=customer_form(userName='Naveed Shinwari', phone='0321-5550001'))
+    assert client.get('/autocomplete?q=ahmad').get_json() == []
+    assert client.get('/autocomplete?q=shinw').get_json()[0]['url'] == f'/view/{user_id}'
+
+    client.post(f'/delete/{user_id}')
+    assert client.get('/autocomplete?q=naveed').get_json() == []
+
+def test_autocomplete_sees_writes_from_other_processes(client):
+    add_customers(3)
+    assert [c['userId'] for c in client.get('/autocomplete?q=customer 2').get_json()] == ['AS002']
+
+    # Another counter, or the sync/import CLI, writing to the same tailor.db
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE user SET \"userName\" = 'Yasir Khan' WHERE \"userId\" = 'AS002'")
+    other.execute('INSERT INTO user ("userId", "userName", phone, address, "numberOfSuit", date) '
+                  "VALUES ('AS900', 'Waqar', '0300-9000000', 'Swat', 1, '2024-05-01')")
+    other.execute("DELETE FROM user WHERE \"userId\" = 'AS003'")
+    other.commit()
+    assert client.get('/autocomplete?q=customer 2').get_json() == []
+    assert [c['userId'] for c in client.get('/autocomplete?q=yasir').get_json()] == ['AS002']
+    assert [c['userId'] for c in client.get('/autocomplete?q=waq').get_json()] == ['AS900']
+    assert client.get('/autocomplete?q=customer 3').get_json() == []
+
+    # Too far behind the trimmed log: the index is loaded again
+    other.execute("UPDATE user SET \"userName\" = 'Zubair' WHERE \"userId\" = 'AS900'")
+    other.execute('DELETE FROM customer_change')
+    other.commit()
+    other.close()
+    assert [c['userId'] for c in client.get('/autocomplete?q=zub').get_json()] == ['AS900']
+
+def test_daily_rollup_follows_writes_and_matches_backfill(client):
+    client.post('/add_user', data=customer_form(numberOfSuit='3', date='2024-03-01', price='1500'))
+    client.post('/add_user', data=customer_form(userName='Bilal', phone='0311-7654321', numberOfSuit='1',
+                                                date='2024-03-20', price='800'))
+    client.post('/update/AS002', data=customer_form(userName='Bilal', phone='0311-7654321', numberOfSuit='2',
+                                                    date='2024-04-02', price='900'))
+    client.post('/process_transaction', data={'user_id': 'AS001', 'type': 'payment', 'amount': '500'})
+    client.post('/add_user', data=customer_form(userName='Zahid', phone='0312-1112223', date='2024-03-05'))
+    client.post('/delete/AS003')
+
+    with app.app_context():
+        march = rollup_report(date(2024, 3, 1), date(2024, 3, 31), 'day')
+        assert [(row[0], row[1], row[4]) for row in march] == [
+            (date(2024, 3, 1), 3, 1500), (date(2024, 3, 5), 0, 0), (date(2024, 3, 20), 0, 0)]
+        everything = rollup_report(date(2000, 1, 1), date(2100, 1, 1))
+        assert [row[0] for row in everything][:2] == ['2024-03', '2024-04']
+        assert everything[1][1:] == (2, 0, 0, 900, 2400)
+        assert sum(row[3] for row in everything) == 500
+        assert everything[-1][5] == compute_ledger_totals()['total_pending']
+
+    page = client.get('/reports?from=2024-01-01&to=2024-12-31').get_data(as_text=True)
+    assert '2024-03' in page and '2024-04' in page
+
+    result = app.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert 'Daily rollup rebuilt' in result.output
+    with app.app_context():
+        rebuilt = rollup_report(date(2000, 1, 1), date(2100, 1, 1))
+        assert sum(row[1] for row in rebuilt) == 5
+        # The backfill puts everything on the same days the live postings did
+        assert rebuilt == everything
+
+def rollup_days():
+    with app.app_context():
+        return {row.day: (row.suits_booked, row.billed, row.received, row.pending)
+                for row in DailyRollup.query.order_by(DailyRollup.day) if any((row.suits_booked, row.billed,
+                                                                               row.received, row.pending))}
+
+def test_rollup_keeps_bookings_on_their_day_after_remaining_is_added(client):
+    today = date.today()
+    client.post('/add_user', data=customer_form(numberOfSuit='3', date='2024-03-01', price='1500'))
+    client.post('/add_user', data=customer_form(userName='Bilal', phone='0311-7654321', numberOfSuit='1',
+                                                date='2024-03-05', price='800'))
+    for user_id in ('AS001', 'AS002'):
+        client.post('/process_transaction', data={'user_id': user_id, 'type': 'add_debt', 'amount': '100'})
+
+    # Adding remaining moved both customers' date to today; the edit form sends that date back
+    client.post('/update/AS002', data=customer_form(userName='Bilal', phone='0311-7654321', numberOfSuit='2',
+                                                    date=today.isoformat(), price='1000'))
+    client.post('/delete/AS001')
+
+    live = rollup_days()
+    assert live == {date(2024, 3, 5): (2, 0, 0, 900), today: (0, 100, 0, 100)}
+    app.test_cli_runner().invoke(args=['backfill-rollups'])
+    assert rollup_days() == live
+
+def test_measurements_are_numbers_and_keep_their_history(client):
+    card = {'lambhai': '40', 'collar': '15 1/2', 'tera': '18 D', 'kaj_count': '5', 'style_collar': 'ban'}
+    client.post('/add_user', data=customer_form(**card))
+    client.post('/update/AS001', data=customer_form(**card))
+    client.post('/update/AS001', data=customer_form(**dict(card, lambhai='41.5')))
+
+    history = client.get('/measurements/AS001').get_json()
+    assert [m['lambhai'] for m in history['measurements']] == [41.5, 40.0]
+    current = history['measurements'][0]
+    assert (current['collar'], current['kaj_count'], current['style_collar']) == (15.5, 5, 'ban')
+    assert current['tera'] is None and current['unparsed'] == {'tera': '18 D'}
+    assert [(o['order_date'], o['suits']) for o in history['orders']] == [('2024-03-01', 2)]
+
+    page = client.get('/print/AS001').get_data(as_text=True)
+    assert '41.5' in page and '15.5' in page and '18 D' in page
+    form = client.get('/update/AS001').get_data(as_text=True)
+    assert 'value="41.5"' in form and 'value="18 D"' in form
+
+def test_update_writes_only_changed_columns(client):
+    client.post('/add_user', data=customer_form(lambhai='40'))
+    page = client.get('/view/AS001')
+    with app.app_context():
+        version = User.query.filter_by(userId='AS001').one().row_version
+
+    # Resubmitting the page unchanged writes nothing and keeps the cached copy
+    client.post('/update/AS001', data=customer_form(lambhai='40'))
+    assert client.get('/view/AS001', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            # The real update page has no balance box: the balance must survive an edit
+            form = customer_form(userName='Zahid', lambhai='40')
+            del form['price']
+            client.post('/update/AS001', data=form)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        customer = User.query.filter_by(userId='AS001').one()
+        assert (customer.userName, customer.price, customer.row_version) == ('Zahid', 1500, version + 1)
+        assert get_ledger_totals().total_pending == 1500
+    writes = [s for s in statements if s.startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 1 and 'SET "userName"=?, row_version=?, updated_at=?' in writes[0]
+
+def test_aging_report_buckets_debtors_from_the_partial_index(client):
+    today = date.today()
+    for name, phone, price, days_ago in (('Ali', '0300-0000001', '500', 0), ('Bilal', '0300-0000002', '2000', 45),
+                                         ('Chan', '0300-0000003', '300', 200), ('Dawood', '0300-0000004', '0', 300)):
+        client.post('/add_user', data=customer_form(userName=name, phone=phone, price=price,
+                                                    date=(today - timedelta(days=days_ago)).isoformat()))
+    with app.app_context():
+        # Bookings entered late: the last activity is the booking date, not when it was typed in
+        buckets, top = aging_report(today, top=2)
+        assert buckets == [('0-30', 1, 500), ('31-90', 1, 2000), ('90+', 1, 300)]
+        assert [(d.userName, d.price, d.days) for d in top] == [('Bilal', 2000, 45), ('Ali', 500, 0)]
+        assert [d.userName for d in iter_debtors(today, bucket='90+')] == ['Chan']
+
+        # Both queries read the debtors off ix_user_debtors, not the whole table
+        bucket = _aging_bucket(today)
+        for query in (db.session.query(bucket, func.sum(User.price)).filter(_owes()).group_by(bucket),
+                      db.session.query(User.userId).filter(_owes()).order_by(User.price.desc()).limit(10)):
+            compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+            assert 'ix_user_debtors' in ' '.join(row[-1] for row in plan)
 
+    page = client.get('/reports/aging').get_data(as_text=True)
+    assert 'Bilal' in page and '2800' in page
+    printed = client.get('/reports/aging/print?bucket=31-90').get_data(as_text=True)
+    assert 'Bilal' in printed and 'Ali' not in printed and 'Total: 1' in printed
+    assert 'Dawood' not in client.get('/reports/aging/print').get_data(as_text=True)
+    assert client.get('/reports/aging/print?bucket=7-14').status_code == 400
 
+def test_edits_do_not_make_an_old_debt_look_new(client):
+    today = date.today()
+    booked = (today - timedelta(days=200)).isoformat()
+    client.post('/add_user', data=customer_form(userName='Chan', phone='0300-0000003', price='300', date=booked))
+    client.post('/add_user', data=customer_form(userName='Bilal', phone='0300-0000002', price='2000', date=booked))
+    form = customer_form(userName='Chan', phone='0300-0000003', date=booked, address='Mardan')
+    del form['price']
+    client.post('/update/AS001', data=form)
+    client.post('/process_transaction', data={'user_id': 'AS002', 'type': 'payment', 'amount': '500'})
+    with app.app_context():
+        assert User.query.filter_by(userId='AS001').one().address == 'Mardan'
+        # The address fix leaves Chan's debt where it was; Bilal's payment is activity
+        assert [(d.userName, d.days) for d in iter_debtors(today)] == [('Bilal', 0), ('Chan', 200)]
@@ -0,0 +1,100 @@
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from app import (app, db, User, LedgerEntry, archive_candidates, archive_customers, compute_ledger_totals,
+                 get_ledger_totals, search_customers)
+from tests.test_app import add_customers, customer_form
+
+CUTOFF = date(2024, 6, 1)
+
+
+def settle(user_id, last_activity):
+    """ Give a customer a paid-off order whose last payment was on `last_activity`. """
+    with app.app_context():
+        customer = User.query.filter_by(userId=user_id).one()
+        customer.price, customer.total_amount, customer.advance_payment = 0, 1000, 1000
+        customer.updated_at = datetime.combine(last_activity, datetime.min.time())
+        db.session.add(LedgerEntry(customer_id=customer.id, entry_type='payment', amount=1000,
+                                   created_at=customer.updated_at))
+        db.session.commit()
+
+def archived_count():
+    with app.app_context():
+        return db.session.execute(text('SELECT count(*) FROM user_archive')).scalar()
+
+
+def test_only_settled_inactive_customers_are_archived_in_batches(client):
+    add_customers(6)                         # booked Jan 2024, 100 pending each
+    for user_id in ('AS001', 'AS002', 'AS003'):
+        settle(user_id, date(2024, 2, 1))
+    settle('AS004', date(2024, 7, 1))        # paid after the cutoff: still active
+
+    with app.app_context():
+        totals_before = compute_ledger_totals()
+        assert {row.userId for row in archive_candidates(CUTOFF)} == {'AS001', 'AS002', 'AS003'}
+        assert archive_customers(CUTOFF, batch_size=2) == 3
+        assert archive_candidates(CUTOFF) == []
+        assert User.query.count() == 3
+        assert LedgerEntry.query.count() == 1
+        # Archiving moves rows; the money still counts
+        assert compute_ledger_totals() == totals_before
+        assert get_ledger_totals().total_received == totals_before['total_received']
+    assert archived_count() == 3
+
+
+def test_archived_customer_comes_back_on_lookup_with_history(client):
+    add_customers(2)
+    settle('AS001', date(2024, 2, 1))
+    with app.app_context():
+        archive_customers(CUTOFF)
+
+    assert client.get('/print/AS001').status_code == 200
+    assert archived_count() == 0
+    statement = client.get('/statement/AS001').get_data(as_text=True)
+    assert statement.count('<td class="type-payment">') == 2
+    assert client.get('/print/AS999').status_code == 404
+
+
+def test_search_by_phone_and_add_user_restore_archived_customers(client):
+    add_customers(2)
+    settle('AS001', date(2024, 2, 1))
+    settle('AS002', date(2024, 2, 1))
+    with app.app_context():
+        archive_customers(CUTOFF)
+        assert [c.userId for c in search_customers('0300-0000001')] == ['AS001']
+    assert archived_count() == 1
+
+    response = client.post('/add_user', data=customer_form(phone='0300-0000002'))
+    assert response.headers['Location'].endswith('/update/AS002')
+    assert archived_count() == 0
+
+
+def test_archive_cli(client):
+    add_customers(3)
+    settle('AS001', date(2024, 2, 1))
+    runner = app.test_cli_runner()
+
+    assert '1 customers would be archived' in runner.invoke(args=['archive', '--before', '2024-06-01',
+                                                                   '--dry-run']).output
+    assert 'Archived 1 customers' in runner.invoke(args=['archive', '--before', '2024-06-01']).output
+    assert 'Restored AS001' in runner.invoke(args=['restore-archived', '0300-0000001']).output
+    assert runner.invoke(args=['restore-archived', 'AS001']).exit_code == 1
+
+def test_archiving_again_after_new_customers_keeps_histories_apart(client):
+    add_customers(2)
+    settle('AS002', date(2024, 2, 1))
+    with app.app_context():
+        archive_customers(CUTOFF)
+        # Before ids were AUTOINCREMENT this customer took over AS002's row id
+        db.session.add(User(userId='AS003', userName='Zahid', phone='0312-1112223', numberOfSuit=1,
+                            address='Kohat', date=date(2024, 1, 5), price=100))
+        db.session.commit()
+    settle('AS003', date(2024, 3, 1))
+    with app.app_context():
+        assert archive_customers(CUTOFF) == 1
+    assert archived_count() == 2
+
+    for user_id in ('AS002', 'AS003'):
+        statement = client.get(f'/statement/{user_id}').get_data(as_text=True)
+        assert statement.count('<td class="type-payment">') == 2
@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import zlib
+
+import assets
+from app import app, asset_manifest
+
+
+def image_data(png):
+    return zlib.decompress(b''.join(body for kind, body in assets._png_chunks(png) if kind == b'IDAT'))
+
+def chunk_kinds(png):
+    return [kind for kind, _ in assets._png_chunks(png)]
+
+
+def test_png_optimizer_keeps_pixels_and_drops_metadata():
+    with open(os.path.join(app.static_folder, 'icon', 'flapPocket.png'), 'rb') as f:
+        original = f.read()
+
+    optimized = assets.optimize_png(original)
+
+    assert len(optimized) < len(original)
+    assert image_data(optimized) == image_data(original)
+    assert b'tEXt' in chunk_kinds(original) and b'tEXt' not in chunk_kinds(optimized)
+
+
+def test_built_assets_are_fingerprinted_inlined_and_cached_forever(client, tmp_path, monkeypatch):
+    static_dir = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static_dir, ignore=shutil.ignore_patterns(assets.DIST_DIR))
+    summary = assets.build(str(static_dir))
+    manifest_path = static_dir / assets.DIST_DIR / assets.MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text())
+
+    assert summary['inlined'] >= 1 and summary['bytes_after'] < summary['bytes_before']
+    assert manifest['icon/samplePocket.png'].startswith('data:image/png;base64,')
+    assert manifest['css/style.css'].startswith('dist/css/style.')
+
+    monkeypatch.setattr(app, 'static_folder', str(static_dir))
+    asset_manifest.load(str(manifest_path))
+    try:
+        page = client.get('/').get_data(as_text=True)
+        assert '/static/' + manifest['logo.png'] in page
+
+        response = client.get('/static/' + manifest['logo.png'])
+        assert response.status_code == 200
+        assert response.cache_control.immutable and response.cache_control.max_age == 365 * 24 * 3600
+        # Differently capitalized names in templates still resolve
+        assert asset_manifest.lookup('icon/KaniBazo.png') == manifest['icon/kaniBazo.png']
+    finally:
+        asset_manifest.load(str(tmp_path / 'missing.json'))
+
+    assert "/static/logo.png" in client.get('/').get_data(as_text=True)
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import backup
+from app import app, db, db_path
+from tests.test_app import add_customers, customer_form
+
+
+def customer_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT count(*) FROM user').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_checksummed_and_verifiable(client, tmp_path):
+    add_customers(5)
+    path = backup.create_snapshot(db_path, tmp_path)
+
+    assert backup.verify_snapshot(path) == []
+    assert customer_count(path) == 5
+    assert not os.path.exists(path + '-wal')
+
+    with open(path, 'r+b') as f:
+        f.seek(-100, os.SEEK_END)
+        f.write(b'\xff' * 10)
+    assert 'checksum mismatch' in backup.verify_snapshot(path)
+
+
+def test_snapshot_runs_while_counters_keep_writing(client, tmp_path):
+    add_customers(200)
+    done = threading.Event()
+    payments = []
+
+    def counter():
+        worker = app.test_client()
+        while not done.is_set():
+            worker.post('/process_transaction', data={'user_id': 'AS001', 'type': 'payment', 'amount': '1'})
+            payments.append(1)
+
+    thread = threading.Thread(target=counter)
+    thread.start()
+    try:
+        path = backup.create_snapshot(db_path, tmp_path, pages=1, pause=0.002)
+    finally:
+        done.set()
+        thread.join()
+
+    assert payments
+    assert backup.verify_snapshot(path) == []
+    assert customer_count(path) == 200
+
+
+def test_rotation_by_count_and_age(tmp_path):
+    now = datetime(2024, 6, 1, 12, 0)
+    for days in (0, 1, 2, 3, 40, 50):
+        name = f"tailor-{(now - timedelta(days=days)).strftime(backup.TIMESTAMP_FORMAT)}.db"
+        (tmp_path / name).write_bytes(b'')
+        (tmp_path / (name + '.sha256')).write_text('x')
+
+    deleted = backup.rotate_snapshots(tmp_path, keep=3, max_age_days=30, now=now)
+
+    kept = backup.list_snapshots(tmp_path)
+    assert [backup.snapshot_time(path) for path in kept] == [now - timedelta(days=d) for d in (0, 1, 2)]
+    assert len(deleted) == 3 and len(os.listdir(tmp_path)) == 6
+
+
+def test_restore_brings_back_deleted_customers(client, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'BACKUP_DIR', str(tmp_path))
+    client.post('/add_user', data=customer_form())
+    runner = app.test_cli_runner()
+    assert 'Snapshot written' in runner.invoke(args=['backup']).output
+    snapshot = backup.list_snapshots(tmp_path)[0]
+
+    client.post('/delete/AS001')
+    assert 'AS001' not in client.get('/user').get_data(as_text=True)
+    # A different customer gets the ID, and this process caches their page and typeahead entry
+    with app.app_context():
+        db.session.execute(db.text("DELETE FROM id_sequence"))
+        db.session.commit()
+    client.post('/add_user', data=customer_form(userName='Bilal', phone='0311-7654321'))
+    page = client.get('/view/AS001')
+    assert 'Bilal' in page.get_data(as_text=True)
+    assert client.get('/autocomplete?q=bil').get_json()
+
+    result = runner.invoke(args=['restore-backup', snapshot, '--yes'])
+    assert 'Restored' in result.output
+    assert 'AS001' in client.get('/user').get_data(as_text=True)
+    # Nothing cached from the replaced data is served
+    again = client.get('/view/AS001', headers={'If-None-Match': page.headers['ETag']})
+    assert again.status_code == 200 and 'Ali' in again.get_data(as_text=True)
+    assert client.get('/autocomplete?q=bil').get_json() == []
+    assert [c['userId'] for c in client.get('/autocomplete?q=ali').get_json()] == ['AS001']
+    assert runner.invoke(args=['verify-backup']).exit_code == 0
+    with app.app_context():
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+
+
+def test_scheduler_takes_a_snapshot_when_none_is_recent(client, tmp_path):
+    logged = []
+    scheduler = backup.BackupScheduler(db_path, tmp_path, interval=3600, log=logged.append).start()
+    try:
+        for _ in range(100):
+            if scheduler.last_snapshot:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        scheduler.stop()
+
+    assert backup.list_snapshots(tmp_path) == [scheduler.last_snapshot]
+    assert logged[0].startswith('💾')
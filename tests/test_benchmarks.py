@@ -0,0 +1,23 @@
+from app import app, db
+from benchmarks.datagen import generate
+from benchmarks.run import ROUTES, Workload, benchmark
+
+
+def test_benchmark_suite_runs_on_generated_data(client):
+    with app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            generate(raw.driver_connection, 200)
+            workload = Workload(raw.driver_connection)
+        finally:
+            raw.close()
+
+    results = benchmark(app, db, workload, repeat=2)
+
+    assert set(results) == set(ROUTES)
+    for name, stats in results.items():
+        assert stats['status'] in (200, 302), name
+        assert stats['p95_ms'] >= stats['p50_ms'] > 0
+        assert stats['peak_kb'] > 0
+    assert results['user_first_page']['queries'] >= 1
+    assert results['home']['queries'] == 0
@@ -0,0 +1,50 @@
+import threading
+
+from app import app, User, LedgerEntry, describe_database_settings, get_ledger_totals
+
+READERS = 6
+WRITERS = 4
+ROUNDS = 25
+
+
+def test_wal_profile_is_active(client):
+    settings = describe_database_settings()
+    assert settings['journal_mode'] == 'wal'
+    assert settings['busy_timeout'] == app.config['SQLITE_PRAGMAS']['busy_timeout']
+
+def test_concurrent_readers_and_writers_finish_without_lock_errors(client):
+    for n in range(WRITERS):
+        client.post('/add_user', data={'userName': f'Counter {n}', 'phone': f'0300-000000{n}', 'numberOfSuit': '1',
+                                       'address': 'Peshawar', 'date': '2024-01-01', 'price': '0'})
+    errors = []
+
+    def read():
+        reader = app.test_client()
+        for _ in range(ROUNDS):
+            for url in ('/ledger', '/user', '/statement/AS001'):
+                response = reader.get(url)
+                if response.status_code != 200:
+                    errors.append((url, response.status_code))
+
+    def write(n):
+        writer = app.test_client()
+        for _ in range(ROUNDS):
+            for kind in ('add_debt', 'payment'):
+                page = writer.post('/process_transaction', data={'user_id': f'AS{n + 1:03d}', 'type': kind,
+                                                                 'amount': '10' if kind == 'add_debt' else '3'})
+                if 'Error processing transaction' in page.get_data(as_text=True):
+                    errors.append(('process_transaction', n))
+
+    threads = [threading.Thread(target=read) for _ in range(READERS)]
+    threads += [threading.Thread(target=write, args=(n,)) for n in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        # Every payment landed exactly once
+        assert LedgerEntry.query.count() == WRITERS * ROUNDS * 2
+        assert {u.price for u in User.query.all()} == {ROUNDS * 7}
+        assert get_ledger_totals().total_pending == WRITERS * ROUNDS * 7
@@ -0,0 +1,31 @@
+import threading
+import urllib.request
+
+from app import app
+from desktop import bind_free_port, start_server, wait_until_serving
+
+
+def test_server_answers_on_a_free_port_once_ready(client):
+    sock = bind_free_port()
+    host, port = sock.getsockname()
+    assert port != 0
+
+    name, ready, shutdown = start_server(app, sock)
+    try:
+        assert ready.wait(5)
+        with urllib.request.urlopen(f'http://{host}:{port}/', timeout=5) as response:
+            assert response.status == 200
+    finally:
+        shutdown()
+        sock.close()
+    assert 'threaded' in name or 'threads' in name
+
+def test_not_ready_while_nothing_serves_the_socket():
+    sock = bind_free_port()
+    ready = threading.Event()
+    try:
+        # Listening but not served: connections queue up and are never answered
+        wait_until_serving(sock, ready, timeout=1.5)
+    finally:
+        sock.close()
+    assert not ready.is_set()
@@ -0,0 +1,38 @@
+from datetime import date
+
+from werkzeug.datastructures import MultiDict
+
+import fields
+
+
+def test_parse_form_reads_and_checks_every_field_in_one_pass():
+    form = MultiDict([('userName', ' Ali '), ('phone', '0300-1234567'), ('numberOfSuit', ''),
+                      ('date', '2024-03-01'), ('price', 'abc'), ('lambhai', '40 1/2'), ('tera', '18 D'),
+                      ('kaj_count', '5'), ('style_pocket', 'flapPocket'), ('style_pocket', 'sidePocket')])
+    values, unparsed, errors = fields.parse_form(form)
+    assert errors == ['Address is required', f"{fields.FIELDS['price'].label} must be a whole number"]
+    assert (values['userName'], values['numberOfSuit'], values['date']) == ('Ali', 1, date(2024, 3, 1))
+    assert (values['lambhai'], values['tera'], values['kaj_count']) == (40.5, None, 5)
+    assert unparsed == {'tera': '18 D'}
+    assert values['style_pocket'] == 'flapPocket, sidePocket'
+    assert values['salai'] is None
+    assert 'address' not in values
+
+    assert fields.parse_form({'phone': '03001234567', 'date': ''})[2] == [
+        'Name is required', 'Phone format must be 03XX-XXXXXXX', 'Address is required', 'Date is required']
+
+def test_partial_parse_leaves_missing_fields_out():
+    values, unparsed, errors = fields.parse_form({'userName': 'Zahid', 'lambhai': '41'}, partial=True)
+    assert (values, unparsed, errors) == ({'userName': 'Zahid', 'lambhai': 41.0}, {}, [])
+    assert fields.pick(values, fields.MEASUREMENTS) == {'lambhai': 41.0}
+
+def test_style_choices_come_from_the_registry():
+    collar = fields.FIELDS['style_collar']
+    assert [choice.value for choice in fields.offered(collar)][:3] == ['collar', 'collarGoll', 'ban']
+    # A new form ticks the preselected choice; a stored value ticks its own
+    assert fields.selected(collar, None) == 'ban'
+    assert fields.selected(collar, 'benGoll') == 'benGoll'
+    assert fields.selected(collar, 'retired') == 'ban'
+    assert fields.selected(fields.FIELDS['style_pocket'], 'flapPocket, sidePocket') == 'flapPocket'
+    # Side pocket's fallback is printed only, never offered
+    assert None not in [choice.value for choice in fields.offered(fields.FIELDS['side_pocket'])]
@@ -0,0 +1,75 @@
+import cProfile
+import os
+import tempfile
+
+from app import app, request_metrics
+from metrics import Metrics
+from tests.test_app import add_customers
+
+
+def test_histogram_exposition_is_cumulative():
+    metrics = Metrics()
+    metrics.histogram('work_seconds', 'Work.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3):
+        metrics.observe('work_seconds', value, job='a')
+
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE work_seconds histogram' in lines
+    assert 'work_seconds_bucket{job="a",le="0.1"} 1' in lines
+    assert 'work_seconds_bucket{job="a",le="1.0"} 3' in lines
+    assert 'work_seconds_bucket{job="a",le="+Inf"} 4' in lines
+    assert 'work_seconds_count{job="a"} 4' in lines
+    assert metrics.rolling()['work_seconds']['job=a'] == {'samples': 4, 'p50': 0.5, 'p95': 3, 'max': 3}
+
+
+def test_requests_are_timed_with_sql_and_template_metrics(client):
+    add_customers(3)
+    request_metrics.reset()
+
+    client.get('/user')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'tailor_request_seconds_count{endpoint="user"} 1' in body
+    assert 'tailor_requests_total{endpoint="user",status="200"} 1' in body
+    assert 'tailor_request_sql_statements_bucket{endpoint="user",le="1"} 1' in body
+    assert 'tailor_template_render_seconds_count{template="user.html"} 1' in body
+    assert 'tailor_page_cache_entries' in body
+    assert '# TYPE tailor_page_cache_hits_total counter' in body
+
+
+def test_slow_queries_are_logged(client, monkeypatch):
+    request_metrics.reset()
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_MS', 0)
+
+    client.get('/ledger')
+    stats = client.get('/stats/requests').get_json()
+
+    assert stats['slow_queries']
+    assert {entry['endpoint'] for entry in stats['slow_queries']} == {'ledger'}
+    assert stats['latency']['tailor_request_seconds']['endpoint=ledger']['samples'] == 1
+
+
+def test_profile_dumps_per_request(client, monkeypatch):
+    profile_dir = tempfile.mkdtemp()
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', profile_dir)
+
+    client.get('/ledger')
+
+    dumps = os.listdir(profile_dir)
+    assert len(dumps) == 1 and '-ledger-' in dumps[0] and dumps[0].endswith('.prof')
+
+def test_profiler_stops_when_the_view_raises(client, monkeypatch):
+    profile_dir = tempfile.mkdtemp()
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', profile_dir)
+    def broken():
+        raise RuntimeError('boom')
+    monkeypatch.setitem(app.view_functions, 'ledger', broken)
+
+    assert client.get('/ledger').status_code == 500
+
+    assert len(os.listdir(profile_dir)) == 1
+    # Nothing is left profiling this thread
+    profiler = cProfile.Profile()
+    profiler.enable()
+    profiler.disable()
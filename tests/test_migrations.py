@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from app import db
+
+
+def legacy_database(path):
+    """ A tailor.db as shipped before the money and Urdu measurement columns. """
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE user (id INTEGER NOT NULL PRIMARY KEY, "userId" VARCHAR(20) NOT NULL UNIQUE, '
+                 '"userName" VARCHAR(100) NOT NULL, phone VARCHAR(20) NOT NULL, "numberOfSuit" INTEGER NOT NULL, '
+                 'address VARCHAR(200) NOT NULL, date DATE NOT NULL, collar VARCHAR(20))')
+    conn.execute("INSERT INTO user VALUES (1, 'AS001', 'Ali', '0300-1234567', 1, 'Peshawar', '2024-01-01', '15')")
+    conn.commit()
+    return conn
+
+def test_dry_run_reports_ddl_without_changing_anything(tmp_path):
+    conn = legacy_database(tmp_path / 'tailor.db')
+    plan = migrations.migrate(conn, db.metadata, dry_run=True)
+
+    statements = [sql for _, _, step in plan for sql in step]
+    assert 'ALTER TABLE user ADD COLUMN lambhai VARCHAR(50)' in statements
+    assert 'CREATE INDEX IF NOT EXISTS ix_user_phone ON user (phone)' in statements
+    assert migrations.schema_version(conn) == 0
+    assert 'lambhai' not in {row[1] for row in conn.execute('PRAGMA table_info(user)')}
+
+def test_migrate_upgrades_legacy_database_once(tmp_path):
+    conn = legacy_database(tmp_path / 'tailor.db')
+    migrations.migrate(conn, db.metadata)
+
+    assert migrations.schema_version(conn) == migrations.LATEST_VERSION
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(user)')}
+    assert columns == set(migrations.CUSTOMER_COLUMNS + migrations.LATER_CUSTOMER_COLUMNS)
+    assert conn.execute('SELECT customer_id, collar FROM measurement_set').fetchall() == [(1, 15.0)]
+    indexes = {row[1] for row in conn.execute('PRAGMA index_list(user)')}
+    assert {'ix_user_date_id', 'ix_user_phone', 'ix_user_userName', 'ix_user_debtors'} <= indexes
+    # Debtors are aged from the booking date
+    assert conn.execute('SELECT last_activity FROM user').fetchall() == [('2024-01-01',)]
+    assert conn.execute("SELECT rowid FROM user_fts WHERE user_fts MATCH '4567*'").fetchall() == [(1,)]
+
+    # Current schema: nothing left to do
+    assert migrations.migrate(conn, db.metadata) == []
+
+def test_split_converts_live_and_archived_rows(tmp_path):
+    conn = legacy_database(tmp_path / 'tailor.db')
+    conn.execute("INSERT INTO user VALUES (2, 'AS002', 'Bilal', '0311-7654321', 3, 'Mardan', '2024-02-01', '18 D')")
+    conn.execute("INSERT INTO user VALUES (3, 'AS003', 'Zahid', '0312-1112223', 2, 'Kohat', '2024-02-02', '2 3/4')")
+    # Archived before the split, so still wide
+    conn.execute('CREATE TABLE user_archive AS SELECT * FROM user WHERE 0')
+    conn.execute("INSERT INTO user_archive VALUES (9, 'AS009', 'Old', '0300-0000009', 1, 'Bannu', '2023-01-01', '15,5')")
+    conn.commit()
+    migrations.migrate(conn, db.metadata)
+
+    assert conn.execute('SELECT customer_id, collar, unparsed FROM measurement_set ORDER BY id').fetchall() == [
+        (1, 15.0, None), (2, None, '{"collar": "18 D"}'), (3, 2.75, None)]
+    assert conn.execute('SELECT customer_id, order_date, suits FROM customer_order ORDER BY id').fetchall() == [
+        (1, '2024-01-01', 1), (2, '2024-02-01', 3), (3, '2024-02-02', 2)]
+    assert conn.execute('SELECT customer_id, collar FROM measurement_set_archive').fetchall() == [(9, 15.5)]
+    archive_columns = {row[1] for row in conn.execute('PRAGMA table_info(user_archive)')}
+    assert archive_columns == set(migrations.CUSTOMER_COLUMNS) | {'archived_at'}
+    # The rebuilt user table still feeds the search index
+    conn.execute("UPDATE user SET \"userName\" = 'Bilal Khan' WHERE id = 2")
+    assert conn.execute("SELECT rowid FROM user_fts WHERE user_fts MATCH 'khan'").fetchall() == [(2,)]
+
+def test_reused_customer_ids_are_fixed_and_never_handed_out_again(tmp_path, monkeypatch):
+    conn = legacy_database(tmp_path / 'tailor.db')
+    # Migrated by a release from before ids were AUTOINCREMENT
+    monkeypatch.setattr(migrations, 'CUSTOMER_TABLE_DDL', migrations.CUSTOMER_TABLE_DDL.replace(' AUTOINCREMENT', ''))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:11])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', 11)
+    migrations.migrate(conn, db.metadata)
+    # AS001 was archived, then the next new customer got its id
+    conn.execute("INSERT INTO user_archive SELECT *, '2024-06-01' FROM user WHERE id = 1")
+    conn.execute("INSERT INTO ledger_entry_archive (id, customer_id, entry_type, amount, created_at) "
+                 "VALUES (1, 1, 'payment', 500, '2024-02-01 10:00:00')")
+    conn.execute('DELETE FROM user')
+    conn.execute("INSERT INTO user (\"userId\", \"userName\", phone, \"numberOfSuit\", address, date) "
+                 "VALUES ('AS002', 'Bilal', '0311-7654321', 1, 'Mardan', '2024-07-01')")
+    assert conn.execute('SELECT id FROM user').fetchall() == [(1,)]
+    conn.commit()
+    monkeypatch.undo()
+
+    migrations.migrate(conn, db.metadata)
+    assert conn.execute('SELECT "userId", id FROM user_archive').fetchall() == [('AS001', 2)]
+    assert conn.execute('SELECT customer_id FROM ledger_entry_archive').fetchall() == [(2,)]
+    conn.execute("INSERT INTO user (\"userId\", \"userName\", phone, \"numberOfSuit\", address, date) "
+                 "VALUES ('AS003', 'Zahid', '0312-1112223', 1, 'Kohat', '2024-07-02')")
+    assert conn.execute('SELECT "userId", id FROM user ORDER BY id').fetchall() == [('AS002', 1), ('AS003', 3)]
+    # The rebuilt table kept its indexes and triggers
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert {'user_fts_ai', 'sync_user_ai', 'sync_user_au', 'sync_user_ad', 'sync_ledger_entry_ai'} <= triggers
+    assert 'ix_user_debtors' in {row[1] for row in conn.execute('PRAGMA index_list(user)')}
+
+def test_parse_measurement_reads_the_card_notation():
+    assert [migrations.parse_measurement(v) for v in ('15', ' 15.5 ', '15,5', '2 3/4', '3/4', '')] == [
+        15.0, 15.5, 15.5, 2.75, 0.75, None]
+    assert migrations.parse_measurement('4', whole=True) == 4
+    for value in ('18 D', '22.,2', '1/0', 'nan', '-3'):
+        with pytest.raises(ValueError):
+            migrations.parse_measurement(value)
+    with pytest.raises(ValueError):
+        migrations.parse_measurement('4.5', whole=True)
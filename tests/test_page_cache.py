@@ -0,0 +1,15 @@
+from page_cache import PageCache
+
+
+def test_least_recently_used_page_is_evicted_and_versions_must_match():
+    cache = PageCache(max_entries=2)
+    cache.put(('view', 'AS001'), 1, 'one')
+    cache.put(('view', 'AS002'), 1, 'two')
+    assert cache.get(('view', 'AS001'), 1) == 'one'   # AS002 is now least recent
+    cache.put(('print', 'AS001'), 1, 'three')
+
+    assert cache.get(('view', 'AS002'), 1) is None
+    assert cache.get(('view', 'AS001'), 2) is None     # row changed since render
+    cache.invalidate('AS001')
+    assert cache.stats() == {'entries': 0, 'max_entries': 2, 'hits': 1, 'misses': 2,
+                             'evictions': 1, 'hit_ratio': 0.333}
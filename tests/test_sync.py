@@ -0,0 +1,324 @@
+import os
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import text
+
+import migrations
+import sync
+from app import app, db, db_path, compute_ledger_totals, get_ledger_totals
+from tests.test_app import add_customers, customer_form
+
+CUSTOMER = ('SELECT "userId", "userName", phone, address, "numberOfSuit", date, price, total_amount, '
+            'advance_payment FROM user ORDER BY "userId"')
+# Each customer's latest order and measurements
+ORDER = ('SELECT "userId", order_date, suits, special_notes FROM customer_order JOIN user ON user.id = customer_id '
+         'WHERE customer_order.id IN (SELECT max(id) FROM customer_order GROUP BY customer_id) ORDER BY "userId"')
+MEASUREMENTS = ('SELECT "userId", taken_at, lambhai, chati FROM measurement_set JOIN user ON user.id = customer_id '
+                'WHERE measurement_set.id IN (SELECT max(id) FROM measurement_set GROUP BY customer_id) '
+                'ORDER BY "userId"')
+
+
+class Shop(sqlite3.Connection):
+    prefix = None
+
+def shop(path, prefix):
+    """ A shop's tailor.db, at the latest schema, numbering its customers `prefix`... """
+    conn = sqlite3.connect(path, factory=Shop)
+    conn.prefix = prefix
+    migrations.migrate(conn, db.metadata)
+    return conn
+
+def rollup(conn, day, suits=0, billed=0, received=0, pending=0):
+    """ What the app does alongside every booking or transaction. """
+    conn.execute(migrations.DAILY_ROLLUP_ADJUST, {'day': day, 'suits': suits, 'billed': billed,
+                                                  'received': received, 'pending': pending})
+
+def add_customer(conn, user_id, name, phone, amount):
+    rollup(conn, '2024-03-01', suits=1, billed=amount, pending=amount)
+    customer_id = conn.execute(
+        'INSERT INTO user ("userId", "userName", phone, address, "numberOfSuit", date, price, '
+        'total_amount, advance_payment, row_version) VALUES (?, ?, ?, ?, 1, ?, ?, ?, 0, 1)',
+        (user_id, name, phone, 'Peshawar', '2024-03-01', amount, amount)).lastrowid
+    conn.execute('INSERT INTO customer_order (customer_id, order_date, suits, created_at) '
+                 "VALUES (?, '2024-03-01', 1, '2024-03-01 09:00:00.000000')", (customer_id,))
+    conn.execute('INSERT INTO measurement_set (customer_id, taken_at, lambhai, chati) '
+                 "VALUES (?, '2024-03-01 09:00:00.000000', 40, 38)", (customer_id,))
+    conn.commit()
+
+def take_payment(conn, user_id, amount):
+    rollup(conn, '2024-03-02', received=amount, pending=-amount)
+    conn.execute('UPDATE user SET price = price - ?, advance_payment = advance_payment + ? WHERE "userId" = ?',
+                 (amount, amount, user_id))
+    conn.execute('INSERT INTO ledger_entry (customer_id, entry_type, amount, created_at) '
+                 "SELECT id, 'payment', ?, '2024-03-02 10:00:00.000000' FROM user WHERE \"userId\" = ?",
+                 (amount, user_id))
+    conn.commit()
+
+def export(source, target, tmp_path):
+    return sync.export_bundle(source, str(tmp_path), sync.site_id(target), source.prefix)
+
+def send(source, target, tmp_path):
+    path, _ = export(source, target, tmp_path)
+    return sync.apply_bundle(target, path, target.prefix)
+
+def daily_rollup(conn):
+    return conn.execute('SELECT * FROM daily_rollup WHERE suits_booked OR billed OR received OR pending '
+                        'ORDER BY day').fetchall()
+
+def assert_same(a, b):
+    for query in (CUSTOMER, ORDER, MEASUREMENTS):
+        assert a.execute(query).fetchall() == b.execute(query).fetchall()
+    for conn in (a, b):
+        # The rollup kept in step while syncing is the one rebuilt from scratch
+        kept = daily_rollup(conn)
+        for sql in migrations.DAILY_ROLLUP_BACKFILL:
+            conn.execute(sql)
+        assert kept == daily_rollup(conn)
+        conn.commit()
+
+
+def test_two_shops_converge(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    usb = tmp_path / 'usb'
+    usb.mkdir()
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    add_customer(b, 'BS001', 'Bilal', '0311-7654321', 800)
+    send(a, b, usb)
+    send(b, a, usb)
+    assert [row[0] for row in a.execute(CUSTOMER)] == ['AS001', 'BS001']
+    assert_same(a, b)
+
+    # Both shops edit and take money from the same customer before the next sync
+    a.execute("UPDATE user SET \"userName\" = 'Ali Khan' WHERE \"userId\" = 'AS001'")
+    a.commit()
+    take_payment(a, 'AS001', 300)
+    time.sleep(0.01)
+    b.execute("UPDATE user SET address = 'Mardan', \"userName\" = 'Ali K' WHERE \"userId\" = 'AS001'")
+    b.commit()
+    take_payment(b, 'AS001', 200)
+    # Only what changed since the last sync: the rename, the payment and its journal entry
+    path_a, sent = export(a, b, usb)
+    assert sent == 3
+    sync.apply_bundle(b, path_a, b.prefix)
+    send(b, a, usb)
+    assert_same(a, b)
+    ali = a.execute("SELECT \"userName\", address, price, advance_payment FROM user WHERE \"userId\" = 'AS001'")
+    # B renamed last, so A's rename loses; both payments count
+    assert ali.fetchone() == ('Ali K', 'Mardan', 500, 500)
+    assert a.execute('SELECT count(*) FROM ledger_entry').fetchone() == (2,)
+
+    # Applying a bundle again changes nothing
+    again = sync.apply_bundle(b, path_a, b.prefix)
+    assert again['applied'] == 0 and again['skipped'] == 3
+    assert_same(a, b)
+    # B has acknowledged everything from A, and B's own changes are not sent back to it
+    assert export(a, b, usb)[1] == 0
+
+def test_delete_wins_over_concurrent_changes(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    send(a, b, tmp_path)
+    take_payment(b, 'AS001', 400)
+    a.execute("DELETE FROM user WHERE \"userId\" = 'AS001'")
+    a.commit()
+    send(a, b, tmp_path)
+    send(b, a, tmp_path)
+    assert a.execute(CUSTOMER).fetchall() == b.execute(CUSTOMER).fetchall() == []
+    assert b.execute('SELECT count(*) FROM ledger_entry').fetchone() == (0,)
+
+def test_orders_and_measurements_travel(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    send(a, b, tmp_path)
+    assert_same(a, b)
+
+    # A moves the order to another day and takes new measurements; B edits the notes
+    rollup(a, '2024-03-01', suits=-1, billed=-1000, pending=-1000)
+    rollup(a, '2024-03-05', suits=1, billed=1000, pending=1000)
+    a.execute("UPDATE customer_order SET order_date = '2024-03-05'")
+    a.execute('INSERT INTO measurement_set (customer_id, taken_at, lambhai, chati) '
+              "SELECT id, '2024-03-05 09:00:00.000000', 41, 39 FROM user")
+    a.commit()
+    time.sleep(0.01)
+    b.execute("UPDATE customer_order SET special_notes = 'Two pockets'")
+    b.commit()
+    send(a, b, tmp_path)
+    send(b, a, tmp_path)
+    assert_same(a, b)
+    assert a.execute(ORDER).fetchone() == ('AS001', '2024-03-05', 1, 'Two pockets')
+    assert a.execute(MEASUREMENTS).fetchone()[2:] == (41, 39)
+    # The booking moved with the order
+    assert b.execute("SELECT suits_booked FROM daily_rollup WHERE day = '2024-03-05'").fetchone() == (1,)
+
+def test_new_customer_under_a_taken_id_is_held_then_resolved(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    time.sleep(0.01)
+    # Typed in at B by hand under an ID that is A's to give out
+    add_customer(b, 'AS001', 'Bilal', '0311-7654321', 800)
+    summary = send(a, b, tmp_path)
+    assert summary['held'] == 3 and summary['conflicts'] == {'AS001'}
+    take_payment(a, 'AS001', 300)
+    summary = send(a, b, tmp_path)
+    # Later changes to that ID wait with the first one rather than landing on Bilal
+    assert summary['applied'] == 0 and summary['held'] == 2
+    assert b.execute(CUSTOMER).fetchone()[:2] == ('AS001', 'Bilal')
+    assert b.execute('SELECT price FROM user').fetchone() == (800,)
+    assert sync.status(b)['conflicts'] == [('AS001', sync.site_id(a), 5)]
+
+    path, _ = export(a, b, tmp_path)
+    assert sync.apply_bundle(b, path, b.prefix)['held'] == 0
+
+    # Bilal's changes are held at A likewise
+    assert send(b, a, tmp_path)['held'] == 3
+    # Ali was logged first, so both shops give Ali the ID
+    assert not sync.renumbers_local(a, 'AS001')
+    assert sync.resolve(a, 'AS001') == {'kept': True, 'renumbered': None, 'applied': 0, 'dropped': 3,
+                                        'waiting': 0}
+    assert sync.renumbers_local(b, 'AS001')
+    with pytest.raises(ValueError, match='new ID'):
+        sync.resolve(b, 'AS001')
+    outcome = sync.resolve(b, 'AS001', 'BS001')
+    assert outcome['renumbered'] == 'BS001' and outcome['applied'] == 5
+    # Bilal goes to A again as BS001; the changes still sent for him as AS001 are dropped there
+    summary = send(b, a, tmp_path)
+    assert summary['held'] == 0 and summary['dropped'] == 3
+    send(a, b, tmp_path)
+    assert [row[:2] for row in a.execute(CUSTOMER)] == [('AS001', 'Ali'), ('BS001', 'Bilal')]
+    assert a.execute('SELECT price FROM user').fetchall() == [(700,), (800,)]
+    assert_same(a, b)
+    assert sync.status(a)['conflicts'] == sync.status(b)['conflicts'] == []
+
+def test_changes_wait_for_a_customer_not_here_yet(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    export(a, b, tmp_path)
+    # As if B had acknowledged the customer without ever applying them
+    a.execute('UPDATE sync_peer SET acked_seq = last_seq')
+    a.commit()
+    take_payment(a, 'AS001', 300)
+    summary = send(a, b, tmp_path)
+    assert summary['applied'] == 0 and summary['held'] == 2
+    assert b.execute('SELECT count(*) FROM sync_log').fetchone() == (0,)
+
+    # The held payment is applied once the customer arrives
+    path, _ = sync.export_bundle(a, str(tmp_path), sync.site_id(b), a.prefix, full=True)
+    summary = sync.apply_bundle(b, path, b.prefix)
+    assert summary['applied'] == 5 and summary['held'] == 0
+    assert b.execute('SELECT price, advance_payment FROM user').fetchone() == (700, 300)
+    assert_same(a, b)
+
+def test_customers_from_before_the_log_are_sent(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    # Added before the sync log existed, then paid into once it did
+    a.execute(sync.PAUSE_CAPTURE)
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    a.execute(sync.RESUME_CAPTURE)
+    a.commit()
+    take_payment(a, 'AS001', 300)
+    # The customer as they are now, with their order and measurements; the payment is in it
+    path, sent = export(a, b, tmp_path)
+    assert sent == 3
+    sync.apply_bundle(b, path, b.prefix)
+    assert b.execute(CUSTOMER).fetchall() == a.execute(CUSTOMER).fetchall()
+    assert_same(a, b)
+
+def test_lost_bundle_is_sent_again(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    lost, _ = export(a, b, tmp_path)
+    os.remove(lost)
+    # Not acknowledged by B yet, so the next bundle carries it again
+    path, sent = export(a, b, tmp_path)
+    assert sent == 3
+    sync.apply_bundle(b, path, b.prefix)
+    assert export(a, b, tmp_path)[1] == 3
+    # B's next bundle tells A what it has
+    send(b, a, tmp_path)
+    assert export(a, b, tmp_path)[1] == 0
+    assert_same(a, b)
+
+def test_damaged_or_own_bundles_are_refused(tmp_path):
+    a, b = shop(tmp_path / 'a.db', 'AS'), shop(tmp_path / 'b.db', 'BS')
+    add_customer(a, 'AS001', 'Ali', '0300-1234567', 1000)
+    path, _ = export(a, b, tmp_path)
+    with pytest.raises(ValueError, match='this shop'):
+        sync.apply_bundle(a, path, a.prefix)
+    # Two shops numbering customers alike would mix up different customers
+    with pytest.raises(ValueError, match='own ID prefix'):
+        sync.apply_bundle(shop(tmp_path / 'c.db', 'AS'), path, 'AS')
+
+    with open(path, encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines[:-1])
+    with pytest.raises(ValueError, match='damaged'):
+        sync.apply_bundle(b, path, b.prefix)
+    assert b.execute('SELECT count(*) FROM user').fetchone() == (0,)
+
+def test_sync_cli_between_the_app_and_another_shop(client, tmp_path):
+    add_customers(1)
+    other = shop(tmp_path / 'other.db', 'BS')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['sync-export', str(tmp_path), '--to', sync.site_id(other)])
+    assert '1 changes written' in result.output
+    sync.apply_bundle(other, sync.list_bundles(str(tmp_path))[0], other.prefix)
+    assert [row[0] for row in other.execute(CUSTOMER)] == ['AS001']
+
+    take_payment(other, 'AS001', 400)
+    add_customer(other, 'BS001', 'Bilal', '0311-7654321', 800)
+    with app.app_context():
+        site = db.session.execute(text('SELECT site_id FROM sync_site')).scalar()
+    sync.export_bundle(other, str(tmp_path), site, other.prefix)
+    # The payment, its journal entry and Bilal with his order and measurements; the folder
+    # also holds this shop's own bundle, which is passed over
+    result = runner.invoke(args=['sync-import', str(tmp_path)])
+    assert result.exit_code == 0 and '5 changes applied' in result.output
+    assert '0 changes applied, 5 already here' in runner.invoke(args=['sync-import', str(tmp_path)]).output
+
+    response = client.get('/view/AS001')
+    assert response.status_code == 200
+    with app.app_context():
+        assert {row[0]: row[1:] for row in db.session.execute(text(CUSTOMER))}['AS001'] == \
+            other.execute(CUSTOMER).fetchone()[1:]
+        totals = get_ledger_totals()
+        assert compute_ledger_totals() == {'total_receivable': totals.total_receivable,
+                                           'total_received': totals.total_received,
+                                           'total_pending': totals.total_pending}
+    assert 'received from' in runner.invoke(args=['sync-status']).output
+
+def test_app_writes_travel_and_refresh_cached_pages(client, tmp_path):
+    client.post('/add_user', data=customer_form())
+    client.post('/process_transaction', data={'user_id': 'AS001', 'type': 'payment', 'amount': '500'})
+    other = shop(tmp_path / 'other.db', 'BS')
+    runner = app.test_cli_runner()
+    runner.invoke(args=['sync-export', str(tmp_path), '--to', sync.site_id(other)])
+    sync.apply_bundle(other, sync.list_bundles(str(tmp_path))[0], other.prefix)
+    here = sqlite3.connect(db_path)
+    assert_same(here, other)
+    assert other.execute('SELECT entry_type, amount FROM ledger_entry').fetchall() == [('payment', 500)]
+
+    page = client.get('/view/AS001')
+    other.execute("UPDATE customer_order SET special_notes = 'Two pockets'")
+    other.commit()
+    sync.export_bundle(other, str(tmp_path), sync.site_id(here), other.prefix)
+    assert '1 changes applied' in runner.invoke(args=['sync-import', str(tmp_path)]).output
+    # The page this process cached, and the browser's copy, are out of date
+    again = client.get('/view/AS001', headers={'If-None-Match': page.headers['ETag']})
+    assert again.status_code == 200 and 'Two pockets' in again.get_data(as_text=True)
+    assert_same(here, other)
+
+def test_sync_resolve_cli(client, tmp_path):
+    client.post('/add_user', data=customer_form())
+    time.sleep(0.01)
+    other = shop(tmp_path / 'other.db', 'BS')
+    add_customer(other, 'AS001', 'Bilal', '0311-7654321', 800)
+    here = sqlite3.connect(db_path)
+    sync.export_bundle(other, str(tmp_path), sync.site_id(here), other.prefix)
+    runner = app.test_cli_runner()
+    assert 'Changes to AS001 are held' in runner.invoke(args=['sync-import', str(tmp_path)]).output
+    assert 'AS001 stays with the customer here; 3 changes' in runner.invoke(args=['sync-resolve']).output
+    assert 'No held changes' in runner.invoke(args=['sync-resolve']).output
+    assert here.execute('SELECT "userName" FROM user').fetchall() == [('Ali',)]
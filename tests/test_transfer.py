@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+from app import (app, db, User, LedgerEntry, CustomerOrder, MeasurementSet, compute_ledger_totals,
+                 get_ledger_totals)
+
+
+def customer_row(n, **overrides):
+    row = {'userName': f'Customer {n}', 'phone': f'0300-{n:07d}', 'numberOfSuit': '2',
+           'address': 'Peshawar', 'date': '2024-02-01', 'price': '500', 'lambhai': '40'}
+    row.update(overrides)
+    return row
+
+def as_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def test_import_batches_rows_and_reports_bad_ones(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRANSFER_BATCH_SIZE', 4)
+    rows = [customer_row(n) for n in range(1, 11)]
+    rows[2]['phone'] = '03001234'                   # bad format
+    rows[5]['phone'] = rows[4]['phone']             # duplicate inside the file
+    rows[7]['date'] = 'yesterday'                   # bad date
+
+    response = client.post('/import', data={'file': (io.BytesIO(as_csv(rows).encode()), 'customers.csv')})
+    report = response.get_json()
+
+    assert report['imported'] == 7
+    assert [error['line'] for error in report['errors']] == [4, 7, 9]
+    with app.app_context():
+        assert User.query.count() == 7
+        customer = User.query.filter_by(phone='0300-0000001').one()
+        assert MeasurementSet.query.filter_by(customer_id=customer.id).one().lambhai == 40.0
+        assert get_ledger_totals().total_pending == compute_ledger_totals()['total_pending'] == 3500
+        # Imported customers took IDs from the sequence
+        assert sorted(u.userId for u in User.query.all()) == [f"AS{n:03d}" for n in range(1, 8)]
+
+def test_import_skips_existing_phones_and_keeps_given_ids(client):
+    client.post('/import', data={'file': (io.BytesIO(as_csv([customer_row(1)]).encode()), 'first.csv')})
+    lines = [json.dumps(customer_row(1)), 'not json', json.dumps(customer_row(2, userId='AS500'))]
+    report = client.post('/import', data={'file': (io.BytesIO("\n".join(lines).encode()), 'more.jsonl')}).get_json()
+
+    assert report['imported'] == 1
+    assert [error['line'] for error in report['errors']] == [1, 2]
+    # The next customer continues after the imported ID
+    client.post('/add_user', data=customer_row(3))
+    with app.app_context():
+        assert User.query.filter_by(phone='0300-0000003').one().userId == 'AS501'
+
+def test_import_jsonl_reads_numbers_and_rejects_nested_values(client):
+    lines = [json.dumps(customer_row(1, phone=3001234567)),
+             json.dumps(customer_row(2, price=700, numberOfSuit=3, lambhai=41.5)),
+             json.dumps(customer_row(3, userName=['Ali', 'Khan'])),
+             # add_user refuses an order of no suits, so import does too
+             json.dumps(customer_row(4, numberOfSuit=0))]
+    response = client.post('/import', data={'file': (io.BytesIO("\n".join(lines).encode()), 'typed.jsonl')})
+    report = response.get_json()
+
+    assert response.status_code == 200 and report['imported'] == 1
+    assert [(error['line'], error['error']) for error in report['errors']] == [
+        (1, 'Phone format must be 03XX-XXXXXXX'), (3, 'userName must be a single value'),
+        (4, 'Number of suits must be at least 1')]
+    with app.app_context():
+        customer = User.query.filter_by(phone='0300-0000002').one()
+        assert (customer.price, customer.numberOfSuit) == (700, 3)
+        assert MeasurementSet.query.filter_by(customer_id=customer.id).one().lambhai == 41.5
+
+def test_export_streams_customers_and_ledger(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRANSFER_BATCH_SIZE', 2)
+    client.post('/import', data={'file': (io.BytesIO(as_csv([customer_row(n) for n in range(1, 6)]).encode()), 'c.csv')})
+    client.post('/process_transaction', data={'user_id': 'AS002', 'type': 'payment', 'amount': '200'})
+
+    response = client.get('/export/customers.csv')
+    assert response.is_streamed
+    exported = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['userId'] for row in exported] == ['AS001', 'AS002', 'AS003', 'AS004', 'AS005']
+    assert exported[1]['price'] == '300' and exported[1]['date'] == '2024-02-01'
+
+    entries = [json.loads(line) for line in client.get('/export/ledger.jsonl').get_data(as_text=True).splitlines()]
+    assert [(e['userId'], e['entry_type'], e['amount']) for e in entries] == [('AS002', 'payment', 200)]
+
+    # Round trip: the export imports cleanly into an empty shop
+    with app.app_context():
+        for model in (LedgerEntry, CustomerOrder, MeasurementSet, User):
+            model.query.delete()
+        db.session.commit()
+    report = client.post('/import', data={'file': (io.BytesIO(response.get_data()), 'back.csv')}).get_json()
+    assert report == {'imported': 5, 'errors': []}
@@ -0,0 +1,51 @@
+import typeahead
+from typeahead import PrefixIndex
+
+
+def make_index():
+    index = PrefixIndex()
+    index.build([(1, 'AS001', 'Imran Khan', '0300-1234567'),
+                 (2, 'AS002', 'Bilal Afridi', '0312-7654321'),
+                 (3, 'AS003', 'عمران خان', '0345-1112223')])
+    return index
+
+
+def test_matches_name_words_phone_digits_and_id():
+    index = make_index()
+
+    assert index.search('imr') == [1]
+    assert index.search('KHAN') == [1]
+    assert index.search('imran k') == [1]
+    assert index.search('0312-76') == [2]
+    assert index.search('1234') == [1]
+    assert index.search('as00', limit=2) == [1, 2]
+    assert index.search('عمر') == [3]
+    assert index.search('zzz') == [] and index.search('  ') == []
+
+
+def test_incremental_add_update_and_remove():
+    index = make_index()
+
+    index.add(4, 'AS004', 'Zahid Shah', '0333-9998887')
+    index.add(1, 'AS001', 'Imran Yousafzai', '0300-1234567')
+    index.remove(2)
+
+    assert index.search('zah') == [4]
+    assert index.search('khan') == []
+    assert index.search('yous') == [1]
+    assert index.search('bilal') == [] and index.search('0312') == []
+    assert index.search('as00') == [1, 3, 4]
+
+
+def test_changes_are_packed_without_losing_any(monkeypatch):
+    monkeypatch.setattr(typeahead, 'PACK_AFTER', 3)
+    index = make_index()
+    for n in range(4, 10):
+        index.add(n, f'AS00{n}', f'Customer {n}', f'0300-000000{n}')
+    index.add(1, 'AS001', 'Imran Yousafzai', '0300-1234567')
+
+    assert index.search('as00', limit=20) == list(range(1, 10))
+    assert index.search('customer', limit=20) == list(range(4, 10))
+    assert index.search('khan') == [] and index.search('yous') == [1]
+    # A few bytes per key, no object per entry
+    assert index.nbytes() < 9 * 6 * 30
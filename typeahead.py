@@ -0,0 +1,140 @@
+""" In-memory prefix index for the customer search box.
+
+Each customer contributes a handful of keys - the full name, each later
+word of the name, the phone digits (whole and the last seven alone) and the
+customer ID - all casefolded. Every key becomes one entry "key\\x00<row id>"
+in UTF-8, and the entries are packed back to back, sorted, in one bytes
+object with an array of their start offsets beside it: a few bytes per key
+and no Python object per entry. A lookup is a bisect over the offsets plus a
+short forward scan, and returns row ids; the caller reads the few matching
+rows from the database.
+
+Changes made after the index was built are kept aside (new entries in a
+small sorted list, replaced or removed row ids in a set) and merged into the
+packed entries once they outgrow PACK_AFTER or a sixty-fourth of the packed
+entries, so each merge of the whole index is paid for by that many changes.
+Safe to share between request threads.
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from itertools import accumulate
+
+SEPARATOR = b'\x00'
+# Changes kept aside before they are merged into the packed entries, at least
+PACK_AFTER = 256
+
+
+def normalize(text):
+    return ' '.join(str(text or '').casefold().split())
+
+def index_keys(user_id, name, phone):
+    name = normalize(name)
+    digits = ''.join(ch for ch in str(phone or '') if ch.isdigit())
+    keys = {name, normalize(user_id)}
+    keys.update(name.split()[1:])
+    if digits:
+        keys.update((digits, digits[-7:]))
+    keys.discard('')
+    return keys
+
+def _entries(row_id, user_id, name, phone):
+    suffix = SEPARATOR + str(row_id).encode()
+    return [key.encode() + suffix for key in index_keys(user_id, name, phone)]
+
+def _row_id(entry):
+    return int(entry.rpartition(SEPARATOR)[2])
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._packed = b''
+        self._offsets = array('I', [0])   # start of each packed entry, then the end
+        self._added = []                  # sorted entries not packed yet
+        self._stale = set()               # row ids whose packed entries no longer count
+        self._lock = threading.Lock()
+        self.built = False
+        # How far into the database's change log the index is; kept by the caller
+        self.seq = 0
+
+    def build(self, rows, seq=0):
+        """ Replace the index with (row id, userId, userName, phone) rows. """
+        entries = sorted(entry for row in rows for entry in _entries(*row))
+        with self._lock:
+            self._pack(entries)
+            self.built = True
+            self.seq = seq
+
+    def reset(self):
+        """ Forget everything; the next lookup builds the index again. """
+        with self._lock:
+            self._pack([])
+            self.built = False
+            self.seq = 0
+
+    def add(self, row_id, user_id, name, phone):
+        with self._lock:
+            self._remove(row_id)
+            for entry in _entries(row_id, user_id, name, phone):
+                insort(self._added, entry)
+            pending = len(self._added) + len(self._stale)
+            if pending > max(PACK_AFTER, len(self._offsets) // 64):
+                self._pack(list(merge(self._packed_from(b''), self._added)))
+
+    def remove(self, row_id):
+        with self._lock:
+            self._remove(row_id)
+
+    def _remove(self, row_id):
+        self._stale.add(row_id)
+        suffix = SEPARATOR + str(row_id).encode()
+        self._added = [entry for entry in self._added if not entry.endswith(suffix)]
+
+    def _pack(self, entries):
+        self._packed = b''.join(entries)
+        self._offsets = array('I', accumulate(map(len, entries), initial=0))
+        self._added, self._stale = [], set()
+
+    def _entry(self, position):
+        return self._packed[self._offsets[position]:self._offsets[position + 1]]
+
+    def _packed_from(self, prefix):
+        count = len(self._offsets) - 1
+        position = bisect_left(range(count), prefix, key=self._entry)
+        while position < count:
+            entry = self._entry(position)
+            if not entry.startswith(prefix):
+                return
+            if _row_id(entry) not in self._stale:
+                yield entry
+            position += 1
+
+    def _added_from(self, prefix):
+        for entry in self._added[bisect_left(self._added, prefix):]:
+            if not entry.startswith(prefix):
+                return
+            yield entry
+
+    def search(self, query, limit=10):
+        """ Row ids of customers whose name, phone or ID starts with `query`, in key order. """
+        prefix = normalize(query)
+        if not any(ch.isalpha() for ch in prefix):
+            # A phone number typed with dashes or spaces
+            prefix = ''.join(ch for ch in prefix if ch.isdigit())
+        if not prefix:
+            return []
+        prefix = prefix.encode()
+        matches = []
+        with self._lock:
+            for entry in merge(self._packed_from(prefix), self._added_from(prefix)):
+                row_id = _row_id(entry)
+                if row_id not in matches:
+                    matches.append(row_id)
+                    if len(matches) == limit:
+                        break
+        return matches
+
+    def nbytes(self):
+        """ Memory held by the packed entries and their offsets. """
+        return len(self._packed) + self._offsets.itemsize * len(self._offsets)